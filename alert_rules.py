@@ -0,0 +1,322 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from microstructure import METRIC_FIELDS
+from notifications import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL
+
+RULE_TYPES = ('wall', 'cancellation', 'crossing')
+PRIORITIES = {'high': PRIORITY_HIGH, 'normal': PRIORITY_NORMAL, 'low': PRIORITY_LOW}
+DEFAULT_PRIORITIES = {'wall': 'normal', 'cancellation': 'high', 'crossing': 'normal'}
+NUMERIC_FIELDS = {
+    'wall': {'min_amount': 0.0, 'multiple': 0.0, 'within': math.inf, 'change': 0.1},
+    'cancellation': {'percent': None, 'min_amount': 0.0},
+    'crossing': {'above': None, 'below': None},
+}
+
+
+def parse_rule(raw, default_cooldown):
+    """Validate one rule from the config file and return it with defaults filled in.
+
+    Raises ValueError naming the rule when a field is missing or out of range.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError(f"rule must be an object, got {raw!r}")
+    name = raw.get('name')
+    if not isinstance(name, str) or not name:
+        raise ValueError(f"rule without a name: {raw!r}")
+    kind = raw.get('type')
+    if kind not in RULE_TYPES:
+        raise ValueError(f"rule {name}: type must be one of {', '.join(RULE_TYPES)}")
+    allowed = set(NUMERIC_FIELDS[kind]) | {'name', 'type', 'symbols', 'cooldown', 'priority', 'metric'}
+    unknown = set(raw) - allowed
+    if unknown:
+        raise ValueError(f"rule {name}: unknown field(s) {', '.join(sorted(unknown))}")
+
+    rule = {'name': name, 'type': kind}
+    symbols = raw.get('symbols')
+    if symbols is not None and not (isinstance(symbols, list) and all(isinstance(s, str) for s in symbols)):
+        raise ValueError(f"rule {name}: symbols must be a list of pair names")
+    rule['symbols'] = None if symbols is None else tuple(symbol.upper() for symbol in symbols)
+    rule['cooldown'] = float(raw.get('cooldown', default_cooldown))
+    priority = raw.get('priority', DEFAULT_PRIORITIES[kind])
+    if priority not in PRIORITIES:
+        raise ValueError(f"rule {name}: priority must be one of {', '.join(PRIORITIES)}")
+    rule['priority'] = PRIORITIES[priority]
+    for field, default in NUMERIC_FIELDS[kind].items():
+        value = raw.get(field, default)
+        rule[field] = None if value is None else float(value)
+        if value is not None and rule[field] < 0 and kind != 'crossing':
+            raise ValueError(f"rule {name}: {field} can't be negative")
+
+    if kind == 'wall' and not (rule['min_amount'] or rule['multiple']):
+        raise ValueError(f"rule {name}: a wall rule needs min_amount or multiple")
+    if kind == 'cancellation' and not (rule['percent'] is not None and 0 < rule['percent'] <= 100):
+        raise ValueError(f"rule {name}: percent must be in (0, 100]")
+    if kind == 'crossing':
+        if raw.get('metric') not in METRIC_FIELDS:
+            raise ValueError(f"rule {name}: metric must be one of {', '.join(METRIC_FIELDS)}")
+        if (rule['above'] is None) == (rule['below'] is None):
+            raise ValueError(f"rule {name}: give exactly one of above or below")
+        rule['metric'] = raw['metric']
+    return rule
+
+
+def parse_rules(config, default_cooldown):
+    # {"rules": [...]} from the config file -> tuple of validated rules
+    if not isinstance(config, dict) or not isinstance(config.get('rules'), list):
+        raise ValueError('expected an object with a "rules" list')
+    rules = tuple(parse_rule(raw, default_cooldown) for raw in config['rules'])
+    names = [rule['name'] for rule in rules]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise ValueError(f"duplicate rule name(s) {', '.join(sorted(duplicates))}")
+    return rules
+
+
+class AlertRuleFile:
+    """Alert rules loaded from a JSON file and reloaded when it changes.
+
+    The file is stat'ed at most every ``check_interval`` seconds. A file that
+    fails to parse is logged and the previous rules stay in effect; a missing
+    file means no rules. ``version`` grows with every successful load so the
+    analysis stage can tell when to recompile.
+    """
+
+    def __init__(self, path, default_cooldown=3600, check_interval=1.0):
+        self.path = path
+        self.default_cooldown = default_cooldown
+        self.check_interval = check_interval
+        self.rules = ()
+        self.version = 0
+        self.signature = None  # (mtime_ns, size) of the loaded file
+        self.next_check = 0.0
+        self.lock = threading.Lock()
+
+    def poll(self):
+        now = time.monotonic()
+        with self.lock:
+            if now < self.next_check:
+                return
+            self.next_check = now + self.check_interval
+            try:
+                stat = os.stat(self.path)
+                signature = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                signature = None
+            if signature == self.signature:
+                return
+            self.signature = signature
+            if signature is None:
+                rules = ()
+            else:
+                try:
+                    with open(self.path, encoding='utf-8') as f:
+                        rules = parse_rules(json.load(f), self.default_cooldown)
+                except (OSError, ValueError, TypeError) as e:
+                    logging.error(f"Ignoring alert rules in {self.path}: {e}")
+                    return
+            self.rules = rules
+            self.version += 1
+            logging.info(f"Loaded {len(rules)} alert rule(s) from {self.path}")
+
+    def rules_for(self, symbol):
+        """Return (version, rules) applying to ``symbol``, reloading the file first if it changed."""
+        self.poll()
+        rules, version = self.rules, self.version
+        return version, tuple(rule for rule in rules if rule['symbols'] is None or symbol in rule['symbols'])
+
+
+class RuleState:
+    # Dedup and cooldown state of one rule: alerted keys in the order they
+    # were last alerted, so expired ones are popped from the front
+    __slots__ = ('alerted', 'above')
+
+    def __init__(self):
+        self.alerted = OrderedDict()  # key -> (time, amount)
+        self.above = None  # crossing rules: whether the metric was past the bound last frame
+
+    def expire(self, now, cooldown):
+        alerted = self.alerted
+        while alerted and now - next(iter(alerted.values()))[0] >= cooldown:
+            alerted.popitem(last=False)
+
+    def export(self):
+        # JSON-able: tuple keys become lists
+        return {'alerted': [[list(key) if isinstance(key, tuple) else key, when, amount]
+                            for key, (when, amount) in self.alerted.items()],
+                'above': self.above}
+
+    @classmethod
+    def restore(cls, state):
+        rule_state = cls()
+        for key, when, amount in state['alerted']:
+            rule_state.alerted[tuple(key) if isinstance(key, list) else key] = (when, amount)
+        rule_state.above = state['above']
+        return rule_state
+
+    def due(self, key, now, amount, change):
+        # First alert for the key, or its amount moved by `change` within the cooldown
+        last = self.alerted.get(key)
+        if last is not None and not (change and last[1] and abs(amount - last[1]) / last[1] >= change):
+            return False
+        self.alerted[key] = (now, amount)
+        self.alerted.move_to_end(key)
+        return True
+
+
+def side_levels(levels):
+    levels = np.asarray(levels).reshape(-1, 2)
+    return levels[:, 0], levels[:, 1]
+
+
+class RuleEngine:
+    """Evaluates one pair's alert rules against its BookFrames.
+
+    Rules of a type are compiled into parameter columns and checked together:
+    each side of the book is compared against every wall rule in one
+    broadcast (rules x levels) pass, and likewise for cancellations against
+    the previous frame and for metric crossings. Only the matches are looked
+    up in per-rule dedup state, which survives reloads for rules that keep
+    their name.
+    """
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.version = None
+        self.rules = {kind: [] for kind in RULE_TYPES}
+        self.params = {}
+        self.states = {}
+        self.previous = None  # (group interval, {'bids': levels, 'asks': levels}) of the last frame
+
+    def compile(self, version, rules):
+        self.version = version
+        self.rules = {kind: [rule for rule in rules if rule['type'] == kind] for kind in RULE_TYPES}
+        self.params = {
+            kind: {field: np.array([math.nan if rule[field] is None else rule[field] for rule in kind_rules])
+                   for field in NUMERIC_FIELDS[kind]}
+            for kind, kind_rules in self.rules.items()
+        }
+        crossings = self.rules['crossing']
+        self.params['crossing']['sign'] = np.array([1.0 if rule['above'] is not None else -1.0 for rule in crossings])
+        self.params['crossing']['bound'] = np.array([rule['above'] if rule['above'] is not None else rule['below']
+                                                     for rule in crossings])
+        self.states = {rule['name']: self.states.get(rule['name']) or RuleState() for rule in rules}
+
+    def export_state(self):
+        """Return the dedup state of every rule as JSON-able data, by rule name."""
+        return {name: state.export() for name, state in self.states.items()}
+
+    def restore_state(self, states):
+        # Kept by name until the rules are compiled, like state across reloads
+        self.states.update((name, RuleState.restore(state)) for name, state in states.items())
+
+    def evaluate(self, frame):
+        """Return [(message, priority)] for the rules ``frame`` triggers."""
+        version, rules = frame.rules
+        if version != self.version:
+            self.compile(version, rules)
+        levels = {'bids': side_levels(frame.bids), 'asks': side_levels(frame.asks)}
+        group_interval = frame.settings["group_interval"]
+        previous = self.previous
+        self.previous = (group_interval, levels)
+
+        if not any(self.rules.values()):
+            return []
+        for kind_rules in self.rules.values():
+            for rule in kind_rules:
+                self.states[rule['name']].expire(frame.time, rule['cooldown'])
+
+        alerts = []
+        if self.rules['wall'] and len(levels['bids'][0]) and len(levels['asks'][0]):
+            alerts += self.evaluate_walls(frame, levels)
+        if self.rules['cancellation'] and previous is not None and previous[0] == group_interval:
+            alerts += self.evaluate_cancellations(frame, previous[1], levels)
+        if self.rules['crossing'] and frame.microstructure is not None:
+            alerts += self.evaluate_crossings(frame)
+        return alerts
+
+    def evaluate_walls(self, frame, levels):
+        rules, params, scale = self.rules['wall'], self.params['wall'], frame.scale
+        mid = (levels['bids'][0][-1] + levels['asks'][0][0]) / 2
+        min_units = params['min_amount'][:, np.newaxis] / scale.step_size
+        alerts = []
+        for side, label in (('bids', 'bid'), ('asks', 'ask')):
+            prices, amounts = levels[side]
+            median = np.median(amounts)
+            distance = np.abs(prices - mid) / mid
+            hits = ((amounts > min_units) &
+                    (amounts > params['multiple'][:, np.newaxis] * median) &
+                    (distance <= params['within'][:, np.newaxis]))
+            matched, level = np.nonzero(hits)
+            for index, price, amount, away in zip(matched.tolist(), prices[level].tolist(),
+                                                  amounts[level].tolist(), distance[level].tolist()):
+                rule = rules[index]
+                if self.states[rule['name']].due((side, price), frame.time, amount, rule['change']):
+                    alerts.append((
+                        f"Large {self.symbol} {label} wall: {amount * scale.step_size:.2f} coins at "
+                        f"${price * scale.tick_size:.{scale.decimals}f} ({amount / median if median else math.inf:.1f}x median, "
+                        f"{away:.2%} from mid) [{rule['name']}]",
+                        rule['priority']))
+        return alerts
+
+    def evaluate_cancellations(self, frame, previous_levels, levels):
+        rules, params, scale = self.rules['cancellation'], self.params['cancellation'], frame.scale
+        min_units = params['min_amount'][:, np.newaxis] / scale.step_size
+        fraction = params['percent'][:, np.newaxis] / 100
+        alerts = []
+        for side, label in (('bids', 'bid'), ('asks', 'ask')):
+            previous_prices, previous_amounts = previous_levels[side]
+            prices, amounts = levels[side]
+            if not len(previous_prices) or not len(prices):
+                continue
+            # Only levels inside the current book's deepest (possibly partial)
+            # bucket: past it, after a shallower resync or pruning, a level is
+            # unknown rather than pulled
+            inside = previous_prices > prices[0] if side == 'bids' else previous_prices < prices[-1]
+            previous_prices, previous_amounts = previous_prices[inside], previous_amounts[inside]
+            # Current amount of every previously seen level, 0 where it is gone
+            current = np.zeros_like(previous_amounts)
+            position = np.searchsorted(prices, previous_prices)
+            position[position == len(prices)] = 0
+            found = prices[position] == previous_prices
+            current[found] = amounts[position[found]]
+            dropped = previous_amounts - current
+            hits = (dropped > 0) & (dropped >= fraction * previous_amounts) & (dropped > min_units)
+            matched, level = np.nonzero(hits)
+            color_square = '🟥' if label == 'ask' else '🟩'
+            for index, price, amount, before in zip(matched.tolist(), previous_prices[level].tolist(),
+                                                    dropped[level].tolist(), previous_amounts[level].tolist()):
+                rule = rules[index]
+                if self.states[rule['name']].due((side, price), frame.time, amount, 0):
+                    alerts.append((
+                        f"{color_square} {self.symbol} {label} level at ${price * scale.tick_size:.{scale.decimals}f} pulled: "
+                        f"{amount * scale.step_size:.4f} of {before * scale.step_size:.4f} "
+                        f"coins ({amount / before:.0%}) [{rule['name']}]",
+                        rule['priority']))
+        return alerts
+
+    def evaluate_crossings(self, frame):
+        rules, params = self.rules['crossing'], self.params['crossing']
+        values = np.array([math.nan if frame.microstructure[rule['metric']] is None
+                           else frame.microstructure[rule['metric']] for rule in rules])
+        above = params['sign'] * (values - params['bound']) > 0
+        alerts = []
+        for index in np.nonzero(~np.isnan(values))[0]:
+            rule = rules[index]
+            state = self.states[rule['name']]
+            crossed = state.above is False and above[index]
+            state.above = bool(above[index])
+            if crossed and state.due('crossing', frame.time, values[index], 0):
+                direction = 'above' if rule['above'] is not None else 'below'
+                alerts.append((
+                    f"{self.symbol} {rule['metric']} crossed {direction} {params['bound'][index]:g}: "
+                    f"{values[index]:.4g} [{rule['name']}]",
+                    rule['priority']))
+        return alerts
@@ -0,0 +1,244 @@
+"""Replay recorded order books through the wall and cancellation detectors.
+
+Examples, from the repository root:
+
+    python backtest.py --symbol BTCUSDT --wall 150 --cancel 80
+    python backtest.py --symbol BTCUSDT --wall 100,150,300 --cancel 50,80 \\
+        --cooldown 600,3600 --labels labels.json --processes 4
+
+Labels are a JSON list of {"timestamp", "kind", "side", "price"} objects, with
+kind "wall" or "cancellation" and side "bids" or "asks".
+"""
+import argparse
+import functools
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from recorder import KIND_METRICS, KIND_SNAPSHOT, SIDE_BID, read_records
+
+# One row per alert the detectors would have sent
+ALERT_DTYPE = np.dtype([
+    ('timestamp', 'f8'),
+    ('kind', 'U12'),
+    ('side', 'U4'),
+    ('price', 'f8'),
+    ('amount', 'f8'),
+])
+
+DEFAULT_PARAMS = {
+    'group_interval': 100,
+    'large_wall_threshold': 150,
+    'cancellation_threshold': 80,
+    'notification_cooldown': 3600,
+    'cancellation_window': 5,
+}
+
+
+def replay_books(chunks, step=1.0):
+    """Rebuild the book from recorded chunks and yield (timestamp, bids, asks) every ``step`` seconds.
+
+    ``bids`` and ``asks`` are unsorted (n, 2) float arrays at full resolution.
+    Silent stretches in the recording are skipped rather than repeated.
+    """
+    bids, asks = {}, {}
+    next_emit = None
+
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        # Rows of one message share kind, update ID and timestamp
+        boundaries = np.flatnonzero((np.diff(chunk['update_id']) != 0) | (np.diff(chunk['kind']) != 0) |
+                                    (np.diff(chunk['timestamp']) != 0)) + 1
+        for message in np.split(chunk, boundaries):
+            timestamp = message['timestamp'][0]
+            if next_emit is not None and timestamp >= next_emit and bids and asks:
+                yield next_emit, book_array(bids), book_array(asks)
+                next_emit += step
+                if next_emit <= timestamp:
+                    next_emit = timestamp + step
+
+            if message['kind'][0] == KIND_METRICS:
+                continue
+            is_bid = message['side'] == SIDE_BID
+            if message['kind'][0] == KIND_SNAPSHOT:
+                bids = dict(zip(message['price'][is_bid].tolist(), message['amount'][is_bid].tolist()))
+                asks = dict(zip(message['price'][~is_bid].tolist(), message['amount'][~is_bid].tolist()))
+                if next_emit is None:
+                    next_emit = timestamp
+            else:
+                apply_levels(bids, message[is_bid])
+                apply_levels(asks, message[~is_bid])
+
+    if next_emit is not None and bids and asks:
+        yield next_emit, book_array(bids), book_array(asks)
+
+
+def apply_levels(levels, rows):
+    for price, amount in zip(rows['price'].tolist(), rows['amount'].tolist()):
+        if amount == 0:
+            levels.pop(price, None)
+        else:
+            levels[price] = amount
+
+
+def book_array(levels):
+    return np.fromiter(itertools.chain.from_iterable(levels.items()), dtype=float,
+                       count=2 * len(levels)).reshape(-1, 2)
+
+
+def run_backtest(books, params=None):
+    """Run the live detection logic over replayed books.
+
+    Returns a dict with the alerts (ALERT_DTYPE), snapshot count, elapsed
+    seconds and throughput in snapshots per second.
+    """
+    from orderbook import CancellationDetector, WallTracker, find_large_walls, group_orders_array
+
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    group_interval = params['group_interval']
+    wall_tracker = WallTracker()
+    detector = CancellationDetector(params['cancellation_window'])
+    alerts = []
+
+    snapshots = 0
+    start = time.perf_counter()
+    for timestamp, bids, asks in books:
+        snapshots += 1
+        grouped = {'bids': group_orders_array(bids, group_interval), 'asks': group_orders_array(asks, group_interval)}
+
+        walls = find_large_walls(grouped['bids'], grouped['asks'], params['large_wall_threshold'],
+                                 wall_tracker, params['notification_cooldown'], timestamp)
+        for side, price, amount in walls:
+            alerts.append((timestamp, 'wall', side, price, amount))
+
+        events = detector.update(grouped, params['cancellation_threshold'])
+        for event in events:
+            side = 'bids' if event['side'] == 'bid' else 'asks'
+            alerts.append((timestamp, 'cancellation', side, event['price'], event['cancelled']))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'params': params,
+        'alerts': np.array(alerts, dtype=ALERT_DTYPE),
+        'snapshots': snapshots,
+        'elapsed': elapsed,
+        'snapshots_per_second': snapshots / elapsed if elapsed > 0 else float('inf'),
+    }
+
+
+def score_alerts(alerts, labels, price_tolerance, time_tolerance=5.0):
+    """Match alerts against labelled events of the same kind and side.
+
+    Returns (precision, recall); None where there is nothing to divide by.
+    """
+    matched_labels = set()
+    true_positives = 0
+    for alert in alerts:
+        for i, label in enumerate(labels):
+            if (label['kind'] == alert['kind'] and label['side'] == alert['side'] and
+                    abs(label['timestamp'] - alert['timestamp']) <= time_tolerance and
+                    abs(label['price'] - alert['price']) <= price_tolerance):
+                true_positives += 1
+                matched_labels.add(i)
+                break
+    precision = true_positives / len(alerts) if len(alerts) else None
+    recall = len(matched_labels) / len(labels) if labels else None
+    return precision, recall
+
+
+@functools.lru_cache(maxsize=1)
+def load_records(directory, symbol, start=None, end=None):
+    # Cached so a sweep worker decodes the recording once for all its runs
+    return tuple(read_records(directory, symbol, start, end))
+
+
+def summarize(result, labels=None):
+    alerts = result['alerts']
+    summary = {
+        'params': result['params'],
+        'snapshots': result['snapshots'],
+        'alerts': len(alerts),
+        'wall_alerts': int(np.count_nonzero(alerts['kind'] == 'wall')),
+        'cancellation_alerts': int(np.count_nonzero(alerts['kind'] == 'cancellation')),
+        'snapshots_per_second': result['snapshots_per_second'],
+    }
+    if labels is not None:
+        summary['precision'], summary['recall'] = score_alerts(alerts, labels, result['params']['group_interval'])
+    return summary
+
+
+def backtest_recording(directory, symbol, params, labels=None, start=None, end=None, step=1.0):
+    books = replay_books(load_records(directory, symbol, start, end), step)
+    return summarize(run_backtest(books, params), labels)
+
+
+def _sweep_worker(job):
+    return backtest_recording(*job)
+
+
+def sweep(directory, symbol, grid, labels=None, processes=None, start=None, end=None, step=1.0):
+    """Backtest every combination in ``grid`` (param name -> list of values) across processes."""
+    names = list(grid)
+    combinations = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    jobs = [(directory, symbol, params, labels, start, end, step) for params in combinations]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(_sweep_worker, jobs))
+
+
+def parse_values(text, cast=float):
+    return [cast(value) for value in text.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded order books through the detectors")
+    parser.add_argument('--dir', default='recordings', help="recording directory")
+    parser.add_argument('--symbol', default='BTCUSDT')
+    parser.add_argument('--group', default=str(DEFAULT_PARAMS['group_interval']), help="group interval(s)")
+    parser.add_argument('--wall', default=str(DEFAULT_PARAMS['large_wall_threshold']), help="wall threshold(s)")
+    parser.add_argument('--cancel', default=str(DEFAULT_PARAMS['cancellation_threshold']),
+                        help="cancellation threshold(s)")
+    parser.add_argument('--cooldown', default=str(DEFAULT_PARAMS['notification_cooldown']),
+                        help="notification cooldown(s) in seconds")
+    parser.add_argument('--window', default=str(DEFAULT_PARAMS['cancellation_window']),
+                        help="cancellation window(s) in books")
+    parser.add_argument('--labels', help="JSON file with labelled events")
+    parser.add_argument('--start', type=float, help="first timestamp to replay")
+    parser.add_argument('--end', type=float, help="last timestamp to replay")
+    parser.add_argument('--step', type=float, default=1.0, help="seconds between detection runs")
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    labels = None
+    if args.labels:
+        with open(args.labels) as f:
+            labels = json.load(f)
+
+    grid = {
+        'group_interval': parse_values(args.group),
+        'large_wall_threshold': parse_values(args.wall),
+        'cancellation_threshold': parse_values(args.cancel),
+        'notification_cooldown': parse_values(args.cooldown),
+        'cancellation_window': parse_values(args.window, int),
+    }
+    results = sweep(args.dir, args.symbol, grid, labels, args.processes, args.start, args.end, args.step)
+
+    print(f"{'group':>7} {'wall':>8} {'cancel':>8} {'cooldown':>9} {'window':>6} "
+          f"{'alerts':>7} {'walls':>6} {'cancels':>7} {'precision':>9} {'recall':>7} {'snap/s':>9}")
+    for summary in results:
+        params = summary['params']
+        precision = summary.get('precision')
+        recall = summary.get('recall')
+        print(f"{params['group_interval']:>7g} {params['large_wall_threshold']:>8g} "
+              f"{params['cancellation_threshold']:>8g} {params['notification_cooldown']:>9g} "
+              f"{params['cancellation_window']:>6} {summary['alerts']:>7} {summary['wall_alerts']:>6} "
+              f"{summary['cancellation_alerts']:>7} {'-' if precision is None else f'{precision:.3f}':>9} "
+              f"{'-' if recall is None else f'{recall:.3f}':>7} {summary['snapshots_per_second']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
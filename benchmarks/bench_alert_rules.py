@@ -0,0 +1,79 @@
+"""Time a batched evaluation of many alert rules over a deep book.
+
+Run from the repository root:
+
+    python benchmarks/bench_alert_rules.py
+
+RULES_PER_TYPE wall, cancellation and crossing rules are evaluated against
+successive books that differ in a few hundred levels, like consecutive ticks.
+The rule engine's behaviour is covered by tests/test_alert_rules.py.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alert_rules import AlertRuleFile, RuleEngine  # noqa: E402
+from depth_stream import PriceScale  # noqa: E402
+from orderbook import BookFrame  # noqa: E402
+
+SCALE = PriceScale('0.01', '0.001')
+LEVELS = 5000  # grouped levels per side
+RULES_PER_TYPE = 20
+EVALUATION_BUDGET_SECONDS = 0.01
+RUNS = 200
+
+
+def make_book(levels, seed=0):
+    # Grouped integer book around 100.00 with 1-coin levels
+    rng = np.random.default_rng(seed)
+    bids = np.column_stack((np.arange(10_000 - levels, 10_000), rng.integers(500, 1500, levels))).astype(np.int64)
+    asks = np.column_stack((np.arange(10_001, 10_001 + levels), rng.integers(500, 1500, levels))).astype(np.int64)
+    return bids, asks
+
+
+def frame(bids, asks, now, rules, microstructure=None):
+    return BookFrame('BTCUSDT', now, SCALE, bids, asks, {'group_interval': 0.01}, microstructure, rules)
+
+
+def main():
+    many = []
+    for i in range(RULES_PER_TYPE):
+        many += [{'name': f'wall-{i}', 'type': 'wall', 'multiple': 5 + i, 'within': 0.001 * (i + 1)},
+                 {'name': f'cancel-{i}', 'type': 'cancellation', 'percent': 50 + i, 'min_amount': 1 + i / 10},
+                 {'name': f'imbalance-{i}', 'type': 'crossing', 'metric': 'imbalance', 'above': i / RULES_PER_TYPE}]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'alert_rules.json')
+        with open(path, 'w') as f:
+            json.dump({'rules': many}, f)
+        rules = AlertRuleFile(path).rules_for('BTCUSDT')
+    engine = RuleEngine('BTCUSDT')
+
+    rng = np.random.default_rng(1)
+    books = [make_book(LEVELS)]
+    for _ in range(RUNS):
+        bids, asks = (side.copy() for side in books[-1])
+        for side in (bids, asks):
+            changed = rng.integers(0, LEVELS, 200)
+            side[changed, 1] = rng.integers(0, 3000, len(changed))
+        books.append((bids, asks))
+    engine.evaluate(frame(*books[0], 0.0, rules, {'imbalance': 0.0}))
+    durations = []
+    for run, (bids, asks) in enumerate(books[1:], 1):
+        start = time.perf_counter()
+        engine.evaluate(frame(bids, asks, float(run), rules, {'imbalance': run % 2 * 0.99}))
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    p50 = durations[len(durations) // 2]
+    print(f"{len(many)} rules over {LEVELS} levels/side: p50 {p50 * 1000:.2f}ms, "
+          f"p99 {durations[int(len(durations) * 0.99)] * 1000:.2f}ms "
+          f"(budget {EVALUATION_BUDGET_SECONDS * 1000:.0f}ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Compare the pandas merge cancellation check with find_cancellations.
+
+Run from the repository root:
+
+    python benchmarks/bench_cancellations.py
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from orderbook import CancellationDetector, find_cancellations  # noqa: E402
+
+SIZES = [1_000, 5_000, 50_000]
+THRESHOLD = 5.0
+
+
+def pandas_cancellations(prev, curr, threshold):
+    # The per-poll path detect_cancellations used before, minus the Telegram send
+    prev_df = pd.DataFrame(prev, columns=['price', 'amount'])
+    curr_df = pd.DataFrame(curr, columns=['price', 'amount'])
+
+    merged = prev_df.merge(curr_df, on='price', how='outer', suffixes=('_prev', '_curr'))
+    merged = merged.fillna(0)
+
+    cancellations = merged[merged['amount_prev'] - merged['amount_curr'] > threshold]
+    return [(row['price'], row['amount_prev'] - row['amount_curr']) for _, row in cancellations.iterrows()]
+
+
+def synthetic_books(levels, seed=42):
+    # Two consecutive grouped books: most levels jitter, a few walls get pulled
+    rng = np.random.default_rng(seed)
+    prices = 60000.0 - np.arange(levels)[::-1] * 10.0
+    amounts = rng.exponential(2.0, levels)
+    prev = np.column_stack((prices, amounts))
+
+    curr = prev.copy()
+    curr[:, 1] *= rng.uniform(0.9, 1.1, levels)
+    pulled = rng.choice(levels, max(levels // 100, 1), replace=False)
+    curr[pulled, 1] = 0.0
+    prev[pulled, 1] += THRESHOLD * 2
+    return prev, curr
+
+
+def best_of(func, repeat=5):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    print(f"{'levels':>10} {'pandas':>12} {'find_cancellations':>20} {'window=5':>10} {'speedup':>8}")
+    for levels in SIZES:
+        prev, curr = synthetic_books(levels)
+
+        expected = pandas_cancellations(prev, curr, THRESHOLD)
+        events = find_cancellations(prev, curr, THRESHOLD, 'bid')
+        assert np.allclose(np.array(expected), np.column_stack((events['price'], events['cancelled'])))
+
+        def rolling():
+            detector = CancellationDetector(window=5)
+            for book in (prev, prev, prev, prev, curr):
+                detector.update({'bids': book, 'asks': book}, THRESHOLD)
+
+        baseline = best_of(lambda: pandas_cancellations(prev, curr, THRESHOLD))
+        vectorized = best_of(lambda: find_cancellations(prev, curr, THRESHOLD, 'bid'))
+        # Per-update cost of the rolling detector, both sides
+        windowed = best_of(rolling) / 5
+        print(f"{levels:>10} {baseline * 1000:>10.2f}ms {vectorized * 1000:>18.3f}ms "
+              f"{windowed * 1000:>8.3f}ms {baseline / vectorized:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
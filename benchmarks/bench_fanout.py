@@ -0,0 +1,98 @@
+"""Time publishing books to many fan-out viewers.
+
+Run from the repository root:
+
+    python benchmarks/bench_fanout.py
+
+Measures the server loop's time to hand one publication to every viewer and
+the bytes sent per viewer per frame. The protocol, convergence and
+slow-viewer handling are covered by tests/test_fanout.py.
+"""
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orderbook  # noqa: E402
+from depth_stream import PriceScale  # noqa: E402
+from fanout import FanoutClient, FanoutServer  # noqa: E402
+from metrics import metrics  # noqa: E402
+
+SYMBOL = 'ETHUSDT'
+SCALE = PriceScale('0.01', '0.00001')
+LEVELS = 5000  # levels per side of the published books
+CLIENTS = 50
+FRAMES = 200
+PUBLISH_BUDGET_SECONDS = 0.001  # loop time to hand a publication to all viewers
+
+
+def books(count, levels, seed=1):
+    # Successive books differing in a few dozen levels, with levels appearing and vanishing
+    rng = np.random.default_rng(seed)
+    bids = np.column_stack((np.arange(100_000 - levels, 100_000), rng.integers(1, 10_000, levels))).astype(np.int64)
+    asks = np.column_stack((np.arange(100_001, 100_001 + levels), rng.integers(1, 10_000, levels))).astype(np.int64)
+    result = [(bids, asks)]
+    for _ in range(count - 1):
+        bids, asks = (side.copy() for side in result[-1])
+        for side in (bids, asks):
+            changed = rng.integers(0, len(side), 50)
+            side[changed, 1] = rng.integers(0, 10_000, len(changed))
+        result.append(tuple(side[side[:, 1] > 0] for side in (bids, asks)))
+    return result
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def timed_on_loop(server, function):
+    # Run `function` on the server's loop thread, return its duration there
+    async def call():
+        start = time.perf_counter()
+        function()
+        return time.perf_counter() - start
+    return asyncio.run_coroutine_threadsafe(call(), server.loop).result(5)
+
+
+def main():
+    orderbook.alert_rules = None
+    monitor = orderbook.MultiSymbolMonitor([SYMBOL], feed=lambda symbols, stop_event: iter(()), max_workers=1)
+    server = FanoutServer(monitor, port=0)
+    server.start()
+    clients = [FanoutClient(('127.0.0.1', server.port), [SYMBOL], history_shape=(60, 50, 1.0))
+               for _ in range(CLIENTS)]
+    for client in clients:
+        client.start()
+    wait_for(lambda: len(server.clients) == CLIENTS)
+
+    before = metrics.counters.get('fanout_bytes_sent', 0)
+    durations = []
+    for index, (bids, asks) in enumerate(books(FRAMES, LEVELS)):
+        frame = orderbook.BookFrame(SYMBOL, float(index), SCALE, bids, asks, orderbook.symbol_settings(SYMBOL),
+                                    {'mid': 1000.0}, (0, ()))
+        durations.append(timed_on_loop(server, lambda: server.push(SYMBOL, frame, 'analysis', [])))
+        time.sleep(0.002)
+    channel = server.channels[SYMBOL]
+    wait_for(lambda: all(client.views[SYMBOL].seq == channel.seq for client in clients))
+    sent = (metrics.counters.get('fanout_bytes_sent', 0) - before) / CLIENTS / FRAMES
+    durations.sort()
+    print(f"publication to {CLIENTS} viewers, {LEVELS} levels/side: p50 {durations[len(durations) // 2] * 1000:.2f}ms "
+          f"(budget {PUBLISH_BUDGET_SECONDS * 1000:.0f}ms)")
+    print(f"delta {len(channel.message(channel.seq - 1))}B vs snapshot {len(channel.message(None))}B, "
+          f"{sent:.0f}B per viewer per frame sent")
+
+    for client in clients:
+        client.stop()
+    server.stop()
+    monitor.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Compare group_orders with the vectorized group_orders_array.
+
+Run from the repository root:
+
+    python benchmarks/bench_group_orders.py
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from orderbook import group_orders, group_orders_array, parse_levels  # noqa: E402
+
+SIZES = [5_000, 50_000, 500_000]
+INTERVAL = 100
+
+
+def synthetic_depth(levels, mid=60000.0, tick=0.01, seed=42):
+    # Binance returns levels as strings, so the benchmark does too
+    rng = np.random.default_rng(seed)
+    prices = mid - np.arange(levels) * tick
+    amounts = rng.exponential(0.5, levels)
+    return [[f"{price:.2f}", f"{amount:.8f}"] for price, amount in zip(prices, amounts)]
+
+
+def best_of(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    # "strings" times the REST path (parse + bucket), "floats" the live book
+    # path where levels were already parsed once on arrival.
+    print(f"{'levels':>10} {'input':>8} {'group_orders':>14} {'group_orders_array':>20} {'speedup':>8}")
+    for levels in SIZES:
+        orders = synthetic_depth(levels)
+        repeat = 5 if levels < 500_000 else 2
+
+        expected = np.array(group_orders(orders, INTERVAL))
+        result = group_orders_array(orders, INTERVAL)
+        assert np.allclose(expected, result), "group_orders_array disagrees with group_orders"
+
+        inputs = [("strings", orders), ("floats", parse_levels(orders))]
+        for name, data in inputs:
+            baseline = best_of(lambda: group_orders(data, INTERVAL), repeat)
+            vectorized = best_of(lambda: group_orders_array(data, INTERVAL), repeat)
+            print(f"{levels:>10} {name:>8} {baseline * 1000:>12.2f}ms {vectorized * 1000:>18.2f}ms "
+                  f"{baseline / vectorized:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark the depth heatmap: column writes and full renders of a 1-hour, 500-bucket history.
+
+Run from the repository root; exits non-zero when a render misses its budget:
+
+    python benchmarks/bench_heatmap.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from depth_stream import PriceScale  # noqa: E402
+from heatmap import LUT_SIZE, DepthHistory, HeatmapRenderer  # noqa: E402
+
+COLUMNS = 3600
+BUCKETS = 500
+LEVELS = 1000  # grouped levels per side, more than fit on the price axis
+STEP = 100  # bucket size in ticks
+RENDER_BUDGET_SECONDS = 0.1  # a tenth of the 1 s update interval
+RUNS = 50
+
+
+def make_columns(count, seed=0):
+    rng = np.random.default_rng(seed)
+    mid = 10_000_000
+    for _ in range(count):
+        mid += int(rng.normal(0, STEP))
+        best_bid = mid // STEP * STEP
+        bids = np.column_stack((np.arange(best_bid - STEP * (LEVELS - 1), best_bid + 1, STEP),
+                                rng.integers(1, 10_000, LEVELS)))
+        asks = np.column_stack((np.arange(best_bid + STEP, best_bid + STEP * (LEVELS + 1), STEP),
+                                rng.integers(1, 10_000, LEVELS)))
+        yield bids.astype(np.int64), asks.astype(np.int64)
+
+
+def main():
+    scale = PriceScale('0.01', '0.001')
+    history = DepthHistory(COLUMNS, BUCKETS)
+    renderer = HeatmapRenderer(COLUMNS, BUCKETS)
+    lut = np.arange(LUT_SIZE, dtype=np.uint32) | 0xFF000000
+
+    columns = list(make_columns(COLUMNS + RUNS))
+    start = time.perf_counter()
+    for second, (bids, asks) in enumerate(columns[:COLUMNS]):
+        history.push(float(second), bids, asks, STEP, scale)
+    push_seconds = (time.perf_counter() - start) / COLUMNS
+
+    renders = []
+    for second, (bids, asks) in enumerate(columns[COLUMNS:], COLUMNS):
+        history.push(float(second), bids, asks, STEP, scale)
+        start = time.perf_counter()
+        renderer.render(history, lut)
+        renders.append(time.perf_counter() - start)
+    renders.sort()
+    p50 = renders[len(renders) // 2]
+    p99 = renders[min(int(len(renders) * 0.99), len(renders) - 1)]
+
+    print(f"{COLUMNS} columns x {BUCKETS} buckets: push {push_seconds * 1e6:.0f}us/column, "
+          f"render p50 {p50 * 1000:.1f}ms p99 {p99 * 1000:.1f}ms (budget {RENDER_BUDGET_SECONDS * 1000:.0f}ms)")
+    if p99 > RENDER_BUDGET_SECONDS:
+        print("FAIL: render over budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""Check the headless import cost of orderbook.py against a budget.
+
+Run from the repository root; exits non-zero when over budget or when GUI
+modules are pulled in:
+
+    python benchmarks/bench_import.py
+"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_BUDGET_SECONDS = 1.0
+RSS_BUDGET_MB = 150
+RUNS = 5
+GUI_MODULES = ['PyQt6', 'matplotlib', 'winsound', 'orderbook_gui']
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import orderbook
+elapsed = time.perf_counter() - start
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+except ImportError:
+    import psutil
+    rss_mb = psutil.Process().memory_info().peak_wset / (1024 * 1024)
+print(json.dumps({'seconds': elapsed, 'rss_mb': rss_mb,
+                  'gui_modules': [name for name in %r if name in sys.modules]}))
+""" % GUI_MODULES
+
+
+def measure():
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    # The first run warms the OS file cache and .pyc files
+    results = [measure() for _ in range(RUNS + 1)][1:]
+    seconds = min(result['seconds'] for result in results)
+    rss_mb = max(result['rss_mb'] for result in results)
+    gui_modules = sorted({name for result in results for name in result['gui_modules']})
+
+    print(f"import orderbook: {seconds * 1000:.0f}ms (budget {IMPORT_BUDGET_SECONDS * 1000:.0f}ms), "
+          f"peak RSS {rss_mb:.1f}MB (budget {RSS_BUDGET_MB}MB)")
+
+    failures = []
+    if seconds > IMPORT_BUDGET_SECONDS:
+        failures.append("import time over budget")
+    if rss_mb > RSS_BUDGET_MB:
+        failures.append("RSS over budget")
+    if gui_modules:
+        failures.append(f"GUI modules imported headless: {', '.join(gui_modules)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""Benchmark streaming microstructure metrics against recomputing them from the whole book.
+
+Run from the repository root; exits non-zero when the metrics disagree with
+a rescan or the per-update cost grows with depth:
+
+    python benchmarks/bench_microstructure.py
+
+The incremental cost per update should stay flat as the book gets deeper,
+while a full recomputation grows with the number of levels.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from depth_stream import LocalOrderBook, PriceScale  # noqa: E402
+from microstructure import MicrostructureTracker  # noqa: E402
+
+DEPTHS = [1_000, 10_000, 100_000]
+EVENTS = 2_000
+LEVELS_PER_EVENT = 10
+BAND = 0.01
+MAX_GROWTH = 3.0  # allowed per-update cost ratio between the deepest and shallowest book
+
+
+def make_book(depth, seed=0):
+    rng = np.random.default_rng(seed)
+    snapshot = {
+        'lastUpdateId': 1,
+        'bids': [[f"{50_000 - i * 0.01:.2f}", f"{amount:.3f}"] for i, amount in enumerate(rng.random(depth))],
+        'asks': [[f"{50_000.01 + i * 0.01:.2f}", f"{amount:.3f}"] for i, amount in enumerate(rng.random(depth))],
+    }
+    events = []
+    for update_id in range(2, EVENTS + 2):
+        offsets = rng.integers(0, min(depth, 2_000), (2, LEVELS_PER_EVENT))
+        amounts = np.where(rng.random((2, LEVELS_PER_EVENT)) < 0.3, 0.0, rng.random((2, LEVELS_PER_EVENT)))
+        events.append({
+            'U': update_id, 'u': update_id,
+            'b': [[f"{50_000 - offset * 0.01:.2f}", f"{amount:.3f}"] for offset, amount in zip(offsets[0], amounts[0])],
+            'a': [[f"{50_000.01 + offset * 0.01:.2f}", f"{amount:.3f}"] for offset, amount in zip(offsets[1], amounts[1])],
+        })
+    return snapshot, events
+
+
+def full_recompute(book, slack=0):
+    # What a per-cycle rescan of every level costs; ``slack`` widens the band by that many ticks
+    bids = np.fromiter(book.bids, np.int64, len(book.bids))
+    asks = np.fromiter(book.asks, np.int64, len(book.asks))
+    bid_amounts = np.fromiter(book.bids.values(), np.int64, len(book.bids))
+    ask_amounts = np.fromiter(book.asks.values(), np.int64, len(book.asks))
+    best_bid, best_ask = bids.max(), asks.min()
+    reach = int(BAND * (best_bid + best_ask) / 2) + slack
+    return bid_amounts[bids >= best_bid - reach].sum(), ask_amounts[asks <= best_ask + reach].sum()
+
+
+def run(depth):
+    snapshot, events = make_book(depth)
+    scale = PriceScale('0.01', '0.001')
+
+    plain = LocalOrderBook(scale=scale)
+    plain.load_snapshot(snapshot)
+    start = time.perf_counter()
+    for event in events:
+        plain.apply_diff(event)
+    baseline = time.perf_counter() - start
+
+    tracked = LocalOrderBook(scale=scale, microstructure=MicrostructureTracker(BAND, sample_interval=0.0))
+    tracked.load_snapshot(snapshot)
+    start = time.perf_counter()
+    for event in events:
+        tracked.apply_diff(event)
+        tracked.microstructure.values()
+    incremental = time.perf_counter() - start - baseline
+
+    start = time.perf_counter()
+    for _ in range(50):
+        full_recompute(plain)
+    rescan = (time.perf_counter() - start) / 50
+
+    # Band edges are resolved to one grid cell, so the exact depth is bracketed
+    tracker = tracked.microstructure
+    values = tracker.values()
+    inner = full_recompute(tracked, -tracker.cell_size)
+    outer = full_recompute(tracked, tracker.cell_size)
+    for side, low, high in (('bid_depth', inner[0], outer[0]), ('ask_depth', inner[1], outer[1])):
+        assert low * scale.step_size - 1e-6 <= values[side] <= high * scale.step_size + 1e-6, side
+    return incremental / EVENTS, rescan
+
+
+def main():
+    print(f"{'levels/side':>12} {'incremental/update':>19} {'full rescan':>12}")
+    costs = []
+    for depth in DEPTHS:
+        incremental, rescan = run(depth)
+        costs.append(incremental)
+        print(f"{depth:>12} {incremental * 1e6:>17.1f}us {rescan * 1e6:>10.0f}us")
+    growth = costs[-1] / costs[0]
+    print(f"{DEPTHS[-1] // DEPTHS[0]}x the levels, {growth:.1f}x the cost per update (limit {MAX_GROWTH:.0f}x)")
+    if growth > MAX_GROWTH:
+        print("FAIL: per-update cost grows with depth")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""Time a state snapshot with three 5000-level books.
+
+Run from the repository root:
+
+    python benchmarks/bench_state_store.py
+
+Capture copies the books under their locks on the saving thread; the atomic
+write then runs without them. Restore behaviour is covered by
+tests/test_state_store.py.
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orderbook  # noqa: E402
+from depth_stream import PriceScale  # noqa: E402
+from metrics import metrics  # noqa: E402
+from state_store import StateStore  # noqa: E402
+
+SYMBOLS = ['BTCUSDT', 'ETHUSDT', 'XRPUSDT']
+LEVELS = 5000
+SCALE = PriceScale('0.01', '0.00001')
+CAPTURE_BUDGET_SECONDS = 0.005
+RUNS = 20
+
+
+def snapshot(seed=0):
+    rng = np.random.default_rng(seed)
+    bids = [[f"{60000 - i:.2f}", f"{amount:.5f}"] for i, amount in enumerate(rng.exponential(0.5, LEVELS))]
+    asks = [[f"{60001 + i:.2f}", f"{amount:.5f}"] for i, amount in enumerate(rng.exponential(0.5, LEVELS))]
+    return {'lastUpdateId': 1000, 'bids': bids, 'asks': asks}
+
+
+def main():
+    orderbook.alert_rules = None
+    orderbook.send_telegram_notification = lambda message, priority=None: None
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'state.npz')
+        monitor = orderbook.MultiSymbolMonitor(SYMBOLS, feed=lambda symbols, stop_event: iter(()), max_workers=2,
+                                               state_store=StateStore(path))
+        for symbol in SYMBOLS:
+            symbol_monitor = monitor.monitors[symbol]
+            symbol_monitor.depth_stream.scale = SCALE
+            symbol_monitor.depth_stream.book.load_snapshot(snapshot(), SCALE)
+            # Analyzer state to save alongside the book
+            symbol_monitor.export_requested = True
+            symbol_monitor.submit()
+            symbol_monitor.future.result(timeout=10)
+        deadline = time.monotonic() + 5
+        while any(symbol_monitor.analyzer_state is None for symbol_monitor in monitor.monitors.values()) and \
+                time.monotonic() < deadline:
+            time.sleep(0.01)
+        for _ in range(RUNS):
+            monitor.save_state()
+        capture = metrics.histograms['state_capture'].quantile(0.5)
+        write = metrics.histograms['state_write'].quantile(0.5)
+        print(f"snapshot of {len(SYMBOLS)} x {LEVELS} levels/side: capture p50 {capture * 1000:.2f}ms "
+              f"(budget {CAPTURE_BUDGET_SECONDS * 1000:.0f}ms), atomic write p50 {write * 1000:.2f}ms, "
+              f"{os.path.getsize(path) / 1024:.0f}KB")
+        monitor.stop()
+
+
+if __name__ == "__main__":
+    main()
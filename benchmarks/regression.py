@@ -0,0 +1,488 @@
+"""Regression suite for the order book hot paths: time, peak memory and correctness per stage.
+
+Run from the repository root; exits non-zero when a stage returns a wrong
+result, or is slower or allocates more than its baseline beyond the tolerance:
+
+    python benchmarks/regression.py
+    python benchmarks/regression.py --update                # rewrite benchmarks/baseline.json
+    python benchmarks/regression.py --sizes 1000 --stages group_orders,gui_render
+    python benchmarks/regression.py --recording recordings --symbol BTCUSDT
+
+Books are synthetic and seeded, so runs are comparable. They are also written
+through the recorder and read back, so the replay stage reads real segment
+files. With --recording, the first snapshot of a real recording (cut to the
+requested depth) and the diffs after it are used instead; those results are
+keyed separately in the baseline.
+
+Time is the best of several runs. Peak memory is the tracemalloc peak of one
+more run: Python and NumPy allocations, not Qt's.
+
+Baseline times are absolute timings from the machine that recorded them.
+They are stored with that machine's time for a fixed calibration workload,
+which every run times again: expected times are scaled by the ratio, so a
+faster or slower machine neither fails nor hides a regression. The scaling
+is approximate (stages don't all lean on the CPU, memory and NumPy the same
+way), so rerun with --update after moving to a very different machine or
+deliberately changing a stage.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from alert_rules import parse_rules  # noqa: E402
+from backtest import apply_levels, replay_books  # noqa: E402
+from depth_stream import AggregatedView, LocalOrderBook, PriceScale  # noqa: E402
+from microstructure import MicrostructureTracker  # noqa: E402
+from orderbook import (BookFrame, CancellationDetector, SymbolAnalyzer, find_cancellations,  # noqa: E402
+                       group_orders, group_orders_array)
+from recorder import KIND_SNAPSHOT, SIDE_BID, OrderBookRecorder, read_records  # noqa: E402
+
+from bench_cancellations import pandas_cancellations  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+SIZES = [1_000, 5_000, 50_000]  # levels per side
+EVENTS = 500  # diffs per session
+LEVELS_PER_EVENT = 10
+FRAMES = 20  # books handed to analysis and the GUI per run
+SYMBOL = 'BTCUSDT'
+SCALE = PriceScale('0.01', '0.00001')
+# 7 ticks, so buckets don't line up with round prices; at 1.0 and 10.0 many
+# prices fall exactly between two buckets and must go to the even one
+GROUP_INTERVAL = 0.07
+VIEW_INTERVALS = (0.07, 1.0, 10.0)
+TOLERANCE = 0.5  # allowed slowdown over the baseline
+MEMORY_TOLERANCE = 0.25  # allowed growth of the peak over the baseline
+SLACK_SECONDS = 0.0005  # absolute timing noise allowed on top, for sub-millisecond stages
+RULES = {'rules': [
+    {'name': 'relative-walls', 'type': 'wall', 'multiple': 20},
+    {'name': 'near-mid', 'type': 'wall', 'min_amount': 2, 'within': 0.001},
+    {'name': 'pulled', 'type': 'cancellation', 'percent': 80, 'min_amount': 1},
+]}
+
+# One order book session: snapshot, then diffs, also recorded for `symbol`
+# in `directory` up to timestamp `end`
+Session = namedtuple('Session', ['source', 'symbol', 'levels', 'scale', 'snapshot', 'events', 'directory', 'end'])
+
+
+def synthetic_session(levels, directory, seed=42):
+    # Binance sends strings, so the session does too. Diffs hit the top of the
+    # book hardest and reach a little past the snapshot's depth.
+    rng = np.random.default_rng(seed)
+    mid = 6_000_000  # ticks
+    snapshot = {
+        'lastUpdateId': 1000,
+        'bids': [[f"{(mid - 1 - i) / 100:.2f}", f"{amount:.5f}"] for i, amount in enumerate(rng.exponential(0.5, levels))],
+        'asks': [[f"{(mid + i) / 100:.2f}", f"{amount:.5f}"] for i, amount in enumerate(rng.exponential(0.5, levels))],
+    }
+    events = []
+    for update_id in range(1001, 1001 + EVENTS):
+        offsets = np.minimum(rng.geometric(0.01, (2, LEVELS_PER_EVENT)) - 1, int(levels * 1.1))
+        amounts = np.where(rng.random((2, LEVELS_PER_EVENT)) < 0.3, 0.0, rng.exponential(0.5, (2, LEVELS_PER_EVENT)))
+        events.append({
+            'e': 'depthUpdate', 'U': update_id, 'u': update_id,
+            'b': [[f"{(mid - 1 - offset) / 100:.2f}", f"{amount:.5f}"] for offset, amount in zip(offsets[0], amounts[0])],
+            'a': [[f"{(mid + offset) / 100:.2f}", f"{amount:.5f}"] for offset, amount in zip(offsets[1], amounts[1])],
+        })
+
+    start = 1_700_000_000.0
+    recorder = OrderBookRecorder(directory, max_queue=EVENTS + 1)
+    recorder.start()
+    recorder.record_snapshot(SYMBOL, snapshot, start)
+    for index, event in enumerate(events, 1):
+        recorder.record_diff(SYMBOL, event, start + index * 0.1)
+    recorder.stop()
+    return Session('synthetic', SYMBOL, levels, SCALE, snapshot, events, directory, start + EVENTS * 0.1)
+
+
+def recorded_messages(chunks):
+    # Split recorded rows back into messages, as replay_books does
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        boundaries = np.flatnonzero((np.diff(chunk['update_id']) != 0) | (np.diff(chunk['kind']) != 0) |
+                                    (np.diff(chunk['timestamp']) != 0)) + 1
+        yield from np.split(chunk, boundaries)
+
+
+def recorded_session(levels, directory, symbol):
+    # First snapshot of the recording cut to `levels` per side, then the diffs after it
+    snapshot, events, end = None, [], None
+    for message in recorded_messages(read_records(directory, symbol)):
+        kind, update_id = message['kind'][0], int(message['update_id'][0])
+        if snapshot is None:
+            if kind != KIND_SNAPSHOT:
+                continue
+            is_bid = message['side'] == SIDE_BID
+            bids = np.column_stack((message['price'][is_bid], message['amount'][is_bid]))
+            asks = np.column_stack((message['price'][~is_bid], message['amount'][~is_bid]))
+            snapshot = {'lastUpdateId': update_id,
+                        'bids': bids[np.argsort(-bids[:, 0])][:levels].tolist(),
+                        'asks': asks[np.argsort(asks[:, 0])][:levels].tolist()}
+            last_id = update_id
+        elif kind == KIND_SNAPSHOT:
+            break
+        elif update_id > last_id:
+            is_bid = message['side'] == SIDE_BID
+            events.append({'e': 'depthUpdate', 'U': last_id + 1, 'u': update_id,
+                           'b': np.column_stack((message['price'][is_bid], message['amount'][is_bid])).tolist(),
+                           'a': np.column_stack((message['price'][~is_bid], message['amount'][~is_bid])).tolist()})
+            last_id, end = update_id, float(message['timestamp'][0])
+            if len(events) == EVENTS:
+                break
+    if snapshot is None or not events:
+        raise SystemExit(f"No snapshot followed by diffs for {symbol} in {directory}")
+    return Session('recorded', symbol, levels, PriceScale(), snapshot, events, directory, end)
+
+
+def loaded_book(session, intervals=VIEW_INTERVALS, events=()):
+    book = LocalOrderBook(intervals=intervals, scale=session.scale, microstructure=MicrostructureTracker())
+    book.load_snapshot(session.snapshot)
+    for event in events:
+        book.apply_diff(event)
+    return book
+
+
+def reference_book(session):
+    # Float dict replay, the way backtest rebuilds books, converted to ticks
+    bids = dict(np.array(session.snapshot['bids'], dtype=float).tolist())
+    asks = dict(np.array(session.snapshot['asks'], dtype=float).tolist())
+    for event in session.events:
+        for levels, updates in ((bids, event['b']), (asks, event['a'])):
+            rows = np.array(updates, dtype=float).reshape(-1, 2)
+            apply_levels(levels, {'price': rows[:, 0], 'amount': rows[:, 1]})
+    return {side: {session.scale.price_ticks(price): session.scale.qty_units(amount)
+                   for price, amount in levels.items()} for side, levels in (('bids', bids), ('asks', asks))}
+
+
+def book_frames(session, count=FRAMES):
+    # Grouped frames of the book as the session's diffs are applied
+    book = loaded_book(session, intervals=(GROUP_INTERVAL,))
+    # Walls are the top 1% of grouped levels
+    threshold = float(np.quantile(book.aggregated(GROUP_INTERVAL)['bids'][:, 1], 0.99)) * session.scale.step_size
+    settings = {'group_interval': GROUP_INTERVAL, 'large_wall_threshold': threshold,
+                'cancellation_threshold': threshold / 2, 'notification_cooldown': 3600}
+    rules = (1, parse_rules(RULES, 3600))
+    frames = []
+    per_frame = max(len(session.events) // count, 1)
+    for index in range(count):
+        for event in session.events[index * per_frame:(index + 1) * per_frame]:
+            book.apply_diff(event)
+        grouped = book.aggregated(GROUP_INTERVAL)
+        frames.append(BookFrame(SYMBOL, 1_700_000_000.0 + index, session.scale, grouped['bids'], grouped['asks'],
+                                settings, book.microstructure.values(), rules))
+    return frames
+
+
+# Stages: each returns (setup, run, verify). Only run(state) is measured;
+# verify(state, result) returns an error message or None.
+
+def stage_group_orders(session):
+    def run(_):
+        return (group_orders_array(session.snapshot['bids'], GROUP_INTERVAL),
+                group_orders_array(session.snapshot['asks'], GROUP_INTERVAL))
+
+    def verify(_, result):
+        for levels, grouped in zip((session.snapshot['bids'], session.snapshot['asks']), result):
+            if not np.allclose(np.array(group_orders(levels, GROUP_INTERVAL)), grouped):
+                return "group_orders_array disagrees with group_orders"
+    return lambda: None, run, verify
+
+
+def stage_snapshot_load(session):
+    def run(_):
+        return loaded_book(session)
+
+    def verify(_, book):
+        expected = session.scale.parse_levels(session.snapshot['bids'])
+        if book.bids != dict(expected.tolist()) or len(book.asks) != len(session.snapshot['asks']):
+            return "loaded book differs from the snapshot"
+    return lambda: None, run, verify
+
+
+def stage_diff_apply(session):
+    def run(book):
+        for event in session.events:
+            book.apply_diff(event)
+        return book
+
+    def verify(_, book):
+        expected = reference_book(session)
+        if book.bids != expected['bids'] or book.asks != expected['asks']:
+            return "live book differs from a dict replay of the same diffs"
+    return lambda: loaded_book(session), run, verify
+
+
+def stage_group_views(session):
+    def run(book):
+        return [AggregatedView(interval, book.bids, book.asks, session.scale).arrays() for interval in VIEW_INTERVALS]
+
+    def verify(book, views):
+        # Views kept up to date by the diffs must match views built from scratch
+        for interval, built in zip(VIEW_INTERVALS, views):
+            cached = book.aggregated(interval)
+            if not all(np.array_equal(cached[side], built[side]) for side in ('bids', 'asks')):
+                return f"incrementally updated view at {interval} differs from a rebuilt one"
+        # In ticks and units group_orders' float division is exact at the halves
+        levels = list(book.bids.items())
+        for interval, built in zip(VIEW_INTERVALS, views):
+            reference = np.array(group_orders(levels, session.scale.interval_ticks(interval)))
+            if not np.allclose(reference, built['bids']):
+                return f"grouped view at {interval} disagrees with group_orders"
+    return lambda: loaded_book(session, events=session.events), run, verify
+
+
+def stage_analyze(session):
+    frames = book_frames(session)
+
+    def run(analyzer):
+        return [analyzer.analyze(frame) for frame in frames]
+
+    def verify(_, results):
+        # A fresh analyzer reports every level above the threshold of the first frame once
+        frame = frames[0]
+        threshold = frame.scale.qty_units(frame.settings['large_wall_threshold'])
+        expected = sum(int(np.count_nonzero(side[:, 1] > threshold)) for side in (frame.bids, frame.asks))
+        reported = sum(1 for message, _ in results[0]['alerts'] if 'wall detected' in message)
+        if reported != expected:
+            return f"{reported} walls reported on the first frame, expected {expected}"
+    return lambda: SymbolAnalyzer(SYMBOL), run, verify
+
+
+def stage_detect_cancellations(session):
+    frames = [{'bids': session.scale.to_decimal(frame.bids), 'asks': session.scale.to_decimal(frame.asks)}
+              for frame in book_frames(session)]
+    threshold = frames[0]['bids'][:, 1].max() / 4
+
+    def run(detector):
+        pairwise = [find_cancellations(previous['bids'], current['bids'], threshold, 'bid')
+                    for previous, current in zip(frames, frames[1:])]
+        windowed = [detector.update(frame, threshold) for frame in frames]
+        return pairwise, windowed
+
+    def verify(_, result):
+        for previous, current, events in zip(frames, frames[1:], result[0]):
+            expected = pandas_cancellations(previous['bids'], current['bids'], threshold)
+            found = np.column_stack((events['price'], events['cancelled']))
+            if len(expected) != len(found) or (len(found) and not np.allclose(np.array(expected), found)):
+                return "find_cancellations disagrees with the pandas merge"
+    return CancellationDetector, run, verify
+
+
+def stage_replay(session):
+    def run(_):
+        return list(replay_books(read_records(session.directory, session.symbol, end=session.end), step=1.0))
+
+    def verify(_, books):
+        if not books:
+            return "nothing replayed"
+        if session.source != 'synthetic':
+            return None  # the full recording holds more depth than the cut snapshot
+        expected = reference_book(session)
+        _, bids, asks = books[-1]
+        for side, levels in (('bids', bids), ('asks', asks)):
+            replayed = {session.scale.price_ticks(price): session.scale.qty_units(amount)
+                        for price, amount in levels.tolist()}
+            if replayed != expected[side]:
+                return f"replayed {side} differ from the live book"
+    return lambda: None, run, verify
+
+
+def stage_gui_render(session):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtWidgets import QApplication
+    from orderbook_gui import OrderBookGUI
+
+    class OfflineGUI(OrderBookGUI):
+        # The window without its network-backed monitor
+        def start_update_thread(self):
+            pass
+
+    app = QApplication.instance() or QApplication([sys.argv[0]])
+    books = [(session.scale.to_decimal(frame.bids)[::-1], session.scale.to_decimal(frame.asks))
+             for frame in book_frames(session)]
+
+    def setup():
+        window = OfflineGUI()
+        window.show()
+        app.processEvents()
+        return window
+
+    def run(window):
+        for book in books:
+            window.update_order_book(book)
+            window.repaint()
+            app.processEvents()
+        return window
+
+    def verify(window, _):
+        bids, asks = books[-1]
+        model = window.order_book_model
+        if model.rowCount() != len(bids) + len(asks) + 1 or model.prices[-1] != bids[-1, 0]:
+            return "table rows don't match the last book"
+        window.close()
+    return setup, run, verify
+
+
+STAGES = {
+    'group_orders': stage_group_orders,
+    'snapshot_load': stage_snapshot_load,
+    'diff_apply': stage_diff_apply,
+    'group_views': stage_group_views,
+    'analyze': stage_analyze,
+    'detect_cancellations': stage_detect_cancellations,
+    'replay': stage_replay,
+    'gui_render': stage_gui_render,
+}
+
+
+def measure(setup, run, verify, repeat):
+    best, result, state = float('inf'), None, None
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        result = run(state)
+        best = min(best, time.perf_counter() - start)
+    error = verify(state, result)
+
+    state = setup()
+    tracemalloc.start()
+    run(state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, error
+
+
+def calibrate(repeat=5):
+    """Best time of a fixed mix of interpreter, dict and NumPy sorting work, the stages' staples."""
+    values = np.random.default_rng(0).integers(0, 1_000_000, 200_000)
+    prices = values[:50_000].tolist()
+
+    def work():
+        levels = {}
+        for price in prices:
+            levels[price // 7] = levels.get(price // 7, 0) + price
+        np.unique(values // 7, return_counts=True)
+        np.sort(values)
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        work()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def load_baseline(path):
+    # (results, calibration seconds); older baselines have no calibration
+    if not os.path.exists(path):
+        return {}, None
+    with open(path) as f:
+        baseline = json.load(f)
+    return baseline.get('results', {}), baseline.get('calibration_seconds')
+
+
+def save_baseline(path, results, calibration):
+    baseline = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': f"{platform.system()} {platform.machine()} {platform.processor()}".strip(),
+        'calibration_seconds': round(calibration, 6),
+        'results': dict(sorted(results.items())),
+    }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2)
+        f.write('\n')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time and check the order book hot paths against baselines")
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)), help="levels per side, comma-separated")
+    parser.add_argument('--stages', default=','.join(STAGES), help="stages to run, comma-separated")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per stage, the best counts")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="allowed slowdown, 0.5 = 50%%")
+    parser.add_argument('--memory-tolerance', type=float, default=MEMORY_TOLERANCE, help="allowed peak growth")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument('--update', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--recording', help="recording directory to take books from instead of synthetic ones")
+    parser.add_argument('--symbol', default=SYMBOL, help="symbol of the recording")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stages = args.stages.split(',')
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        raise SystemExit(f"Unknown stage(s): {', '.join(unknown)}")
+    baseline, baseline_calibration = load_baseline(args.baseline)
+    calibration = calibrate()
+    # Baseline times scaled to this machine, which is also what --update keeps of them
+    speed = calibration / baseline_calibration if baseline_calibration else 1.0
+    baseline = {key: dict(expected, seconds=round(expected['seconds'] * speed, 6))
+                for key, expected in baseline.items()}
+    results, failures = {}, []
+
+    print(f"calibration {calibration * 1000:.1f}ms"
+          + (f", baseline machine {baseline_calibration * 1000:.1f}ms: baseline times scaled by {speed:.2f}"
+             if baseline_calibration else ", baseline not calibrated: times compared as recorded"))
+
+    print(f"{'stage':<22}{'levels':>8}{'best ms':>11}{'base ms':>10}{'peak KB':>10}{'base KB':>10}  status")
+    for levels in map(int, args.sizes.split(',')):
+        directory = tempfile.mkdtemp(prefix='orderbook-bench-')
+        try:
+            if args.recording:
+                session = recorded_session(levels, args.recording, args.symbol)
+            else:
+                session = synthetic_session(levels, directory)
+            for name in stages:
+                key = f"{session.source}/{name}/{levels}"
+                try:
+                    setup, run, verify = STAGES[name](session)
+                except ImportError as e:
+                    print(f"{name:<22}{levels:>8}  skipped ({e})")
+                    continue
+                seconds, peak, error = measure(setup, run, verify, args.repeat if levels < 50_000 else 2)
+                results[key] = {'seconds': round(seconds, 6), 'peak_kb': round(peak / 1024)}
+
+                status, expected = [], baseline.get(key)
+                if error:
+                    status.append(f"WRONG: {error}")
+                if expected and seconds > expected['seconds'] * (1 + args.tolerance) + SLACK_SECONDS:
+                    status.append(f"SLOWER {seconds / expected['seconds']:.2f}x")
+                if expected and peak / 1024 > expected['peak_kb'] * (1 + args.memory_tolerance):
+                    status.append(f"MEMORY {peak / 1024 / max(expected['peak_kb'], 1):.2f}x")
+                failures += [f"{key}: {message}" for message in status]
+                print(f"{name:<22}{levels:>8}{seconds * 1000:>11.2f}"
+                      f"{expected['seconds'] * 1000 if expected else float('nan'):>10.2f}"
+                      f"{peak / 1024:>10.0f}{expected['peak_kb'] if expected else float('nan'):>10.0f}  "
+                      f"{', '.join(status) or ('ok' if expected else 'new')}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    if args.update:
+        wrong = [failure for failure in failures if 'WRONG' in failure]
+        if wrong:
+            print("Not updating the baseline while results are wrong")
+            return 1
+        save_baseline(args.baseline, {**baseline, **results}, calibration)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""Replay a day of synthetic market data and check that memory stays flat.
+
+Run from the repository root; exits non-zero when RSS keeps growing after
+the warm-up or a bounded structure outgrows its limit:
+
+    python benchmarks/soak.py                        # 24 simulated hours
+    python benchmarks/soak.py --hours 6 --unbounded  # MAX_BOOK_LEVELS = 0, for comparison
+
+The market is a random walk that drifts far enough that the levels the
+diff stream leaves behind would pile up without MAX_BOOK_LEVELS. Every
+simulated second one diff goes through the live book; every
+ANALYSIS_SECONDS a frame goes through analysis (walls, cancellations and the
+example alert rules), publication and, when PyQt6 is available, an offscreen
+GUI's table and log. RSS and the memory report are printed every simulated
+hour.
+
+The synthetic walls come and go at random, so alerts fire all day. The
+counts per kind are printed at the end; they match the --unbounded run's,
+as levels dropped by MAX_BOOK_LEVELS never alert.
+"""
+import argparse
+import collections
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import orderbook  # noqa: E402
+from alert_rules import AlertRuleFile  # noqa: E402
+from depth_stream import PriceScale  # noqa: E402
+from metrics import process_rss  # noqa: E402
+
+SYMBOL = 'BTCUSDT'
+SCALE = PriceScale('0.01', '0.00001')
+START_MID = 6_000_000  # ticks
+DRIFT_TICKS = 80  # standard deviation of the mid's move per second
+REACH_TICKS = 2000  # levels are updated within this distance of the mid
+UPDATES = 60  # level updates per diff
+ANALYSIS_SECONDS = 10
+RSS_SLACK_MB = 4  # RSS growth allowed after the warm-up
+RULES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'alert_rules.example.json')
+
+
+class Market:
+    # Random-walk mid with levels churning around it and walls that come and go
+    def __init__(self, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.mid = START_MID
+        self.update_id = 1
+
+    def snapshot(self, levels=5000):
+        amounts = self.rng.exponential(0.5, (2, levels))
+        return {'lastUpdateId': self.update_id,
+                'bids': [[f"{(self.mid - 1 - i) / 100:.2f}", f"{amount:.5f}"] for i, amount in enumerate(amounts[0])],
+                'asks': [[f"{(self.mid + 1 + i) / 100:.2f}", f"{amount:.5f}"] for i, amount in enumerate(amounts[1])]}
+
+    def diff(self):
+        rng = self.rng
+        previous, self.mid = self.mid, self.mid + int(rng.normal(0, DRIFT_TICKS))
+        offsets = rng.integers(1, REACH_TICKS, (2, UPDATES))
+        amounts = rng.exponential(0.5, (2, UPDATES))
+        amounts[rng.random((2, UPDATES)) < 0.3] = 0  # deletions
+        amounts[rng.random((2, UPDATES)) < 0.005] = 50  # walls
+        bids = [[(self.mid - offset) / 100, amount] for offset, amount in zip(offsets[0], amounts[0])]
+        asks = [[(self.mid + offset) / 100, amount] for offset, amount in zip(offsets[1], amounts[1])]
+        # Levels the mid moved through are emptied, so the book never crosses
+        bids += [[price / 100, 0] for price in range(self.mid, previous + 1)]
+        asks += [[price / 100, 0] for price in range(previous, self.mid + 1)]
+        self.update_id += 1
+        return {'e': 'depthUpdate', 'U': self.update_id, 'u': self.update_id,
+                'b': [[f"{price:.2f}", f"{amount:.5f}"] for price, amount in bids],
+                'a': [[f"{price:.2f}", f"{amount:.5f}"] for price, amount in asks]}
+
+
+def offscreen_gui(monitor):
+    # The real window without its polling thread, or None without PyQt6
+    try:
+        from PyQt6.QtWidgets import QApplication
+        from orderbook_gui import OrderBookGUI
+    except ImportError:
+        return None, None
+
+    class SoakGUI(OrderBookGUI):
+        def start_update_thread(self):
+            self.monitor = monitor
+
+    app = QApplication.instance() or QApplication([sys.argv[0]])
+    return app, SoakGUI()
+
+
+def alert_kind(message):
+    if 'spoofing' in message or 'pulled' in message:
+        return 'cancellations'
+    return 'walls' if 'wall' in message else 'other'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--hours', type=float, default=24)
+    parser.add_argument('--unbounded', action='store_true', help="keep every book level (MAX_BOOK_LEVELS = 0)")
+    args = parser.parse_args()
+
+    if args.unbounded:
+        orderbook.MAX_BOOK_LEVELS = 0
+    orderbook.alert_rules = AlertRuleFile(RULES_FILE)
+    orderbook.default_settings[SYMBOL] = {"group_interval": 1, "large_wall_threshold": 40,
+                                          "cancellation_threshold": 20}
+    alerts = collections.Counter()
+    orderbook.send_telegram_notification = lambda message, priority=None: alerts.update((alert_kind(message),))
+
+    market = Market()
+    monitor = orderbook.MultiSymbolMonitor([SYMBOL], feed=lambda symbols, stop_event: iter(()), max_workers=1)
+    symbol_monitor = monitor.monitors[SYMBOL]
+    depth_stream = symbol_monitor.depth_stream
+    depth_stream.scale = SCALE
+    depth_stream.book.load_snapshot(market.snapshot(), SCALE)
+    app, gui = offscreen_gui(monitor)
+
+    seconds = int(args.hours * 3600)
+    warmup = max(min(3600, seconds // 2), seconds // 4)
+    level_limit = 2 * (orderbook.MAX_BOOK_LEVELS + orderbook.MAX_BOOK_LEVELS // 10)
+    samples = []
+    largest_book = 0
+    start = time.perf_counter()
+    print(f"{'hour':>5} {'rss MB':>8} {'levels':>7} {'buckets':>8} {'walls':>6} {'rules':>6} {'log':>5}")
+    for second in range(1, seconds + 1):
+        depth_stream.handle(market.diff())
+        if second % ANALYSIS_SECONDS:
+            continue
+        frame = symbol_monitor.frame()._replace(time=float(second))
+        result = symbol_monitor.executor.submit(orderbook.analyze_frame, frame).result()
+        symbol_monitor.publish(frame, result)
+        if gui is not None:
+            gui.update_log(result['analysis'])
+            gui.update_order_book(symbol_monitor.display())
+            app.processEvents()
+        if second % 3600 == 0 or second == seconds:
+            usage = symbol_monitor.memory_usage()
+            rss = process_rss() / 2 ** 20
+            samples.append((second, rss))
+            largest_book = max(largest_book, usage['book_levels'])
+            log_lines = gui.log_output.document().blockCount() if gui is not None else 0
+            print(f"{second / 3600:5.1f} {rss:8.1f} {usage['book_levels']:7d} {usage['view_buckets']:8d} "
+                  f"{usage['tracked_walls']:6d} {usage['rule_entries']:6d} {log_lines:5d}", flush=True)
+
+    print(f"{seconds / 3600:g} simulated hours in {time.perf_counter() - start:.0f}s, {sum(alerts.values())} alerts: "
+          + ", ".join(f"{count} {kind}" for kind, count in sorted(alerts.items())))
+    settled = [rss for second, rss in samples if second >= warmup]
+    growth = settled[-1] - settled[0]
+    limits = [(growth <= RSS_SLACK_MB,
+               f"RSS grew {growth:+.1f}MB after the {warmup / 3600:g}h warm-up (allowed {RSS_SLACK_MB}MB)")]
+    if orderbook.MAX_BOOK_LEVELS:
+        limits.append((largest_book <= level_limit,
+                       f"book held at most {largest_book} levels (limit {level_limit} for both sides)"))
+    if gui is not None:
+        log_lines = gui.log_output.document().blockCount()
+        limits.append((log_lines <= orderbook.LOG_MAX_LINES,
+                       f"GUI log held {log_lines} lines (limit {orderbook.LOG_MAX_LINES})"))
+    for within, message in limits:
+        print(f"{'ok  ' if within else 'OVER'} {message}")
+    monitor.stop()
+    return 0 if all(within for within, _ in limits) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,679 @@
+import itertools
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+import requests
+import requests.adapters
+import numpy as np
+
+from metrics import metrics
+
+DEPTH_URL = "https://api.binance.com/api/v3/depth"
+EXCHANGE_INFO_URL = "https://api.binance.com/api/v3/exchangeInfo"
+EXCHANGE_INFO_WEIGHT = 20
+DEPTH_LIMITS = (100, 500, 1000, 5000)  # cheapest first, see depth_request_weight
+STREAM_URL = "wss://stream.binance.com:9443/ws/{stream}"
+COMBINED_STREAM_URL = "wss://stream.binance.com:9443/stream?streams={streams}"
+
+
+class BookGapError(Exception):
+    """Raised when a diff event does not follow the last applied update ID."""
+
+
+def price_decimals(step):
+    """Decimals that show every price on a grid of `step`, never fewer than cents."""
+    return max(2, -math.floor(math.log10(step) + 1e-9))
+
+
+class PriceScale:
+    """Fixed-point units of one symbol: prices in ticks, quantities in lot steps.
+
+    The book core keeps both as integers so bucketing is exact and levels hash
+    and compare as plain ints. Floats are produced only for display and alerts.
+    """
+
+    def __init__(self, tick_size='0.00000001', step_size='0.00000001'):
+        self.tick_size = float(tick_size)
+        self.step_size = float(step_size)
+        self.price_factor = 1 / self.tick_size
+        self.qty_factor = 1 / self.step_size
+        self.decimals = price_decimals(self.tick_size)
+
+    def __repr__(self):
+        return f"PriceScale(tick_size={self.tick_size:g}, step_size={self.step_size:g})"
+
+    def price_ticks(self, price):
+        return round(float(price) * self.price_factor)
+
+    def qty_units(self, amount):
+        return round(float(amount) * self.qty_factor)
+
+    def interval_ticks(self, interval):
+        # Group intervals below one tick group nothing
+        return max(1, round(interval * self.price_factor))
+
+    def parse_levels(self, levels):
+        """Parse [price, amount] string pairs into an (n, 2) int64 array of ticks and units."""
+        values = np.array(levels, dtype=float).reshape(-1, 2)
+        values[:, 0] *= self.price_factor
+        values[:, 1] *= self.qty_factor
+        return np.rint(values).astype(np.int64)
+
+    def to_decimal(self, levels):
+        """Convert (n, 2) tick/unit levels back to float prices and amounts."""
+        levels = np.asarray(levels).reshape(-1, 2)
+        return np.column_stack((levels[:, 0] * self.tick_size, levels[:, 1] * self.step_size))
+
+
+# Binance quotes every price and quantity with 8 decimals, so this is exact
+# for any symbol until its real tick and step sizes are known
+DEFAULT_SCALE = PriceScale()
+
+
+class AggregatedView:
+    """The book bucketed at one group interval, kept up to date level by level.
+
+    Buckets are keyed by the rounded price in ticks and hold the summed
+    quantity in lot units. Integer sums are exact, so a bucket is dropped
+    exactly when its last level goes. Halves round to the even bucket, like
+    round() in group_orders and group_orders_array.
+    """
+
+    def __init__(self, interval, bids, asks, scale=DEFAULT_SCALE):
+        self.interval = interval
+        self.step = scale.interval_ticks(interval)
+        self.last_used = time.monotonic()
+        self.sides = {'bids': self._build(bids), 'asks': self._build(asks)}
+        self._arrays = None
+
+    def _bucket(self, price):
+        quotient, remainder = divmod(price, self.step)
+        if 2 * remainder > self.step or (2 * remainder == self.step and quotient % 2):
+            quotient += 1
+        return quotient * self.step
+
+    def _build(self, levels):
+        buckets = {}
+        for price, amount in levels.items():
+            bucket = self._bucket(price)
+            buckets[bucket] = buckets.get(bucket, 0) + amount
+        return buckets
+
+    def update(self, side, price, old_amount, new_amount):
+        buckets = self.sides[side]
+        bucket = self._bucket(price)
+        amount = buckets.get(bucket, 0) - (old_amount or 0) + (new_amount or 0)
+        if amount:
+            buckets[bucket] = amount
+        else:
+            buckets.pop(bucket, None)
+        self._arrays = None
+
+    def arrays(self):
+        """Return {'bids', 'asks'} as (n, 2) int64 arrays of ticks and units, sorted by price ascending."""
+        if self._arrays is None:
+            self._arrays = {side: self._to_array(buckets) for side, buckets in self.sides.items()}
+        return self._arrays
+
+    @staticmethod
+    def _to_array(buckets):
+        levels = np.fromiter(itertools.chain.from_iterable(buckets.items()), dtype=np.int64,
+                             count=2 * len(buckets)).reshape(-1, 2)
+        levels = levels[np.argsort(levels[:, 0])]
+        # Handed to other threads and stages as is, so make sharing safe
+        levels.flags.writeable = False
+        return levels
+
+
+class LocalOrderBook:
+    """In-memory order book kept in sync from one snapshot plus depth diffs.
+
+    Levels are stored at full resolution as price ticks -> quantity units in
+    ``scale``, set with each snapshot. Binance sequencing
+    rules apply: events older than the snapshot are dropped, the first applied
+    event must straddle ``lastUpdateId + 1`` and every later event must start
+    exactly one after the previous event's final update ID.
+
+    Grouped views are cached per interval and updated with every level change,
+    so reading the book at another interval is a lookup. ``intervals`` are
+    built with each snapshot and always kept; others are built on first use
+    and dropped once unused for ``view_ttl`` seconds, or beyond ``max_views``.
+
+    With a ``microstructure`` tracker, its metrics follow every level change
+    the same way.
+
+    With ``max_levels``, each side keeps only that many levels nearest the
+    top. Binance stops updating levels far from the best price, so as the
+    price drifts they would otherwise stay forever. Sides are pruned once
+    they are a tenth over the limit, so the sort is amortized over many
+    diffs.
+    """
+
+    def __init__(self, intervals=(), max_views=8, view_ttl=300.0, scale=DEFAULT_SCALE, microstructure=None,
+                 max_levels=0):
+        self.scale = scale
+        self.microstructure = microstructure
+        self.max_levels = max_levels
+        self.bids = {}
+        self.asks = {}
+        self.last_update_id = None
+        self.last_event_time = None
+        self.changes = 0  # level updates applied, for activity rates
+        self._synced = False
+        self.intervals = tuple(intervals)
+        self.max_views = max_views
+        self.view_ttl = view_ttl
+        self.views = OrderedDict()
+
+    @property
+    def is_synced(self):
+        return self._synced
+
+    def load_snapshot(self, snapshot, scale=None):
+        if 'bids' not in snapshot or 'asks' not in snapshot or 'lastUpdateId' not in snapshot:
+            raise ValueError("Invalid depth snapshot: missing 'bids', 'asks' or 'lastUpdateId'")
+        if scale is not None:
+            self.scale = scale
+        self.load_levels(self.scale.parse_levels(snapshot['bids']), self.scale.parse_levels(snapshot['asks']),
+                         snapshot['lastUpdateId'])
+
+    def load_levels(self, bids, asks, last_update_id):
+        """Load (n, 2) tick/unit arrays in the current scale as an unsynced book at ``last_update_id``."""
+        self.bids = dict(bids.tolist())
+        self.asks = dict(asks.tolist())
+        self.last_update_id = last_update_id
+        self.last_event_time = time.time()
+        self._synced = False
+
+        others = [interval for interval in self.views if interval not in self.intervals]
+        others = others[len(others) - max(self.max_views - len(self.intervals), 0):]
+        self.views = OrderedDict((interval, AggregatedView(interval, self.bids, self.asks, self.scale))
+                                 for interval in others + list(self.intervals))
+        if self.microstructure is not None:
+            self.microstructure.load(self.bids, self.asks, self.scale)
+
+    def set_intervals(self, intervals):
+        """Keep ``intervals`` ready from now on, building their views now if a book is loaded."""
+        self.intervals = tuple(intervals)
+        if self.last_update_id is not None:
+            for interval in self.intervals:
+                if interval not in self.views:
+                    self.views[interval] = AggregatedView(interval, self.bids, self.asks, self.scale)
+        self._evict_views(time.monotonic())
+
+    def apply_diff(self, event):
+        """Apply one ``depthUpdate`` event.
+
+        Returns False if the event is older than the book and was ignored,
+        True if it was applied. Raises BookGapError on a sequence gap.
+        """
+        if self.last_update_id is None:
+            raise BookGapError("No snapshot loaded")
+
+        first_id, final_id = event['U'], event['u']
+        if final_id <= self.last_update_id:
+            return False
+
+        if self._synced:
+            if first_id != self.last_update_id + 1:
+                raise BookGapError(f"Expected update {self.last_update_id + 1}, got {first_id}")
+        elif not first_id <= self.last_update_id + 1 <= final_id:
+            raise BookGapError(f"First event {first_id}-{final_id} does not cover {self.last_update_id + 1}")
+
+        self._apply_levels('bids', self.bids, event['b'])
+        self._apply_levels('asks', self.asks, event['a'])
+        if self.max_levels:
+            limit = self.max_levels + self.max_levels // 10
+            if len(self.bids) > limit:
+                self._prune('bids', self.bids)
+            if len(self.asks) > limit:
+                self._prune('asks', self.asks)
+        self.last_update_id = final_id
+        self.last_event_time = time.time()
+        self.changes += len(event['b']) + len(event['a'])
+        self._synced = True
+        if self.microstructure is not None:
+            self.microstructure.after_event(self.last_event_time)
+        return True
+
+    def _apply_levels(self, side, levels, updates):
+        views = self.views.values()
+        microstructure = self.microstructure
+        price_factor = self.scale.price_factor
+        qty_factor = self.scale.qty_factor
+        for price, amount in updates:
+            price = round(float(price) * price_factor)
+            amount = round(float(amount) * qty_factor)
+            old_amount = levels.get(price)
+            if amount == 0:
+                if old_amount is None:
+                    continue
+                del levels[price]
+                amount = None
+            else:
+                levels[price] = amount
+            for view in views:
+                view.update(side, price, old_amount, amount)
+            if microstructure is not None:
+                microstructure.update(side, price, old_amount, amount)
+
+    def _prune(self, side, levels):
+        # Drop the levels furthest from the top, down to max_levels
+        prices = np.fromiter(levels, dtype=np.int64, count=len(levels))
+        if side == 'bids':
+            cutoff = np.partition(prices, len(prices) - self.max_levels - 1)[len(prices) - self.max_levels - 1]
+            removed = prices[prices <= cutoff]
+        else:
+            cutoff = np.partition(prices, self.max_levels)[self.max_levels]
+            removed = prices[prices >= cutoff]
+        views = self.views.values()
+        microstructure = self.microstructure
+        for price in removed.tolist():
+            old_amount = levels.pop(price)
+            for view in views:
+                view.update(side, price, old_amount, None)
+            if microstructure is not None:
+                microstructure.update(side, price, old_amount, None)
+        metrics.inc('levels_pruned', len(removed))
+
+    def aggregated(self, interval):
+        """Return the book grouped at ``interval`` as sorted (n, 2) int64 arrays per side.
+
+        The arrays are shared with later callers until the view changes and
+        are read-only.
+        """
+        now = time.monotonic()
+        view = self.views.get(interval)
+        if view is None:
+            view = self.views[interval] = AggregatedView(interval, self.bids, self.asks, self.scale)
+        else:
+            self.views.move_to_end(interval)
+        view.last_used = now
+        self._evict_views(now)
+        return view.arrays()
+
+    def _evict_views(self, now):
+        # Least recently used first, so stop at the first view still in use
+        # once within max_views; views at `intervals` are never dropped
+        excess = len(self.views) - self.max_views
+        for interval in [interval for interval in self.views if interval not in self.intervals]:
+            if excess <= 0 and now - self.views[interval].last_used <= self.view_ttl:
+                break
+            del self.views[interval]
+            excess -= 1
+
+    def level_arrays(self):
+        """Return the book as unsorted (n, 2) int64 tick/unit arrays per side."""
+        return {side: np.fromiter(itertools.chain.from_iterable(levels.items()), dtype=np.int64,
+                                  count=2 * len(levels)).reshape(-1, 2)
+                for side, levels in (('bids', self.bids), ('asks', self.asks))}
+
+    def levels(self):
+        """Return the book as (ticks, units) pairs, bids descending and asks ascending."""
+        bids = [(price, self.bids[price]) for price in sorted(self.bids, reverse=True)]
+        asks = [(price, self.asks[price]) for price in sorted(self.asks)]
+        return {'bids': bids, 'asks': asks}
+
+
+def covering_depth_limit(book, price_range, max_limit=5000):
+    """Return the cheapest depth limit whose levels reach ``price_range`` past the best price on both sides.
+
+    Level density is taken from the book's previous contents; a book that ends
+    inside the range asks for the next limit up. Without levels ``max_limit``.
+    """
+    if not book.bids or not book.asks:
+        return max_limit
+    reach = book.scale.price_ticks(price_range)
+    needed = 0
+    for prices, direction in ((np.fromiter(book.bids, np.int64, len(book.bids)), -1),
+                              (np.fromiter(book.asks, np.int64, len(book.asks)), 1)):
+        distance = (prices - (prices.max() if direction < 0 else prices.min())) * direction
+        if distance.max() < reach:
+            needed = max(needed, len(prices) + 1)
+        else:
+            needed = max(needed, int(np.count_nonzero(distance <= reach)))
+    for limit in DEPTH_LIMITS:
+        if limit >= needed:
+            return min(limit, max_limit)
+    return max_limit
+
+
+def fetch_price_scale(symbol, session=None, budget=None):
+    """Return the symbol's PriceScale from its PRICE_FILTER and LOT_SIZE filters."""
+    response = (session or requests).get(EXCHANGE_INFO_URL, params={'symbol': symbol}, timeout=10)
+    if budget is not None:
+        budget.observe(response)
+    response.raise_for_status()
+    filters = {f['filterType']: f for f in response.json()['symbols'][0]['filters']}
+    return PriceScale(filters['PRICE_FILTER']['tickSize'], filters['LOT_SIZE']['stepSize'])
+
+
+def depth_request_weight(limit):
+    # Request weight of GET /api/v3/depth for a given limit
+    if limit <= 100:
+        return 5
+    if limit <= 500:
+        return 25
+    if limit <= 1000:
+        return 50
+    return 250
+
+
+class RequestWeightBudget:
+    """Sliding one-minute window over the REST request weight spent.
+
+    ``acquire`` blocks until the weight fits in the budget, so all callers
+    sharing one instance stay under the aggregate limit together.
+    """
+
+    def __init__(self, weight_per_minute=3000, window=60.0):
+        self.weight_per_minute = weight_per_minute
+        self.window = window
+        self.spent = deque()
+        self.blocked_until = 0.0
+        self.condition = threading.Condition()
+
+    def used(self):
+        with self.condition:
+            self._expire(time.monotonic())
+            return sum(weight for _, weight in self.spent)
+
+    def acquire(self, weight, stop_event=None):
+        weight = min(weight, self.weight_per_minute)
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif sum(w for _, w in self.spent) + weight <= self.weight_per_minute:
+                    self.spent.append((now, weight))
+                    return True
+                else:
+                    wait = self.spent[0][0] + self.window - now
+                if stop_event is not None and stop_event.is_set():
+                    return False
+                self.condition.wait(min(wait, 1.0) if stop_event is not None else wait)
+
+    def observe(self, response):
+        """Follow the weight Binance reports for this IP and back off on 429/418.
+
+        Weight spent by other clients on the same IP shows up in
+        ``X-MBX-USED-WEIGHT-1M`` and is added to the window. A 429 or 418 blocks
+        every ``acquire`` for the response's ``Retry-After`` seconds.
+        """
+        used = response.headers.get('X-MBX-USED-WEIGHT-1M')
+        with self.condition:
+            now = time.monotonic()
+            self._expire(now)
+            if used is not None:
+                missing = int(used) - sum(weight for _, weight in self.spent)
+                if missing > 0:
+                    self.spent.append((now, missing))
+            if response.status_code in (418, 429):
+                retry_after = response.headers.get('Retry-After')
+                ban = float(retry_after) if retry_after else self.window
+                self.blocked_until = max(self.blocked_until, now + ban)
+                logging.warning(f"REST API answered {response.status_code}, pausing requests for {ban:.0f}s")
+            self.condition.notify_all()
+
+    def _expire(self, now):
+        while self.spent and now - self.spent[0][0] >= self.window:
+            self.spent.popleft()
+
+
+class Backoff:
+    """Exponential backoff with jitter: the n-th delay is drawn from [d/2, d], d = min(cap, base * 2**n)."""
+
+    def __init__(self, base=1.0, cap=60.0):
+        self.base = base
+        self.cap = cap
+        self.failures = 0
+
+    def next_delay(self):
+        delay = min(self.cap, self.base * 2 ** self.failures)
+        self.failures += 1
+        return random.uniform(delay / 2, delay)
+
+    def reset(self):
+        self.failures = 0
+
+
+def create_session(pool_size=10):
+    # One keep-alive session shared by every REST call
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_depth_snapshot(symbol='BTCUSDT', limit=5000, session=None, budget=None):
+    params = {'symbol': symbol, 'limit': limit}
+    with metrics.timer('http'):
+        response = (session or requests).get(DEPTH_URL, params=params, timeout=10)
+    if budget is not None:
+        budget.observe(response)
+    response.raise_for_status()
+    with metrics.timer('json_decode'):
+        return response.json()
+
+
+def binance_combined_depth_feed(symbols, stop_event, speed='100ms'):
+    """Yield ``{"stream": ..., "data": ...}`` messages for many symbols over one connection."""
+    import websocket
+
+    streams = "/".join(f"{symbol.lower()}@depth@{speed}" for symbol in symbols)
+    ws = websocket.create_connection(COMBINED_STREAM_URL.format(streams=streams), timeout=10)
+    try:
+        while not stop_event.is_set():
+            message = ws.recv()
+            if message:
+                yield json.loads(message)
+    finally:
+        ws.close()
+
+
+class ReplayDepthFeed:
+    """Stand-in for Binance that replays recorded or synthetic depth messages.
+
+    Instances are callable like ``binance_combined_depth_feed``. ``messages``
+    are combined-stream wrappers or bare ``depthUpdate`` events (dicts or JSON
+    strings), the latter routed by their ``s`` field as Binance sends it.
+    ``fetch_snapshot`` and ``fetch_scale`` stand in for the REST calls:
+    ``snapshots`` maps each symbol to the snapshots handed out in turn, the
+    last one repeating, cut to the requested limit; ``scales`` to its
+    PriceScale. With ``hold_open`` the feed stays connected after the last
+    message until ``stop_event`` is set, like a quiet stream.
+    """
+
+    def __init__(self, messages, snapshots=None, scales=None, delay=0.0, hold_open=False):
+        self.messages = messages
+        self.snapshots = {symbol: list(values) if isinstance(values, list) else [values]
+                          for symbol, values in (snapshots or {}).items()}
+        self.scales = scales or {}
+        self.delay = delay
+        self.hold_open = hold_open
+        self.requests = []  # (symbol, limit) of every snapshot fetched
+
+    def __call__(self, symbols, stop_event):
+        symbols = {symbol.upper() for symbol in symbols}
+        for message in self.messages:
+            if stop_event.is_set():
+                return
+            message = json.loads(message) if isinstance(message, str) else message
+            if 'stream' not in message:
+                message = {'stream': f"{message['s'].lower()}@depth@100ms", 'data': message}
+            if message['stream'].split('@')[0].upper() in symbols:
+                yield message
+            if self.delay:
+                time.sleep(self.delay)
+        if self.hold_open:
+            stop_event.wait()
+
+    def fetch_snapshot(self, symbol, limit=5000, session=None, budget=None):
+        self.requests.append((symbol, limit))
+        snapshots = self.snapshots[symbol]
+        snapshot = snapshots.pop(0) if len(snapshots) > 1 else snapshots[0]
+        return dict(snapshot, bids=snapshot['bids'][:limit], asks=snapshot['asks'][:limit])
+
+    def fetch_scale(self, symbol, session=None, budget=None):
+        return self.scales.get(symbol, DEFAULT_SCALE)
+
+
+class DepthStream:
+    """Maintains a LocalOrderBook for one symbol from the diff events passed to ``handle``.
+
+    Events are buffered while a REST snapshot is fetched, then replayed on top
+    of it. On a gap the book is dropped and resynced from a new snapshot. With
+    an ``executor`` the snapshot fetch runs there instead of on the caller's
+    thread, so one feed thread can serve many symbols. Every snapshot loaded
+    and diff applied is passed to ``recorder`` when one is given.
+
+    Failed snapshot fetches are retried with jittered exponential backoff from
+    ``retry_delay`` up to ``max_retry_delay``; at most ``max_pending`` events
+    are buffered meanwhile. ``scale_fn(symbol)`` supplies the symbol's
+    PriceScale before the first snapshot; without one, or if it fails,
+    DEFAULT_SCALE is used. ``max_levels`` caps each side of the book, see
+    LocalOrderBook.
+    """
+
+    def __init__(self, symbol, snapshot_fn=fetch_depth_snapshot, snapshot_limit=5000, retry_delay=1.0,
+                 executor=None, recorder=None, intervals=(), scale_fn=None, max_retry_delay=60.0,
+                 max_pending=10_000, microstructure=None, max_levels=0):
+        self.symbol = symbol
+        self.snapshot_fn = snapshot_fn
+        self.snapshot_limit = snapshot_limit
+        self.executor = executor
+        self.recorder = recorder
+        self.scale_fn = scale_fn
+        self.scale = None
+        self.book = LocalOrderBook(intervals, microstructure=microstructure, max_levels=max_levels)
+        self.resyncs = 0
+        self.pending = []
+        self.max_pending = max_pending
+        self.resyncing = False
+        self.backoff = Backoff(retry_delay, max_retry_delay)
+        self.retry_at = 0.0
+        self.warm = False  # holds a restored book, served until the first snapshot replaces it
+        self.book_lock = threading.Lock()
+
+    def reset(self):
+        with self.book_lock:
+            self.book.last_update_id = None
+            self.pending = []
+
+    def handle(self, event):
+        if event.get('e', 'depthUpdate') != 'depthUpdate':
+            return
+
+        with self.book_lock:
+            if self.book.last_update_id is None:
+                self.pending.append(event)
+                if len(self.pending) > self.max_pending:
+                    # Only the newest events can follow the next snapshot
+                    del self.pending[0]
+                if self.resyncing or time.monotonic() < self.retry_at:
+                    return
+                self.resyncing = True
+            else:
+                try:
+                    self.apply(event)
+                    return
+                except BookGapError as e:
+                    logging.warning(f"Depth gap for {self.symbol}: {e}, resyncing")
+                    self.book.last_update_id = None
+                    self.pending = [event]
+                    self.resyncing = True
+
+        if self.executor is None:
+            self.resync()
+        else:
+            self.executor.submit(self.resync)
+
+    def resync(self):
+        if self.scale is None:
+            self.scale = DEFAULT_SCALE
+            if self.scale_fn is not None:
+                try:
+                    self.scale = self.scale_fn(self.symbol)
+                except Exception as e:
+                    logging.warning(f"Failed to fetch tick sizes for {self.symbol}, using 8 decimals: {e}")
+
+        try:
+            snapshot = self.snapshot_fn(self.symbol, self.snapshot_limit)
+        except Exception as e:
+            delay = self.backoff.next_delay()
+            logging.error(f"Failed to fetch depth snapshot for {self.symbol}: {e}, retrying in {delay:.1f}s")
+            metrics.inc('fetch_failures')
+            with self.book_lock:
+                self.retry_at = time.monotonic() + delay
+                self.resyncing = False
+            return
+
+        self.backoff.reset()
+        with self.book_lock:
+            self.resyncing = False
+            self.book.load_snapshot(snapshot, self.scale)
+            self.warm = False
+            self.resyncs += 1
+            metrics.inc('resyncs')
+            if self.recorder is not None:
+                self.recorder.record_snapshot(self.symbol, snapshot)
+            pending, self.pending = self.pending, []
+            try:
+                for event in pending:
+                    self.apply(event)
+            except BookGapError:
+                # Snapshot is older than the buffered events; the next event
+                # will fetch another one.
+                self.book.last_update_id = None
+
+    def apply(self, event):
+        # Caller holds book_lock
+        with metrics.timer('diff_apply'):
+            applied = self.book.apply_diff(event)
+        if applied and self.recorder is not None:
+            self.recorder.record_diff(self.symbol, event)
+
+    def export_state(self):
+        """Return the book as (meta, arrays) for a warm start, or None before the first snapshot."""
+        with self.book_lock:
+            book = self.book
+            if book.last_update_id is None or self.scale is None:
+                return None
+            meta = {'last_update_id': book.last_update_id, 'time': book.last_event_time,
+                    'tick_size': self.scale.tick_size, 'step_size': self.scale.step_size}
+            return meta, book.level_arrays()
+
+    def restore_state(self, meta, arrays):
+        """Load a book saved by export_state.
+
+        The diff stream has moved on by the time it is restored, so the first
+        event still resyncs; the restored scale spares the exchangeInfo call
+        and the restored depth sizes that snapshot. Until then the book is
+        served as it was saved, also across the reset() of (re)connecting.
+        """
+        with self.book_lock:
+            self.scale = PriceScale(meta['tick_size'], meta['step_size'])
+            self.book.scale = self.scale
+            self.book.load_levels(arrays['bids'], arrays['asks'], meta['last_update_id'])
+            self.book.last_event_time = meta['time']
+            self.warm = True
+
+    def grouped_order_book(self, interval):
+        """Return the book grouped at ``interval``, or None before the first snapshot or restore.
+
+        Levels are int64 ticks and units; 'scale' holds the PriceScale to convert
+        them and 'microstructure' the tracker's values, if the book has one.
+        """
+        with self.book_lock:
+            if self.book.last_update_id is None and not self.warm:
+                return None
+            microstructure = self.book.microstructure
+            return dict(self.book.aggregated(interval), scale=self.book.scale,
+                        microstructure=microstructure.values() if microstructure is not None else None)
@@ -0,0 +1,494 @@
+"""Fan-out of one monitor's books, analysis and alerts to many viewers.
+
+One process owns the upstream feeds, the REST budget and detection
+(``orderbook.py --serve``); GUIs started with ``--connect`` are thin clients
+of it, so more screens cost neither API weight nor analysis CPU.
+
+Wire format, over plain TCP. Every message is a 5-byte header, the message
+type (uint8) and payload length (uint32, little endian), then the payload:
+
+- HELLO, SETTINGS, SUBSCRIBE, ALERT: UTF-8 JSON.
+- BOOK: a uint16 header length, a JSON header (symbol, seq, base, time,
+  tick/step size, group interval, level counts, analysis, microstructure),
+  then the bid and ask levels as little-endian int64 (ticks, units) pairs,
+  both sides ascending. ``base`` null is a full snapshot; otherwise the
+  levels are the changes from the client's book at seq ``base``, amount 0
+  removing a level.
+
+Per client and pair the server only remembers the seq last sent. A client
+that is slow to read skips to the newest book with one delta, or a
+snapshot once its base has left BOOK_HISTORY, so memory per client stays
+bounded. Alerts are queued, up to ALERT_BACKLOG.
+"""
+import asyncio
+import json
+import logging
+import socket
+import struct
+import threading
+from collections import deque
+
+import numpy as np
+
+from depth_stream import Backoff, PriceScale
+from heatmap import DepthHistory
+from metrics import metrics
+
+PROTOCOL_VERSION = 1
+HELLO, SETTINGS, SUBSCRIBE, BOOK, ALERT = range(1, 6)
+HEADER = struct.Struct('<BI')
+BOOK_HEADER = struct.Struct('<H')
+LEVEL_DTYPE = np.dtype('<i8')
+MAX_MESSAGE = 64 << 20
+BOOK_HISTORY = 16  # published books per pair a client can receive a delta against
+ALERT_BACKLOG = 100  # alerts queued per client, the oldest are dropped beyond this
+WRITE_BUFFER = 256 << 10  # bytes buffered per client before its sender waits
+LOCAL_SETTINGS = ('current_symbol',)  # each viewer's own, never sent to or taken from the server
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_message(kind, payload):
+    return HEADER.pack(kind, len(payload)) + payload
+
+
+def encode_json(kind, document):
+    return encode_message(kind, json.dumps(document).encode())
+
+
+def encode_book(header, bids, asks):
+    header = json.dumps(dict(header, bids=len(bids), asks=len(asks))).encode()
+    return encode_message(BOOK, BOOK_HEADER.pack(len(header)) + header +
+                          np.ascontiguousarray(bids, LEVEL_DTYPE).tobytes() +
+                          np.ascontiguousarray(asks, LEVEL_DTYPE).tobytes())
+
+
+def decode_book(payload):
+    """Return (header, bids, asks) of a BOOK payload."""
+    (length,) = BOOK_HEADER.unpack_from(payload)
+    header = json.loads(payload[BOOK_HEADER.size:BOOK_HEADER.size + length])
+    levels = np.frombuffer(payload, LEVEL_DTYPE, offset=BOOK_HEADER.size + length).reshape(-1, 2)
+    if len(levels) != header['bids'] + header['asks']:
+        raise ProtocolError(f"BOOK for {header.get('symbol')} has {len(levels)} levels, header says "
+                            f"{header['bids']} + {header['asks']}")
+    return header, levels[:header['bids']], levels[header['bids']:]
+
+
+def find_prices(levels, prices):
+    # Index of each price in ascending `levels`, and whether it is there
+    if not len(levels):
+        return np.zeros(len(prices), dtype=np.intp), np.zeros(len(prices), dtype=bool)
+    index = np.minimum(np.searchsorted(levels[:, 0], prices), len(levels) - 1)
+    return index, levels[index, 0] == prices
+
+
+def diff_levels(old, new):
+    """Return the levels of ``new`` that differ from ``old``, plus removed ones with amount 0.
+
+    Both are ascending (n, 2) tick/unit arrays; so is the result.
+    """
+    index, present = find_prices(old, new[:, 0])
+    unchanged = present & (old[index, 1] == new[:, 1]) if len(old) else present
+    removed = ~find_prices(new, old[:, 0])[1]
+    changes = np.concatenate((new[~unchanged], np.column_stack((old[removed, 0], np.zeros(removed.sum(), np.int64)))))
+    return changes[np.argsort(changes[:, 0], kind='stable')]
+
+
+def apply_levels(levels, changes):
+    """Apply ``diff_levels`` output to ascending ``levels``."""
+    index, present = find_prices(levels, changes[:, 0])
+    kept = np.ones(len(levels), dtype=bool)
+    kept[index[present]] = False
+    merged = np.concatenate((levels[kept], changes[changes[:, 1] > 0]))
+    return merged[np.argsort(merged[:, 0], kind='stable')]
+
+
+class BookChannel:
+    """Recent published books of one pair and their encoded messages.
+
+    Messages are encoded once per (base, seq) and shared by every client at
+    that base, so the cost of a publication doesn't grow with the viewers.
+    """
+
+    def __init__(self, symbol, history=BOOK_HISTORY):
+        self.symbol = symbol
+        self.seq = 0
+        self.books = deque(maxlen=history)  # (bids, asks) of seq - len + 1 .. seq
+        self.header = None
+        self.encoded = {}
+
+    def push(self, frame, analysis):
+        scale = frame.scale
+        if self.header is not None and (self.header['tick_size'], self.header['step_size']) != \
+                (scale.tick_size, scale.step_size):
+            self.books.clear()  # ticks of another scale can't be diffed
+        self.seq += 1
+        self.books.append((frame.bids, frame.asks))
+        self.header = {'symbol': self.symbol, 'seq': self.seq, 'time': frame.time, 'tick_size': scale.tick_size,
+                       'step_size': scale.step_size, 'group_interval': frame.settings["group_interval"],
+                       'analysis': analysis, 'microstructure': frame.microstructure}
+        self.encoded = {}
+
+    def message(self, base):
+        """Encoded BOOK bringing a client at seq ``base`` (None: no book) to the latest book."""
+        oldest = self.seq - len(self.books) + 1
+        if base is not None and not oldest <= base < self.seq:
+            base = None
+        message = self.encoded.get(base)
+        if message is None:
+            bids, asks = self.books[-1]
+            if base is not None:
+                old_bids, old_asks = self.books[base - oldest]
+                bid_changes, ask_changes = diff_levels(old_bids, bids), diff_levels(old_asks, asks)
+                if len(bid_changes) + len(ask_changes) < len(bids) + len(asks):
+                    message = encode_book(dict(self.header, base=base), bid_changes, ask_changes)
+            if message is None:
+                message = encode_book(dict(self.header, base=None), bids, asks)
+            self.encoded[base] = message
+        return message
+
+
+class ClientConnection:
+    # Server-side state of one viewer: what it asked for and what it has
+    def __init__(self, writer):
+        self.writer = writer
+        self.peer = writer.get_extra_info('peername')
+        self.symbols = set()
+        self.sent = {}  # symbol -> seq of the book the client holds
+        self.dirty = set()  # subscribed pairs with a newer book than sent
+        self.alerts = deque(maxlen=ALERT_BACKLOG)
+        self.settings = None
+        self.wake = asyncio.Event()
+        self.task = asyncio.current_task()
+
+
+class FanoutServer:
+    """Serves a MultiSymbolMonitor's books, analysis and alerts to thin clients.
+
+    Runs an asyncio loop on its own thread; the monitor's publish callbacks
+    hand results over with ``call_soon_threadsafe``. Clients may change the
+    monitor's settings and subscribe to pairs it doesn't watch yet, if they
+    are in ``symbols`` (checked on every SUBSCRIBE, so a live settings dict
+    works); pairs the monitor watches are always allowed.
+    """
+
+    def __init__(self, monitor, host='127.0.0.1', port=9109, write_buffer=WRITE_BUFFER, symbols=()):
+        self.monitor = monitor
+        self.symbols = symbols
+        self.host = host
+        self.port = port
+        self.write_buffer = write_buffer
+        self.channels = {}
+        self.clients = set()
+        self.loop = None
+        self.server = None
+        self.ready = threading.Event()
+        self.thread = None
+        metrics.gauge('fanout_clients', lambda: len(self.clients))
+
+    def start(self):
+        self.thread = threading.Thread(target=asyncio.run, args=(self.serve(),), daemon=True)
+        self.thread.start()
+        self.ready.wait(5)
+        self.monitor.listeners.append(self.publish)
+
+    def stop(self):
+        if self.publish in self.monitor.listeners:
+            self.monitor.listeners.remove(self.publish)
+        if self.loop is not None and self.server is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+        if self.thread is not None:
+            self.thread.join(5)
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logging.info(f"Serving order books to viewers on {self.host}:{self.port}")
+        self.ready.set()
+        try:
+            await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            # Closed connections end their handlers at the next read
+            clients = list(self.clients)
+            for client in clients:
+                client.writer.close()
+            await asyncio.gather(*(client.task for client in clients), return_exceptions=True)
+
+    def publish(self, symbol, frame, result):
+        # Monitor listener, called on analysis threads
+        try:
+            self.loop.call_soon_threadsafe(self.push, symbol, frame, result['analysis'], result['alerts'])
+        except RuntimeError:
+            pass  # loop closed, shutting down
+
+    def push(self, symbol, frame, analysis, alerts):
+        channel = self.channels.get(symbol)
+        if channel is None:
+            channel = self.channels[symbol] = BookChannel(symbol)
+        channel.push(frame, analysis)
+        alerts = [encode_json(ALERT, {'symbol': symbol, 'message': message, 'priority': priority})
+                  for message, priority in alerts]
+        for client in self.clients:
+            if symbol in client.symbols:
+                client.dirty.add(symbol)
+                client.wake.set()
+            for alert in alerts:
+                if len(client.alerts) == client.alerts.maxlen:
+                    metrics.inc('fanout_alerts_dropped')
+                client.alerts.append(alert)
+                client.wake.set()
+
+    def broadcast_settings(self):
+        settings = self.monitor.settings()
+        for client in self.clients:
+            client.settings = settings
+            client.wake.set()
+
+    async def handle_client(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=self.write_buffer)
+        client = ClientConnection(writer)
+        self.clients.add(client)
+        writer.write(encode_json(HELLO, {'protocol': PROTOCOL_VERSION, 'symbols': list(self.monitor.monitors),
+                                         'settings': self.monitor.settings()}))
+        sender = asyncio.create_task(self.send_loop(client))
+        try:
+            while True:
+                kind, payload = await read_message(reader)
+                if kind == SUBSCRIBE:
+                    symbols = self.subscription(json.loads(payload)['symbols'])
+                    for symbol in symbols:
+                        self.monitor.watch(symbol)
+                    client.symbols = set(symbols)
+                    client.dirty = {symbol for symbol in client.symbols if symbol in self.channels}
+                    client.wake.set()
+                elif kind == SETTINGS:
+                    self.monitor.update_settings(json.loads(payload))
+                    self.broadcast_settings()
+                else:
+                    raise ProtocolError(f"unexpected message type {kind}")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except (ProtocolError, ValueError, KeyError) as e:
+            logging.warning(f"Dropping viewer {client.peer}: {e}")
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+            writer.close()
+
+    def subscription(self, symbols):
+        # Every new pair costs a book, snapshots and an upstream resubscribe, so only known pairs are taken
+        if not isinstance(symbols, list) or not all(isinstance(symbol, str) for symbol in symbols):
+            raise ProtocolError("SUBSCRIBE symbols must be a list of strings")
+        symbols = {symbol.upper() for symbol in symbols}
+        unknown = sorted(symbol for symbol in symbols
+                         if symbol not in self.monitor.monitors and symbol not in self.symbols)
+        if unknown:
+            raise ProtocolError(f"SUBSCRIBE to unknown symbols {', '.join(unknown[:10])}")
+        return symbols
+
+    async def send_loop(self, client):
+        # Only the newest book of each pair is sent; frames published while
+        # the client's buffer drains are skipped, not queued
+        writer = client.writer
+        try:
+            while True:
+                await client.wake.wait()
+                client.wake.clear()
+                while client.alerts:
+                    writer.write(client.alerts.popleft())
+                if client.settings is not None:
+                    writer.write(encode_json(SETTINGS, client.settings))
+                    client.settings = None
+                while client.dirty:
+                    symbol = client.dirty.pop()
+                    channel = self.channels[symbol]
+                    base = client.sent.get(symbol)
+                    message = channel.message(base)
+                    if base is not None and channel.seq - base > 1:
+                        metrics.inc('fanout_frames_skipped', channel.seq - base - 1)
+                    client.sent[symbol] = channel.seq
+                    writer.write(message)
+                    metrics.inc('fanout_bytes_sent', len(message))
+                    await writer.drain()
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+
+async def read_message(reader):
+    kind, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if length > MAX_MESSAGE:
+        raise ProtocolError(f"message of {length} bytes")
+    return kind, await reader.readexactly(length)
+
+
+class BookView:
+    # Client-side copy of one pair, read by the GUI like a SymbolMonitor:
+    # the latest book, its analysis text and the depth history for the heatmap
+    def __init__(self, symbol, history_shape):
+        self.symbol = symbol
+        self.seq = None
+        self.book = None  # (bids, asks, scale), ascending int64 levels
+        self.analysis = None
+        self.microstructure = None
+        self.previous_order_book = None
+        self.history = DepthHistory(*history_shape)
+        self.scales = {}
+
+    def apply(self, header, bids, asks):
+        if header['base'] is not None:
+            if header['base'] != self.seq or self.book is None:
+                raise ProtocolError(f"{self.symbol} delta against seq {header['base']}, holding {self.seq}")
+            bids, asks = apply_levels(self.book[0], bids), apply_levels(self.book[1], asks)
+        key = (header['tick_size'], header['step_size'])
+        scale = self.scales.get(key)
+        if scale is None:
+            scale = self.scales[key] = PriceScale(*key)
+        self.seq = header['seq']
+        self.book = (bids, asks, scale)
+        self.analysis = header['analysis']
+        self.microstructure = header['microstructure']
+        self.previous_order_book = {'bids': bids, 'asks': asks, 'scale': scale}
+        if len(bids) and len(asks):
+            self.history.push(header['time'], bids, asks, scale.interval_ticks(header['group_interval']), scale)
+
+    def display(self):
+        book = self.book
+        if book is None or not len(book[0]) or not len(book[1]):
+            return None
+        bids, asks, scale = book
+        return scale.to_decimal(bids)[::-1], scale.to_decimal(asks)
+
+
+class FanoutClient:
+    """Thin client of a FanoutServer, standing in for MultiSymbolMonitor in the GUI.
+
+    A background thread keeps one connection open, reconnecting with backoff,
+    and applies snapshots and deltas to a BookView per pair. Settings from
+    the server go to ``apply_settings``, alerts to ``on_alert``.
+    ``history_shape`` is the (columns, buckets, column seconds) of each
+    pair's depth history.
+    """
+
+    def __init__(self, address, symbols, apply_settings=None, on_alert=None, history_shape=(3600, 500, 1.0)):
+        self.address = address
+        self.history_shape = history_shape
+        self.views = {}
+        self.apply_settings = apply_settings
+        self.on_alert = on_alert
+        self.sock = None
+        self.send_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        for symbol in symbols:
+            self.views[symbol] = BookView(symbol, history_shape)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self.thread is not None:
+            self.thread.join(5)
+
+    def watch(self, symbol):
+        view = self.views.get(symbol)
+        if view is None:
+            view = self.views[symbol] = BookView(symbol, self.history_shape)
+            self.subscribe()
+        return view
+
+    def update_settings(self, settings):
+        self.send(encode_json(SETTINGS, shared_settings(settings)))
+
+    def subscribe(self):
+        self.send(encode_json(SUBSCRIBE, {'symbols': list(self.views)}))
+
+    def send(self, message):
+        sock = self.sock
+        if sock is None:
+            return  # sent again on connect
+        try:
+            with self.send_lock:
+                sock.sendall(message)
+        except OSError as e:
+            logging.warning(f"Failed to reach the order book server: {e}")
+
+    def run(self):
+        backoff = Backoff()
+        while not self.stop_event.is_set():
+            try:
+                with socket.create_connection(self.address, timeout=10) as sock:
+                    sock.settimeout(None)
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    stream = sock.makefile('rb')
+                    self.receive_hello(stream)
+                    self.sock = sock
+                    for view in self.views.values():
+                        view.seq = None  # the server starts every pair with a snapshot
+                    self.subscribe()
+                    backoff.reset()
+                    while not self.stop_event.is_set():
+                        self.handle(*receive_message(stream))
+            except (OSError, ProtocolError, ValueError, KeyError) as e:
+                if self.stop_event.is_set():
+                    break
+                delay = backoff.next_delay()
+                logging.error(f"Lost the order book server at {self.address}: {e}, reconnecting in {delay:.1f}s")
+                self.sock = None
+                self.stop_event.wait(delay)
+        self.sock = None
+
+    def receive_hello(self, stream):
+        kind, payload = receive_message(stream)
+        hello = json.loads(payload) if kind == HELLO else {}
+        if hello.get('protocol') != PROTOCOL_VERSION:
+            raise ProtocolError(f"server speaks protocol {hello.get('protocol')}, expected {PROTOCOL_VERSION}")
+        if self.apply_settings is not None:
+            self.apply_settings(shared_settings(hello['settings']))
+
+    def handle(self, kind, payload):
+        if kind == BOOK:
+            with metrics.timer('fanout_decode'):
+                header, bids, asks = decode_book(payload)
+                view = self.views.get(header['symbol'])
+                if view is not None:
+                    view.apply(header, bids, asks)
+        elif kind == ALERT:
+            alert = json.loads(payload)
+            if self.on_alert is not None:
+                self.on_alert(alert['message'])
+        elif kind == SETTINGS:
+            if self.apply_settings is not None:
+                self.apply_settings(shared_settings(json.loads(payload)))
+        else:
+            raise ProtocolError(f"unexpected message type {kind}")
+
+
+def shared_settings(settings):
+    return {name: value for name, value in settings.items() if name not in LOCAL_SETTINGS}
+
+
+def receive_message(stream):
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ConnectionError("server closed the connection")
+    kind, length = HEADER.unpack(header)
+    if length > MAX_MESSAGE:
+        raise ProtocolError(f"message of {length} bytes")
+    payload = stream.read(length)
+    if len(payload) < length:
+        raise ConnectionError("server closed the connection")
+    return kind, payload
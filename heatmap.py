@@ -0,0 +1,137 @@
+import threading
+
+import numpy as np
+
+LUT_SIZE = 256
+LUT_CENTER = LUT_SIZE // 2  # shade of an empty cell; asks below, bids above
+
+
+class DepthHistory:
+    """Ring buffer of grouped depth columns for a time-by-price heatmap.
+
+    All storage is allocated up front: ``columns`` x ``buckets`` float32 depth
+    (bids positive, asks negative), the absolute bucket of each column's first
+    row and the column's timestamp. ``push`` overwrites the oldest column in
+    place. Each column is centred on the mid price when it was written, so the
+    price axis follows the market; ``HeatmapRenderer`` realigns them.
+    """
+
+    def __init__(self, columns=3600, buckets=500, column_seconds=1.0):
+        self.columns = columns
+        self.buckets = buckets
+        self.column_seconds = column_seconds
+        # One spare row per column stays zero; the renderer maps cells
+        # outside a column's price range onto it
+        self.depth = np.zeros((columns, buckets + 1), dtype=np.float32)
+        self.base = np.zeros(columns, dtype=np.int64)
+        self.times = np.full(columns, -np.inf)
+        self.head = 0  # slot written next
+        self.count = 0
+        self.step = None  # bucket size in price ticks
+        self.tick_size = None
+        self.step_size = None
+        self.lock = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self._clear()
+
+    def _clear(self):
+        self.depth.fill(0)
+        self.times.fill(-np.inf)
+        self.head = 0
+        self.count = 0
+
+    def push(self, timestamp, bids, asks, step, scale):
+        """Write one column from grouped int64 tick/unit levels (sorted ascending) bucketed at ``step`` ticks.
+
+        Columns closer than ``column_seconds`` to the previous one are skipped;
+        a new bucket size or scale starts the history over. Returns True if a
+        column was written.
+        """
+        if not len(bids) or not len(asks):
+            return False
+        with self.lock:
+            if (step, scale.tick_size, scale.step_size) != (self.step, self.tick_size, self.step_size):
+                self._clear()
+                self.step, self.tick_size, self.step_size = step, scale.tick_size, scale.step_size
+            if self.count and timestamp < self.times[self.head - 1] + self.column_seconds:
+                return False
+            column = self.depth[self.head]
+            column.fill(0)
+            center = (int(bids[-1, 0]) + int(asks[0, 0])) // 2 // step
+            base = center - self.buckets // 2
+            for levels, sign in ((bids, self.step_size), (asks, -self.step_size)):
+                rows = levels[:, 0] // step - base
+                inside = (rows >= 0) & (rows < self.buckets)
+                np.add.at(column, rows[inside], levels[inside, 1] * sign)
+            self.base[self.head] = base
+            self.times[self.head] = timestamp
+            self.head = (self.head + 1) % self.columns
+            self.count = min(self.count + 1, self.columns)
+        return True
+
+    def price_range(self):
+        """Return (lowest, highest) price on the newest column's axis, or None while empty."""
+        with self.lock:
+            if not self.count:
+                return None
+            base = int(self.base[self.head - 1])
+        return base * self.step * self.tick_size, (base + self.buckets - 1) * self.step * self.tick_size
+
+
+class HeatmapRenderer:
+    """Turns a DepthHistory into a (buckets, columns) packed-colour image.
+
+    Every cell is a lookup: columns are gathered onto the newest column's price
+    axis with one ``np.take`` over precomputed indices, scaled to shades, and
+    the shades index ``lut`` (LUT_SIZE packed 0xAARRGGBB colours) into the
+    image. All scratch arrays are allocated once, so rendering allocates
+    nothing. The top row is the highest price and the newest column is right.
+    """
+
+    def __init__(self, columns=3600, buckets=500):
+        self.columns = columns
+        self.buckets = buckets
+        self.image = np.zeros((buckets, columns), dtype=np.uint32)
+        self._slots = np.arange(columns)
+        self._order = np.empty(columns, dtype=np.intp)
+        self._shift = np.empty(columns, dtype=np.intp)
+        self._offset = np.empty(columns, dtype=np.intp)
+        self._rows = np.arange(buckets, dtype=np.intp)
+        self._index = np.empty((columns, buckets), dtype=np.intp)
+        self._values = np.empty((columns, buckets), dtype=np.float32)
+        self._shades = np.empty((columns, buckets), dtype=np.uint8)
+
+    def render(self, history, lut, max_depth=None):
+        """Render ``history`` into ``self.image`` and return it.
+
+        Shades are linear in depth up to ``max_depth`` (default: the deepest
+        cell), so perceptual spreading is left to the LUT.
+        """
+        index, values, shades = self._index, self._values, self._shades
+        stride = history.buckets + 1
+        with history.lock:
+            # Oldest column first
+            np.add(self._slots, history.head, out=self._order)
+            np.remainder(self._order, self.columns, out=self._order)
+            np.take(history.base, self._order, out=self._shift)
+            self._shift -= history.base[history.head - 1]
+            np.multiply(self._order, stride, out=self._offset)
+
+            # Row r of the image is bucket newest + r; in column c that is
+            # row r + newest - base[c], or the zero row when out of range
+            np.subtract(self._rows[np.newaxis, :], self._shift[:, np.newaxis], out=index)
+            np.clip(index, -1, history.buckets, out=index)
+            np.remainder(index, stride, out=index)
+            index += self._offset[:, np.newaxis]
+            np.take(history.depth, index, out=values, mode='clip')
+
+        if max_depth is None:
+            max_depth = max(float(values.max()), -float(values.min()))
+        np.multiply(values, (LUT_CENTER - 1) / max_depth if max_depth > 0 else 0.0, out=values)
+        np.add(values, LUT_CENTER, out=values)
+        np.clip(values, 0, LUT_SIZE - 1, out=values)
+        np.copyto(shades, values, casting='unsafe')
+        np.take(lut, shades.T[::-1], out=self.image, mode='clip')
+        return self.image
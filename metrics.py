@@ -0,0 +1,200 @@
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "orderbook"
+
+# Histogram bucket upper bounds in seconds: 50us doubling up to ~52s
+BUCKET_BOUNDS = [0.00005 * 2 ** i for i in range(21)]
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; quantiles are interpolated within a bucket."""
+
+    def __init__(self, bounds=BUCKET_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.count
+        if total == 0:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if seen + count >= rank and count:
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+
+class Metrics:
+    """Stage timers, counters and gauges for the fetch/analyze/render pipeline.
+
+    Recording is a bisect plus a short lock per observation, cheap enough to
+    leave on. Gauges are callables evaluated only when metrics are read.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(stage, Histogram())
+        histogram.observe(seconds)
+
+    def inc(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, func, **labels):
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = func
+
+    def remove_gauge(self, name, **labels):
+        with self.lock:
+            self.gauges.pop((name, tuple(sorted(labels.items()))), None)
+
+    def summary(self):
+        """Return {'stages': {stage: {count, p50, p99}}, 'counters': {...}, 'gauges': {...}}."""
+        with self.lock:
+            histograms = dict(self.histograms)
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+        stages = {
+            stage: {'count': histogram.count, 'p50': histogram.quantile(0.5), 'p99': histogram.quantile(0.99)}
+            for stage, histogram in histograms.items()
+        }
+        values = {}
+        for (name, labels), func in gauges.items():
+            try:
+                values[(name, labels)] = func()
+            except Exception as e:
+                logging.debug(f"Gauge {name} failed: {e}")
+        return {'stages': stages, 'counters': counters, 'gauges': values}
+
+    def render_prometheus(self):
+        with self.lock:
+            histograms = dict(self.histograms)
+            counters = dict(self.counters)
+        lines = [f"# TYPE {PREFIX}_stage_seconds histogram"]
+        for stage, histogram in sorted(histograms.items()):
+            with histogram.lock:
+                counts = list(histogram.counts)
+                count, total = histogram.count, histogram.sum
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.bounds, counts):
+                cumulative += bucket_count
+                lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {count}')
+
+        for name, value in sorted(counters.items()):
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            lines.append(f"{PREFIX}_{name}_total {value}")
+
+        gauge_names = set()
+        for (name, labels), value in sorted(self.summary()['gauges'].items()):
+            if value is None:
+                continue
+            if name not in gauge_names:
+                gauge_names.add(name)
+                lines.append(f"# TYPE {PREFIX}_{name} gauge")
+            label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+            lines.append(f"{PREFIX}_{name}{{{label_text}}} {value}" if label_text else f"{PREFIX}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def log_summary(self):
+        summary = self.summary()
+        parts = []
+        for stage, stats in sorted(summary['stages'].items()):
+            if stats['count']:
+                parts.append(f"{stage} p50={stats['p50'] * 1000:.2f}ms p99={stats['p99'] * 1000:.2f}ms n={stats['count']}")
+        parts += [f"{name}={value}" for name, value in sorted(summary['counters'].items())]
+        logging.info("Metrics: " + "; ".join(parts))
+
+
+# Shared by every module of the app
+metrics = Metrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def process_rss():
+    """Resident set size of this process in bytes, None where it can't be read."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak rather than current outside Linux; kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """Serve Prometheus text format on http://host:port/metrics from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+def start_log_summary(interval):
+    def run():
+        while True:
+            time.sleep(interval)
+            metrics.log_summary()
+
+    threading.Thread(target=run, name="metrics-log", daemon=True).start()
@@ -0,0 +1,191 @@
+import heapq
+import math
+from collections import deque
+
+# Order of the values in MicrostructureTracker.values(), also used by the recorder
+METRIC_FIELDS = ('best_bid', 'best_ask', 'mid', 'microprice', 'spread', 'bid_depth', 'ask_depth',
+                 'imbalance', 'bid_slope', 'ask_slope', 'volatility')
+
+
+class Fenwick:
+    """Binary indexed tree of integer sums over ``size`` cells."""
+
+    __slots__ = ('tree',)
+
+    def __init__(self, size):
+        self.tree = [0] * (size + 1)
+
+    def add(self, cell, amount):
+        tree = self.tree
+        size = len(tree)
+        i = cell + 1
+        while i < size:
+            tree[i] += amount
+            i += i & -i
+
+    def prefix(self, cell):
+        # Sum of cells [0, cell]
+        tree = self.tree
+        i = min(cell + 1, len(tree) - 1)
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def range(self, first, last):
+        return self.prefix(last) - self.prefix(first - 1)
+
+
+class BestPrice:
+    """Best price of one book side from a lazy heap.
+
+    Prices are pushed when a level appears; removed levels are discarded only
+    once they reach the top, so each change costs O(log n).
+    """
+
+    def __init__(self, levels, highest):
+        self.sign = -1 if highest else 1
+        self.levels = levels
+        self.rebuild()
+
+    def rebuild(self):
+        self.heap = [self.sign * price for price in self.levels]
+        heapq.heapify(self.heap)
+
+    def push(self, price):
+        heapq.heappush(self.heap, self.sign * price)
+        # Levels toggling away from the top leave stale entries behind
+        if len(self.heap) > 2 * len(self.levels) + 64:
+            self.rebuild()
+
+    def best(self):
+        heap = self.heap
+        while heap and self.sign * heap[0] not in self.levels:
+            heapq.heappop(heap)
+        return self.sign * heap[0] if heap else None
+
+
+class MicrostructureTracker:
+    """Streaming order book metrics, updated in O(log n) per changed level.
+
+    Works on the full-resolution integer book of a LocalOrderBook. Depth within
+    ``band`` (a fraction of mid) comes from Fenwick trees over a grid of
+    ``cells`` cells spanning twice the band either side of the mid, rebuilt
+    when the mid drifts too far; band edges are resolved to one cell. The mid
+    is sampled every ``sample_interval`` seconds for the rolling volatility of
+    its log returns over ``volatility_window`` samples.
+    """
+
+    def __init__(self, band=0.01, cells=4096, volatility_window=300, sample_interval=1.0):
+        self.band = band
+        self.cells = cells
+        self.sample_interval = sample_interval
+        self.returns = deque(maxlen=volatility_window)
+        self.return_sum = 0.0
+        self.return_squares = 0.0
+        self.last_sample = None  # (time, mid)
+        self.scale = None
+        self.rebuilds = 0
+
+    def load(self, bids, asks, scale):
+        self.bids = bids
+        self.asks = asks
+        self.scale = scale
+        self.best_bid = BestPrice(bids, highest=True)
+        self.best_ask = BestPrice(asks, highest=False)
+        self.build_grid()
+
+    def build_grid(self):
+        mid = self.mid_ticks()
+        self.grid_low = self.cell_size = 0
+        self.grid = {'bids': Fenwick(self.cells), 'asks': Fenwick(self.cells)}
+        if mid is None:
+            return
+        span = max(int(4 * self.band * mid), self.cells)
+        self.cell_size = -(-span // self.cells)
+        self.grid_low = mid - self.cell_size * self.cells // 2
+        for side, levels in (('bids', self.bids), ('asks', self.asks)):
+            grid = self.grid[side]
+            for price, amount in levels.items():
+                cell = (price - self.grid_low) // self.cell_size
+                if 0 <= cell < self.cells:
+                    grid.add(cell, amount)
+        self.rebuilds += 1
+
+    def mid_ticks(self):
+        best_bid, best_ask = self.best_bid.best(), self.best_ask.best()
+        if best_bid is None or best_ask is None:
+            return None
+        return (best_bid + best_ask) // 2
+
+    def update(self, side, price, old_amount, new_amount):
+        if old_amount is None:
+            (self.best_bid if side == 'bids' else self.best_ask).push(price)
+        if self.cell_size:
+            cell = (price - self.grid_low) // self.cell_size
+            if 0 <= cell < self.cells:
+                self.grid[side].add(cell, (new_amount or 0) - (old_amount or 0))
+
+    def after_event(self, now):
+        """Called once per applied diff: keep the grid around the mid and sample it."""
+        mid = self.mid_ticks()
+        if mid is None:
+            return
+        reach = int(self.band * mid) + self.cell_size
+        if not self.cell_size or mid - reach < self.grid_low or mid + reach >= self.grid_low + self.cell_size * self.cells:
+            self.build_grid()
+
+        if self.last_sample is None:
+            self.last_sample = (now, mid)
+        elif now - self.last_sample[0] >= self.sample_interval:
+            value = math.log(mid / self.last_sample[1])
+            if len(self.returns) == self.returns.maxlen:
+                old = self.returns[0]
+                self.return_sum -= old
+                self.return_squares -= old * old
+            self.returns.append(value)
+            self.return_sum += value
+            self.return_squares += value * value
+            self.last_sample = (now, mid)
+
+    def volatility(self):
+        # Standard deviation of the sampled log returns of the mid
+        count = len(self.returns)
+        if count < 2:
+            return None
+        variance = (self.return_squares - self.return_sum * self.return_sum / count) / (count - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    def values(self):
+        """Return METRIC_FIELDS as a dict of floats in prices and coins, or None without both sides."""
+        best_bid, best_ask = self.best_bid.best(), self.best_ask.best()
+        if best_bid is None or best_ask is None or not self.cell_size:
+            return None
+        tick, step = self.scale.tick_size, self.scale.step_size
+        mid = (best_bid + best_ask) / 2
+        reach = int(self.band * mid)
+
+        def cell(price):
+            return (price - self.grid_low) // self.cell_size
+
+        bid_depth = self.grid['bids'].range(cell(best_bid - reach), cell(best_bid)) * step
+        ask_depth = self.grid['asks'].range(cell(best_ask), cell(best_ask + reach)) * step
+        bid_size = self.bids[best_bid] * step
+        ask_size = self.asks[best_ask] * step
+        width = reach * tick or tick
+        return {
+            'best_bid': best_bid * tick,
+            'best_ask': best_ask * tick,
+            'mid': mid * tick,
+            # Weighted toward the side with less size at the touch
+            'microprice': (best_bid * ask_size + best_ask * bid_size) / (bid_size + ask_size) * tick,
+            'spread': (best_ask - best_bid) * tick,
+            'bid_depth': bid_depth,
+            'ask_depth': ask_depth,
+            'imbalance': (bid_depth - ask_depth) / (bid_depth + ask_depth) if bid_depth + ask_depth else 0.0,
+            # Coins per unit of price across the band: how fast cumulative depth grows
+            'bid_slope': bid_depth / width,
+            'ask_slope': ask_depth / width,
+            'volatility': self.volatility(),
+        }
@@ -0,0 +1,203 @@
+import logging
+import threading
+import time
+from collections import deque
+
+import requests
+
+from metrics import metrics
+
+PRIORITY_HIGH = 0  # spoofing / cancellations
+PRIORITY_NORMAL = 1  # walls
+PRIORITY_LOW = 2  # status messages
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+class AlertDispatcher:
+    """Background sender for alerts with a bounded, priority-aware queue.
+
+    ``submit`` never blocks. Alerts arriving within ``coalesce_window`` seconds
+    of each other are joined into one message, highest priority first. Sends are
+    spaced at least ``min_interval`` apart. Rate limits, server errors and
+    connection failures are retried with exponential backoff (or the server's
+    ``retry_after``); any other error, such as a bad token or chat, drops the
+    batch at once. When the queue is full the oldest alert of the lowest
+    priority is dropped, or the new one if nothing queued ranks lower.
+    """
+
+    def __init__(self, send, max_queue=500, coalesce_window=1.0, min_interval=1.0,
+                 max_retries=5, max_backoff=60.0, message_limit=TELEGRAM_MESSAGE_LIMIT):
+        self.send = send
+        self.max_queue = max_queue
+        self.coalesce_window = coalesce_window
+        self.min_interval = min_interval
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.message_limit = message_limit
+
+        self.queues = {PRIORITY_HIGH: deque(), PRIORITY_NORMAL: deque(), PRIORITY_LOW: deque()}
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_send = 0.0
+
+        self.sent = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failed = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=1000)
+
+    def queue_depth(self):
+        with self.condition:
+            return sum(len(queue) for queue in self.queues.values())
+
+    def start(self):
+        with self.condition:
+            if self.thread is None or not self.thread.is_alive():
+                self.stop_event.clear()
+                self.thread = threading.Thread(target=self.run, name="alert-dispatcher", daemon=True)
+                self.thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the worker after it has flushed what is queued, waiting at most ``timeout``."""
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def submit(self, message, priority=PRIORITY_NORMAL):
+        if self.thread is None:
+            self.start()
+        with self.condition:
+            if sum(len(queue) for queue in self.queues.values()) >= self.max_queue:
+                if not self._evict(priority):
+                    self.dropped += 1
+                    metrics.inc('alerts_dropped')
+                    return False
+            self.queues[priority].append((time.monotonic(), message))
+            self.condition.notify()
+        return True
+
+    def _evict(self, priority):
+        # Drop the oldest queued alert that ranks no higher than the new one
+        for level in sorted(self.queues, reverse=True):
+            if level < priority:
+                break
+            if self.queues[level]:
+                self.queues[level].popleft()
+                self.dropped += 1
+                metrics.inc('alerts_dropped')
+                return True
+        return False
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.stop_event.is_set() and not any(self.queues.values()):
+                    self.condition.wait()
+                if self.stop_event.is_set() and not any(self.queues.values()):
+                    return
+
+            # Give a burst of alerts a moment to arrive so they go out together
+            if not self.stop_event.is_set():
+                self.stop_event.wait(self.coalesce_window)
+
+            batch = self._take_batch()
+            if batch:
+                self._deliver(batch)
+
+    def _take_batch(self):
+        batch = []
+        length = 0
+        with self.condition:
+            for level in sorted(self.queues):
+                queue = self.queues[level]
+                while queue:
+                    queued_at, message = queue[0]
+                    if batch and length + len(message) + 1 > self.message_limit:
+                        return batch
+                    queue.popleft()
+                    batch.append((queued_at, message[:self.message_limit]))
+                    length += len(message) + 1
+        return batch
+
+    def _deliver(self, batch):
+        text = "\n".join(message for _, message in batch)
+        delay = self.min_interval
+        for attempt in range(self.max_retries + 1):
+            wait = self.last_send + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self.send(text)
+                self.last_send = time.monotonic()
+                now = self.last_send
+                with self.condition:
+                    self.sent += len(batch)
+                    self.batches += 1
+                    self.latencies.extend(now - queued_at for queued_at, _ in batch)
+                metrics.inc('alerts_sent', len(batch))
+                metrics.observe('alert_delivery', now - batch[0][0])
+                return True
+            except Exception as e:
+                self.last_send = time.monotonic()
+                if not is_retryable(e):
+                    logging.error(f"Notification rejected, dropping {len(batch)} alerts: {e}")
+                    with self.condition:
+                        self.rejected += len(batch)
+                    metrics.inc('alerts_rejected', len(batch))
+                    return False
+                retry_after = retry_after_seconds(e)
+                logging.warning(f"Failed to send notification (attempt {attempt + 1}): {e}")
+                if attempt < self.max_retries:
+                    time.sleep(retry_after if retry_after is not None else delay)
+                    delay = min(delay * 2, self.max_backoff)
+
+        with self.condition:
+            self.failed += len(batch)
+        metrics.inc('alerts_failed', len(batch))
+        logging.error(f"Failed to send Telegram notification: giving up on {len(batch)} alerts")
+        return False
+
+    def stats(self):
+        with self.condition:
+            latencies = sorted(self.latencies)
+            depth = sum(len(queue) for queue in self.queues.values())
+            stats = {
+                'queue_depth': depth,
+                'sent': self.sent,
+                'batches': self.batches,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'rejected': self.rejected,
+            }
+        if latencies:
+            stats['latency_p50'] = latencies[len(latencies) // 2]
+            stats['latency_p99'] = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+            stats['latency_max'] = latencies[-1]
+        return stats
+
+
+def is_retryable(error):
+    # Rate limits and server errors may pass; other HTTP errors (a bad token
+    # or chat) won't. telebot keeps Telegram's code on error_code and the
+    # response on result. Without a response, only connection failures retry.
+    status = getattr(error, 'error_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'result', None), 'status_code', None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError))
+
+
+def retry_after_seconds(error):
+    # Telegram answers 429 with parameters.retry_after; telebot keeps the JSON on the exception
+    result = getattr(error, 'result_json', None)
+    if isinstance(result, dict):
+        retry_after = result.get('parameters', {}).get('retry_after')
+        if retry_after is not None:
+            return float(retry_after)
+    return None
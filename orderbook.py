@@ -1,31 +1,77 @@
 import sys
-import requests
 import numpy as np
 import threading
+import itertools
 import time
 import telebot
-import pandas as pd
-from matplotlib.colors import LinearSegmentedColormap
 import logging
-import random
-from PyQt6.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, 
-                             QWidget, QTableWidget, QTableWidgetItem, QLabel, 
-                             QPushButton, QLineEdit, QSpinBox, QDoubleSpinBox, 
-                             QTextEdit, QSplitter, QComboBox, QDialog, QFormLayout)
-from PyQt6.QtCore import Qt, QTimer, pyqtSignal
-from PyQt6.QtGui import QColor, QFont, QIcon
-import winsound
+import argparse
+import math
+import functools
+import signal
+import multiprocessing
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from recorder import OrderBookRecorder
+from alert_rules import AlertRuleFile, RuleEngine
+from state_store import StateStore, prefixed
+from heatmap import DepthHistory
+from microstructure import MicrostructureTracker
+from metrics import metrics, process_rss, start_log_summary, start_metrics_server
+from notifications import AlertDispatcher, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from depth_stream import (EXCHANGE_INFO_WEIGHT, Backoff, DepthStream, RequestWeightBudget,
+                          binance_combined_depth_feed, covering_depth_limit, create_session, depth_request_weight,
+                          fetch_depth_snapshot, fetch_price_scale)
 
 # Configuration Telegram bot notifications, replace with
 # your own token and chat ID
 TOKEN = ''
 CHAT_ID = ''
+TELEGRAM_API_URL = ''  # optional Bot API URL override, e.g. "http://127.0.0.1:8081/bot{0}/{1}" for a local fake bot
 GROUP_INTERVAL = 150
 
 # Thresholds (now as global variables)
 LARGE_WALL_THRESHOLD = 300
 CANCELLATION_THRESHOLD = 80
 NOTIFICATION_COOLDOWN = 3600  # 1 hour in seconds
+CANCELLATION_WINDOW = 5  # books compared when looking for pulled walls
+WALL_TTL = 600  # seconds a wall stays tracked after it was last seen above the threshold
+MAX_TRACKED_WALLS = 500  # per side
+WALL_HISTORY_LENGTH = 120  # size samples kept per wall
+REFRESH_INTERVAL = 1  # seconds between reads of the live order book
+MIN_REFRESH_INTERVAL = 0.25  # fastest reads, while the book changes quickly
+MAX_REFRESH_INTERVAL = 30  # slowest reads, after repeated errors
+FAST_CHANGE_RATE = 200  # level updates per second above which reads speed up
+
+# Multi-symbol monitoring
+WATCHED_SYMBOLS = ['BTCUSDT', 'ETHUSDT', 'XRPUSDT']
+QUOTE_ASSETS = ('USDT', 'USDC', 'FDUSD', 'BUSD', 'TUSD', 'BTC', 'ETH', 'BNB')  # stripped from symbols in messages
+MAX_WORKERS = 8  # analysis threads shared by all symbols
+ANALYSIS_PROCESSES = 0  # shard symbols across this many analysis processes, 0 analyzes on threads
+MAX_FETCH_WORKERS = 4  # concurrent REST snapshot fetches
+REQUEST_WEIGHT_BUDGET = 3000  # REST weight per minute for all symbols together (Binance allows 6000)
+SNAPSHOT_LIMIT = 5000  # deepest snapshot; resyncs use the cheapest limit covering VISIBLE_LEVELS
+VISIBLE_LEVELS = 50  # grouped levels per side a snapshot has to cover
+AGGREGATION_MULTIPLES = (1, 2, 5, 10)  # group intervals kept ready in each live book, times its pair's group_interval
+MAX_BOOK_LEVELS = 10_000  # levels per side a live book keeps, the furthest from the top are dropped; 0 keeps all
+RECORDING_DIR = 'recordings'  # snapshots and diffs are recorded here, '' disables recording
+ALERT_RULES_FILE = 'alert_rules.json'  # extra alert rules, reloaded on change; '' disables
+MICROSTRUCTURE_BAND = 0.01  # depth, imbalance and slope are measured within +-1% of mid
+VOLATILITY_WINDOW = 300  # mid samples in the rolling volatility
+VOLATILITY_SAMPLE_SECONDS = 1
+HEATMAP_SECONDS = 3600  # history shown by the depth heatmap
+HEATMAP_COLUMN_SECONDS = 1  # one heatmap column per second
+HEATMAP_COLUMNS = HEATMAP_SECONDS // HEATMAP_COLUMN_SECONDS
+HEATMAP_BUCKETS = 500  # grouped price levels on the heatmap's price axis
+STATE_FILE = 'orderbook_state.npz'  # settings, alert cooldowns and books survive restarts here, '' disables
+STATE_SAVE_INTERVAL = 30  # seconds between state snapshots, one is also taken on shutdown
+STATE_MAX_AGE = 300  # older snapshots restore settings and cooldowns but not books or cancellation baselines
+FANOUT_HOST = '127.0.0.1'  # address --serve listens on for thin-client viewers
+FANOUT_PORT = 9109
+METRICS_PORT = 9108  # Prometheus metrics on http://127.0.0.1:9108/metrics, 0 disables
+METRICS_LOG_INTERVAL = 0  # seconds between metric summaries in the log, 0 disables
+MEMORY_REPORT_INTERVAL = 3600  # seconds between memory reports in the headless log, 0 disables
+LOG_MAX_LINES = 1000  # lines kept in the GUI log, older ones are dropped
 
 default_settings = {
     "BTCUSDT": {
@@ -38,22 +84,38 @@ default_settings = {
         "large_wall_threshold": 2500,
         "cancellation_threshold": 500
     },
+    "XRPUSDT": {
+        "group_interval": 0.001,
+        "large_wall_threshold": 2_000_000,
+        "cancellation_threshold": 500_000
+    },
     # Add more pairs as needed
 }
 
 # Initialize the Telegram bot
+if TELEGRAM_API_URL:
+    telebot.apihelper.API_URL = TELEGRAM_API_URL
 bot = telebot.TeleBot(TOKEN)
 
+# Alerts are sent from a background thread so a slow Telegram call never
+# stalls polling or the UI
+notifier = AlertDispatcher(lambda text: bot.send_message(CHAT_ID, text))
+
+# Every snapshot and diff seen is appended to per-symbol segment files
+recorder = OrderBookRecorder(RECORDING_DIR) if RECORDING_DIR else None
+
+# Settings and detection state are restored from here on start
+state_store = StateStore(STATE_FILE) if STATE_FILE else None
+
+# Declarative alert rules on top of the per-pair thresholds
+alert_rules = AlertRuleFile(ALERT_RULES_FILE, NOTIFICATION_COOLDOWN) if ALERT_RULES_FILE else None
+
 # Global variables
 is_running = threading.Event()
 is_running.set()  # Start in running state
-last_notified_walls = {'bids': {}, 'asks': {}}
 current_symbol = 'BTCUSDT'
 
-# Lock for thread-safe operations
-lock = threading.Lock()
-
-# ... (keep all the existing functions like group_orders, fetch_order_book, etc.)
+# ... (keep all the existing functions like group_orders, etc.)
 def group_orders(orders, interval=GROUP_INTERVAL):
     grouped = {}
     for price, amount in orders:
@@ -67,86 +129,87 @@ def group_orders(orders, interval=GROUP_INTERVAL):
     
     return sorted(grouped.items(), key=lambda x: x[0])
 
-def update_pair(self, new_pair):
-    global current_symbol, GROUP_INTERVAL
-    if new_pair != current_symbol:
-        current_symbol = new_pair
-        send_telegram_notification(f"Switching to {current_symbol} order book.")
-        self.log_output.append(f"Switching to {current_symbol} order book.")
-        
-        # Update the group interval input value to the default value
-        self.group_interval_input.setValue(GROUP_INTERVAL)
-        self.update_group_interval(GROUP_INTERVAL)
-        
-        self.update_order_book(None)  # Clear the order book table
-
-def update_group_interval(self, value):
-    global GROUP_INTERVAL
-    GROUP_INTERVAL = value
-    send_telegram_notification(f"Group interval set to {value}")
-    self.log_output.append(f"Group interval set to {value}")
-    self.update_order_book(None)  # Trigger a new update of the order book
-
-def update_order_book_thread(self):
-    previous_order_book = None
-    while True:
-        if is_running.is_set():
-            try:
-                current_order_book = fetch_order_book(symbol=current_symbol, limit=5000, group_interval=GROUP_INTERVAL)
-                if current_order_book is None:
-                    raise ValueError("Failed to fetch order book data")
-                
-                bids, asks = analyze_order_book(current_order_book)
-                if bids is None or asks is None:
-                    raise ValueError("Failed to analyze order book data")
-
-                if previous_order_book:
-                    detect_cancellations(previous_order_book, current_order_book)
-
-                bids = sorted(bids, key=lambda x: x[0], reverse=True)
-                asks = sorted(asks, key=lambda x: x[0])
-
-                self.update_signal.emit((bids, asks))
-
-                previous_order_book = current_order_book
-
-            except Exception as e:
-                logging.error(f"Error in update_order_book: {e}")
-                self.log_output.append(f"Error: {e}")
-                self.update_signal.emit(None)
-
-        time.sleep(random.uniform(2, 3))
-
-def fetch_order_book(symbol='BTCUSDT', limit=5000, group_interval=GROUP_INTERVAL):
-    url = f"https://api.binance.com/api/v3/depth"
-    params = {'symbol': symbol, 'limit': limit}
-    try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        order_book = response.json()
-        
-        if 'bids' not in order_book or 'asks' not in order_book:
-            raise ValueError("Invalid order book data: missing 'bids' or 'asks'")
-        
-        bids = group_orders(order_book['bids'], group_interval)
-        asks = group_orders(order_book['asks'], group_interval)
-        
-        return {'bids': bids, 'asks': asks}
-    except requests.RequestException as e:
-        logging.error(f"Error fetching order book: {e}")
-        return None
-    except ValueError as e:
-        logging.error(f"Error processing order book data: {e}")
+def parse_levels(orders):
+    # Parse [price, amount] pairs (strings or numbers) into an (n, 2) float array
+    if isinstance(orders, np.ndarray):
+        return orders.astype(float, copy=False).reshape(-1, 2)
+    flat = np.fromiter(itertools.chain.from_iterable(orders), dtype=float, count=2 * len(orders))
+    return flat.reshape(-1, 2)
+
+def group_orders_array(orders, interval=GROUP_INTERVAL):
+    # Same bucketing as group_orders, done with array operations.
+    # Returns an (n, 2) array of [price, amount] sorted by price.
+    levels = parse_levels(orders)
+    if levels.size == 0:
+        return np.empty((0, 2))
+
+    group_prices = np.round(levels[:, 0] / interval) * interval
+    unique_prices, inverse = np.unique(group_prices, return_inverse=True)
+    amounts = np.bincount(inverse.ravel(), weights=levels[:, 1], minlength=len(unique_prices))
+
+    return np.column_stack((unique_prices, amounts))
+
+def read_order_book(depth_stream, group_interval=GROUP_INTERVAL):
+    # Grouped views are cached and updated incrementally by the live book.
+    # Levels stay in integer ticks/units until display or notification.
+    order_book = depth_stream.grouped_order_book(group_interval)
+    if order_book is None or not len(order_book['bids']) or not len(order_book['asks']):
         return None
 
-def analyze_order_book(order_book, self):
-    if order_book is None:
-        logging.warning("Cannot analyze order book: No data available")
-        return None, None
-    
-    bids = np.array(order_book['bids'], dtype=float)
-    asks = np.array(order_book['asks'], dtype=float)
-    
+    return order_book
+
+def symbol_settings(symbol):
+    # Per-pair settings from default_settings, falling back to the global thresholds
+    settings = {
+        "group_interval": GROUP_INTERVAL,
+        "large_wall_threshold": LARGE_WALL_THRESHOLD,
+        "cancellation_threshold": CANCELLATION_THRESHOLD,
+        "notification_cooldown": NOTIFICATION_COOLDOWN
+    }
+    settings.update(default_settings.get(symbol, {}))
+    return settings
+
+def current_settings():
+    # Everything the settings dialog edits, for the state store
+    return {
+        "group_interval": GROUP_INTERVAL,
+        "large_wall_threshold": LARGE_WALL_THRESHOLD,
+        "cancellation_threshold": CANCELLATION_THRESHOLD,
+        "notification_cooldown": NOTIFICATION_COOLDOWN,
+        "current_symbol": current_symbol,
+        "pairs": default_settings,
+    }
+
+def aggregation_intervals(symbol, multiples=AGGREGATION_MULTIPLES):
+    # The pair's own group interval and coarser ones, so every pair switches
+    # instantly whether it trades in dollars or in tenths of a cent. Rounded
+    # to land on the values the settings dialog produces.
+    group_interval = symbol_settings(symbol)["group_interval"]
+    return tuple(round(group_interval * multiple, 10) for multiple in multiples)
+
+def restore_settings(settings):
+    global GROUP_INTERVAL, LARGE_WALL_THRESHOLD, CANCELLATION_THRESHOLD, NOTIFICATION_COOLDOWN, current_symbol
+    GROUP_INTERVAL = settings.get("group_interval", GROUP_INTERVAL)
+    LARGE_WALL_THRESHOLD = settings.get("large_wall_threshold", LARGE_WALL_THRESHOLD)
+    CANCELLATION_THRESHOLD = settings.get("cancellation_threshold", CANCELLATION_THRESHOLD)
+    NOTIFICATION_COOLDOWN = settings.get("notification_cooldown", NOTIFICATION_COOLDOWN)
+    current_symbol = settings.get("current_symbol", current_symbol)
+    # Updated in place, the GUI holds a reference
+    default_settings.update(settings.get("pairs", {}))
+
+def describe_microstructure(values):
+    # Analysis text from the live book's streaming metrics
+    volatility = values['volatility']
+    return (
+        f"Best Bid: {values['best_bid']}, Best Ask: {values['best_ask']}\n"
+        f"Spread: {values['spread']:.8g}, Mid Price: {values['mid']:.8g}, Microprice: {values['microprice']:.8g}\n"
+        f"Depth ±{MICROSTRUCTURE_BAND:.1%}: bids {values['bid_depth']:.4f}, asks {values['ask_depth']:.4f}, "
+        f"imbalance {values['imbalance']:+.3f}\n"
+        f"Slope: bids {values['bid_slope']:.4g}, asks {values['ask_slope']:.4g} coins per price unit\n"
+        f"Volatility: {'n/a' if volatility is None else f'{volatility:.3e}'} per {VOLATILITY_SAMPLE_SECONDS}s"
+    )
+
+def describe_order_book(bids, asks):
     total_bid_volume = np.sum(bids[:, 1])
     total_ask_volume = np.sum(asks[:, 1])
     
@@ -157,414 +220,958 @@ def analyze_order_book(order_book, self):
     mid_price = (best_ask + best_bid) / 2
     
     # Create a formatted string with the analysis results
-    analysis_result = (
+    return (
         f"Best Bid: {best_bid}, Best Ask: {best_ask}\n"
         f"Spread: {spread}, Mid Price: {mid_price}\n"
         f"Total Bid Volume: {total_bid_volume}, Total Ask Volume: {total_ask_volume}"
     )
-    
-    # Emit a signal to update the GUI log
-    self.log_signal.emit(analysis_result)
-    
-    detect_large_walls(bids, asks)
-    
-    return bids, asks
 
-def detect_large_walls(bids, asks):
-    current_time = time.time()
-    
-    def check_and_notify(orders, side):
-        for price, amount in orders:
-            with lock:
-                if amount > LARGE_WALL_THRESHOLD:
-                    price_key = f"{price:.2f}"
-                    if price_key in last_notified_walls[side]:
-                        last_time, last_amount = last_notified_walls[side][price_key]
-                        if current_time - last_time < NOTIFICATION_COOLDOWN and abs(amount - last_amount) / last_amount < 0.1:
-                            continue  # Skip notification if it's too soon and the change is less than 10%
-                    
-                    last_notified_walls[side][price_key] = (current_time, amount)
-                    send_telegram_notification(f"Large {side} wall detected: {amount:.2f} coins at ${float(price):.2f}")
-                    break  # Only notify about the first wall found
-    
-    check_and_notify(bids, 'bids')
-    check_and_notify(asks, 'asks')
+class Wall:
+    __slots__ = ('side', 'price', 'first_seen', 'last_seen', 'peak', 'history', 'last_notified', 'time_to_cancel')
+
+    def __init__(self, side, price, amount, now, history_length=WALL_HISTORY_LENGTH):
+        self.side = side
+        self.price = price
+        self.first_seen = now
+        self.last_seen = now
+        self.peak = amount
+        self.history = deque([(now, amount)], maxlen=history_length)
+        self.last_notified = None  # (time, amount) of the last alert
+        self.time_to_cancel = None  # set once the wall drops below the threshold
+
+    def observe(self, amount, now):
+        self.last_seen = now
+        self.peak = max(self.peak, amount)
+        self.history.append((now, amount))
+
+    @property
+    def amount(self):
+        return self.history[-1][1]
+
+    @property
+    def active(self):
+        return self.time_to_cancel is None
+
+    def due_notification(self, now, cooldown):
+        # Same rule as before: stay quiet within the cooldown unless the size moved 10% or more
+        if self.last_notified is None:
+            return True
+        last_time, last_amount = self.last_notified
+        return now - last_time >= cooldown or abs(self.amount - last_amount) / last_amount >= 0.1
+
+# Columns of WallTracker.export_state
+WALL_FIELDS = ('price', 'first_seen', 'last_seen', 'peak', 'amount', 'notified_time', 'notified_amount',
+               'time_to_cancel')
+
+class WallTracker:
+    # Walls per side keyed by bucket price. Each side is ordered by last
+    # sighting, which makes TTL eviction a pop from the front, and is capped
+    # at max_walls entries. The walls still above the threshold are also
+    # kept in `active`, so closing the ones missing from a tick only looks
+    # at those. Walls that fall below the threshold stay (inactive) until
+    # evicted so their cooldown survives a brief dip; they are also kept in
+    # `closed`. An evicted wall still in its cooldown leaves its last alert
+    # in `cooldowns` (also capped at max_walls), so a wall back at the same
+    # price after the TTL stays quiet until the cooldown ends.
+    def __init__(self, ttl=WALL_TTL, max_walls=MAX_TRACKED_WALLS, history_length=WALL_HISTORY_LENGTH):
+        self.ttl = ttl
+        self.max_walls = max_walls
+        self.history_length = history_length
+        self.walls = {'bids': OrderedDict(), 'asks': OrderedDict()}
+        self.active = {'bids': {}, 'asks': {}}
+        self.cooldowns = {'bids': OrderedDict(), 'asks': OrderedDict()}
+        self.closed = deque(maxlen=max_walls)
+
+    def update(self, bids, asks, threshold, now=None, cooldown=None):
+        """Track the walls in a grouped book and return those due a notification."""
+        if now is None:
+            now = time.time()
+        if cooldown is None:
+            cooldown = NOTIFICATION_COOLDOWN
+        self.evict(now, cooldown)
+        due = self.update_side('bids', bids, threshold, now, cooldown)
+        due += self.update_side('asks', asks, threshold, now, cooldown)
+        return due
+
+    def update_side(self, side, levels, threshold, now, cooldown):
+        # Integer tick arrays keep integer keys; float books work the same
+        levels = np.asarray(levels).reshape(-1, 2)
+        walls = self.walls[side]
+        active = self.active[side]
+        due = []
+        for price, amount in levels[levels[:, 1] > threshold].tolist():
+            wall = active.get(price)
+            if wall is not None:
+                wall.observe(amount, now)
+                walls.move_to_end(price)
+            else:
+                # New wall, or one back at a recently pulled level: keep its cooldown
+                previous = walls.get(price)
+                wall = Wall(side, price, amount, now, self.history_length)
+                if previous is not None:
+                    wall.last_notified = previous.last_notified
+                    walls.move_to_end(price)
+                else:
+                    wall.last_notified = self.cooldowns[side].pop(price, None)
+                walls[price] = active[price] = wall
+            if wall.due_notification(now, cooldown):
+                wall.last_notified = (now, amount)
+                due.append(wall)
+
+        # Active walls not seen this tick were pulled or filled
+        for price in [price for price, wall in active.items() if wall.last_seen != now]:
+            wall = active.pop(price)
+            wall.time_to_cancel = now - wall.first_seen
+            self.closed.append(wall)
+        return due
+
+    def evict(self, now, cooldown=None):
+        if cooldown is None:
+            cooldown = NOTIFICATION_COOLDOWN
+        for side, walls in self.walls.items():
+            cooldowns = self.cooldowns[side]
+            while walls and (len(walls) > self.max_walls or now - next(iter(walls.values())).last_seen > self.ttl):
+                price, wall = walls.popitem(last=False)
+                self.active[side].pop(price, None)
+                if wall.last_notified is not None and now - wall.last_notified[0] < cooldown:
+                    cooldowns[price] = wall.last_notified
+            # In eviction order rather than alert order, so an expired entry
+            # may wait behind a live one; it is then due again anyway
+            while cooldowns and (len(cooldowns) > self.max_walls or
+                                 now - next(iter(cooldowns.values()))[0] >= cooldown):
+                cooldowns.popitem(last=False)
+
+    def active_walls(self, side):
+        return list(self.active[side].values())
+
+    def export_state(self):
+        """Return each side's walls as a float (n, len(WALL_FIELDS)) array, NaN for unset fields.
+
+        Cooldowns of evicted walls come first, as inactive walls last seen
+        at their alert, so they are evicted back into ``cooldowns`` after a
+        restore.
+        """
+        tables = {}
+        for side, walls in self.walls.items():
+            cooldowns = self.cooldowns[side]
+            table = np.full((len(cooldowns) + len(walls), len(WALL_FIELDS)), np.nan)
+            for row, (price, (notified_time, notified_amount)) in zip(table, cooldowns.items()):
+                row[:] = (price, notified_time, notified_time, notified_amount, notified_amount,
+                          notified_time, notified_amount, 0.0)
+            for row, wall in zip(table[len(cooldowns):], walls.values()):
+                notified_time, notified_amount = wall.last_notified or (np.nan, np.nan)
+                row[:] = (wall.price, wall.first_seen, wall.last_seen, wall.peak, wall.amount,
+                          notified_time, notified_amount, np.nan if wall.time_to_cancel is None else wall.time_to_cancel)
+            tables[side] = table
+        return tables
+
+    def restore_state(self, tables):
+        # Only the latest size of each wall's history is kept
+        for side, table in tables.items():
+            walls = self.walls[side]
+            for price, first_seen, last_seen, peak, amount, notified_time, notified_amount, time_to_cancel in \
+                    table.tolist():
+                # Tick prices come back as ints
+                price = int(price) if price.is_integer() else price
+                wall = Wall(side, price, amount, last_seen, self.history_length)
+                wall.first_seen, wall.peak = first_seen, peak
+                if not math.isnan(notified_time):
+                    wall.last_notified = (notified_time, notified_amount)
+                if not math.isnan(time_to_cancel):
+                    wall.time_to_cancel = time_to_cancel
+                else:
+                    self.active[side][price] = wall
+                walls[price] = wall
+
+# Wall state for the single-book helpers below; each SymbolMonitor has its own
+wall_tracker = WallTracker()
+
+def find_large_walls(bids, asks, threshold=None, tracker=None, cooldown=None, current_time=None):
+    # Returns [(side, price, amount)] for every wall due a notification. The
+    # replay engine passes recorded times.
+    if threshold is None:
+        threshold = LARGE_WALL_THRESHOLD
+    if tracker is None:
+        tracker = wall_tracker
+    walls = tracker.update(bids, asks, threshold, current_time, cooldown)
+    return [(wall.side, wall.price, wall.amount) for wall in walls]
+
+def format_price(price, scale=None):
+    # Cents, or as many decimals as the pair's tick size needs (XRP trades in 0.0001s)
+    return f"{float(price):.{scale.decimals if scale is not None else 2}f}"
+
+def wall_alerts(walls, symbol=None, scale=None):
+    # (message, priority) per wall. With a scale, walls are in integer
+    # ticks/units and are converted back only for the message
+    label = f"{symbol} " if symbol else ""
+    alerts = []
+    for side, price, amount in walls:
+        if scale is not None:
+            price, amount = price * scale.tick_size, amount * scale.step_size
+        alerts.append((f"Large {label}{side} wall detected: {amount:.2f} coins at ${format_price(price, scale)}",
+                       PRIORITY_NORMAL))
+    return alerts
+
+def detect_large_walls(bids, asks, threshold=None, tracker=None, symbol=None, scale=None):
+    walls = find_large_walls(bids, asks, threshold, tracker)
+    for message, priority in wall_alerts(walls, symbol, scale):
+        send_telegram_notification(message, priority)
+    return walls
 
 def play_notification_sound():
+    import winsound  # Windows only, loaded on first use
     winsound.PlaySound("SystemHand", winsound.SND_ALIAS)
 
-def send_telegram_notification(message):
-    try:
-        bot.send_message(CHAT_ID, message)
-    except Exception as e:
-        print(f"Failed to send Telegram notification: {e}")
+def send_telegram_notification(message, priority=PRIORITY_LOW):
+    notifier.submit(message, priority)
     
 
-def detect_cancellations(previous_book, current_book):
-    def compare_orders(prev, curr, side):
-        prev_df = pd.DataFrame(prev, columns=['price', 'amount'])
-        curr_df = pd.DataFrame(curr, columns=['price', 'amount'])
-        
-        merged = prev_df.merge(curr_df, on='price', how='outer', suffixes=('_prev', '_curr'))
-        merged = merged.fillna(0)
-        
-        with lock:
-            cancellations = merged[merged['amount_prev'] - merged['amount_curr'] > CANCELLATION_THRESHOLD]
-        
-        for _, row in cancellations.iterrows():
-            cancelled_amount = row['amount_prev'] - row['amount_curr']
-            color_square = '🟥' if side == 'ask' else '🟩'  # Red square for ask, green for bid
-            send_telegram_notification(f"{color_square} Large {side} spoofing detected: {cancelled_amount:.4f} coins at ${row['price']}")
-
-    compare_orders(previous_book['bids'], current_book['bids'], 'bid')
-    compare_orders(previous_book['asks'], current_book['asks'], 'ask')
-
-def send_current_state(order_book):
+# One row per cancelled price level
+CANCELLATION_DTYPE = np.dtype([
+    ('side', 'U3'),
+    ('price', 'f8'),
+    ('previous', 'f8'),
+    ('current', 'f8'),
+    ('cancelled', 'f8'),
+])
+
+def align_levels(prices, levels):
+    # Amounts of sorted (n, 2) levels placed on a sorted price grid, 0 where
+    # missing. Levels priced off the grid are left out.
+    amounts = np.zeros(len(prices), dtype=levels.dtype)
+    if len(levels) and len(prices):
+        index = np.searchsorted(prices, levels[:, 0])
+        index[index == len(prices)] = 0
+        found = prices[index] == levels[:, 0]
+        amounts[index[found]] = levels[found, 1]
+    return amounts
+
+def find_cancellations(previous_levels, current_levels, threshold, side):
+    # Merge-join two price-sorted level arrays and return the levels whose
+    # amount dropped by more than the threshold as a CANCELLATION_DTYPE array
+    previous_levels = np.asarray(previous_levels, dtype=float).reshape(-1, 2)
+    current_levels = np.asarray(current_levels, dtype=float).reshape(-1, 2)
+
+    prices = np.union1d(previous_levels[:, 0], current_levels[:, 0])
+    previous = align_levels(prices, previous_levels)
+    current = align_levels(prices, current_levels)
+    return cancellation_events(prices, previous, current, threshold, side)
+
+def cancellation_events(prices, previous, current, threshold, side):
+    cancelled = previous - current
+    mask = cancelled > threshold
+
+    events = np.empty(np.count_nonzero(mask), dtype=CANCELLATION_DTYPE)
+    events['side'] = side
+    events['price'] = prices[mask]
+    events['previous'] = previous[mask]
+    events['current'] = current[mask]
+    events['cancelled'] = cancelled[mask]
+    return events
+
+def decimal_events(events, scale):
+    # Cancellation events found on an integer book, in prices and coins
+    events = events.copy()
+    events['price'] *= scale.tick_size
+    for field in ('previous', 'current', 'cancelled'):
+        events[field] *= scale.step_size
+    return events
+
+def cancellation_alerts(events, symbol=None, scale=None):
+    # Events in prices and coins; the scale only sets how many decimals prices get
+    label = f"{symbol} " if symbol else ""
+    alerts = []
+    for event in events:
+        color_square = '🟥' if event['side'] == 'ask' else '🟩'  # Red square for ask, green for bid
+        alerts.append((f"{color_square} Large {label}{event['side']} spoofing detected: {event['cancelled']:.4f} coins at ${format_price(event['price'], scale)}", PRIORITY_HIGH))
+    return alerts
+
+def notify_cancellations(events, symbol=None):
+    for message, priority in cancellation_alerts(events, symbol):
+        send_telegram_notification(message, priority)
+
+def detect_cancellations(previous_book, current_book, threshold=None, symbol=None):
+    if threshold is None:
+        threshold = CANCELLATION_THRESHOLD
+
+    events = np.concatenate([
+        find_cancellations(previous_book['bids'], current_book['bids'], threshold, 'bid'),
+        find_cancellations(previous_book['asks'], current_book['asks'], threshold, 'ask'),
+    ])
+    notify_cancellations(events, symbol)
+    return events
+
+class CancellationDetector:
+    # Keeps the last `window` grouped books per side. A level is reported when
+    # its amount falls more than the threshold below its peak in the window,
+    # so a wall pulled in steps over several ticks is still caught. Reported
+    # levels have their peak reset to avoid repeating the same alert. Only
+    # prices inside the current book's deepest level are compared: beyond it
+    # (after a shallower resync snapshot, or levels dropped by
+    # MAX_BOOK_LEVELS) a level is unknown rather than cancelled, and the
+    # deepest bucket may be only partly covered.
+    #
+    # Books are copied into reused buffers, one more per side than the
+    # window holds, so the buffer written by an update has already left the
+    # window. A book that outgrows its buffer gets one a tenth larger.
+    def __init__(self, window=CANCELLATION_WINDOW):
+        self.window = window
+        self.history = {'bids': deque(maxlen=window), 'asks': deque(maxlen=window)}
+        self.buffers = {'bids': [None] * (window + 1), 'asks': [None] * (window + 1)}
+        self.updates = 0
+
+    def store(self, key, levels):
+        levels = np.asarray(levels).reshape(-1, 2)
+        buffers = self.buffers[key]
+        slot = self.updates % len(buffers)
+        buffer = buffers[slot]
+        if buffer is None or buffer.dtype != levels.dtype:
+            buffer = buffers[slot] = np.empty_like(levels)
+        elif len(buffer) < len(levels):
+            buffer = buffers[slot] = np.empty((len(levels) + len(levels) // 10, 2), dtype=levels.dtype)
+        stored = buffer[:len(levels)]
+        stored[:] = levels
+        return stored
+
+    def update(self, order_book, threshold):
+        events = []
+        for key, side in (('bids', 'bid'), ('asks', 'ask')):
+            levels = self.store(key, order_book[key])
+            history = self.history[key]
+            if history and len(levels):
+                prices = np.unique(np.concatenate([past[:, 0] for past in history] + [levels[:, 0]]))
+                if key == 'bids':
+                    prices = prices[prices > levels[:, 0].min()]
+                else:
+                    prices = prices[prices < levels[:, 0].max()]
+                peak = np.zeros(len(prices), dtype=levels.dtype)
+                for past in history:
+                    np.maximum(peak, align_levels(prices, past), out=peak)
+                current = align_levels(prices, levels)
+
+                side_events = cancellation_events(prices, peak, current, threshold, side)
+                if len(side_events):
+                    self.reset_peaks(history, side_events)
+                events.append(side_events)
+            history.append(levels)
+        self.updates += 1
+
+        if not events:
+            return np.empty(0, dtype=CANCELLATION_DTYPE)
+        return np.concatenate(events)
+
+    @staticmethod
+    def reset_peaks(history, events):
+        for past in history:
+            index = np.searchsorted(events['price'], past[:, 0])
+            index[index == len(events)] = 0
+            matched = events['price'][index] == past[:, 0]
+            past[matched, 1] = np.minimum(past[matched, 1], events['current'][index[matched]])
+
+def base_asset(symbol):
+    # BTCUSDT -> BTC, for amounts in messages
+    for quote in QUOTE_ASSETS:
+        if symbol.endswith(quote) and len(symbol) > len(quote):
+            return symbol[:-len(quote)]
+    return symbol
+
+def send_current_state(order_book, symbol=None):
     if order_book is None:
         send_telegram_notification("No order book data available.")
         return
-    
-    bids = order_book['bids']
-    asks = order_book['asks']
+    if symbol is None:
+        symbol = current_symbol
+
+    bids = np.asarray(order_book['bids'], dtype=float).reshape(-1, 2)
+    asks = np.asarray(order_book['asks'], dtype=float).reshape(-1, 2)
+    scale = order_book.get('scale')
+    if scale is not None:
+        bids = scale.to_decimal(bids)
+        asks = scale.to_decimal(asks)
+    # Frames keep both sides ascending; the top of the book comes first here
+    bids = bids[np.argsort(-bids[:, 0], kind='stable')]
+    asks = asks[np.argsort(asks[:, 0], kind='stable')]
     current_price = (float(bids[0][0]) + float(asks[0][0])) / 2
-    
-    message = f"Current Price: ${current_price:.2f}\n\n"
+    asset = base_asset(symbol)
+
+    message = f"{symbol} Current Price: ${format_price(current_price, scale)}\n\n"
     message += "Top 5 Bids:\n"
     for price, amount in bids[:5]:
-        message += f"${float(price):.2f}: {float(amount):.4f} BTC\n"
-    
+        message += f"${format_price(price, scale)}: {float(amount):.4f} {asset}\n"
+
     message += "\nTop 5 Asks:\n"
     for price, amount in asks[:5]:
-        message += f"${float(price):.2f}: {float(amount):.4f} BTC\n"
-    
+        message += f"${format_price(price, scale)}: {float(amount):.4f} {asset}\n"
+
     send_telegram_notification(message)
 
-class SettingsDialog(QDialog):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("Settings")
-        self.setFixedSize(300, 250)  # Set a fixed size for the dialog
-
-        self.setStyleSheet("""
-            QWidget {
-                background-color: #161A1E;
-                color: white;
-            }
-            QPushButton {
-                background-color: #FCD535;
-                color: black;
-                border: none;
-                padding: 5px;
-                border-radius: 5px;
-                min-width: 20px;
-                min-height: 20px;
-            }
-            QPushButton:hover {
-                background-color: #FFE14D;
-            }
-            QSpinBox, QDoubleSpinBox, QComboBox {
-                background-color: #2B2B2B;
-                color: white;
-                border: 1px solid #3A3A3A;
-            }
-        """)
-        self.setup_ui()
-
-    def setup_ui(self):
-        layout = QFormLayout(self)
-
-        layout.setContentsMargins(20, 20, 20, 20)
-        layout.setSpacing(15)
-
-        self.pair_dropdown = QComboBox()
-        self.pair_dropdown.addItems(['BTCUSDT', 'ETHUSDT', 'XRPUSDT'])
-        self.pair_dropdown.currentTextChanged.connect(self.load_pair_settings)
-        layout.addRow("Trading Pair:", self.pair_dropdown)
-
-        self.group_interval_input = QSpinBox()
-        self.group_interval_input.setRange(10, 1000)
-        layout.addRow("Group by:", self.group_interval_input)
-
-        self.large_wall_input = QDoubleSpinBox()
-        self.large_wall_input.setRange(0, 1000000)
-        layout.addRow("Big orders alert:", self.large_wall_input)
-
-        self.cancellation_input = QDoubleSpinBox()
-        self.cancellation_input.setRange(0, 1000000)
-        layout.addRow("Spoofing detection:", self.cancellation_input)
-
-        self.cooldown_input = QSpinBox()
-        self.cooldown_input.setRange(0, 86400)
-        layout.addRow("Notification Cooldown (s):", self.cooldown_input)
-
-        save_button = QPushButton("Save")
-        save_button.clicked.connect(self.save_settings)
-        layout.addRow(save_button)
-
-        self.load_pair_settings(self.pair_dropdown.currentText())
-
-    def load_pair_settings(self, pair):
-        if pair in default_settings:
-            settings = default_settings[pair]
-            self.group_interval_input.setValue(settings["group_interval"])
-            self.large_wall_input.setValue(settings["large_wall_threshold"])
-            self.cancellation_input.setValue(settings["cancellation_threshold"])
-        self.cooldown_input.setValue(NOTIFICATION_COOLDOWN)
-
-    def save_settings(self):
-        global GROUP_INTERVAL, LARGE_WALL_THRESHOLD, CANCELLATION_THRESHOLD, NOTIFICATION_COOLDOWN, current_symbol
-        current_symbol = self.pair_dropdown.currentText()
-        GROUP_INTERVAL = self.group_interval_input.value()
-        LARGE_WALL_THRESHOLD = self.large_wall_input.value()
-        CANCELLATION_THRESHOLD = self.cancellation_input.value()
-        NOTIFICATION_COOLDOWN = self.cooldown_input.value()
-
-        default_settings[current_symbol] = {
-            "group_interval": GROUP_INTERVAL,
-            "large_wall_threshold": LARGE_WALL_THRESHOLD,
-            "cancellation_threshold": CANCELLATION_THRESHOLD
+def book_staleness(book):
+    # Seconds since the live book last changed, None before the first snapshot
+    if book.last_event_time is None:
+        return None
+    return time.time() - book.last_event_time
+
+def book_levels(book):
+    return len(book.bids) + len(book.asks)
+
+# Immutable input of the analysis stage: one pair's grouped book at one moment.
+# bids/asks are read-only int64 arrays shared with the live book's cache.
+# microstructure holds the live book's MicrostructureTracker values (or None),
+# rules the (version, rules) of the pair's alert rules.
+BookFrame = namedtuple('BookFrame', ['symbol', 'time', 'scale', 'bids', 'asks', 'settings', 'microstructure',
+                                     'rules'])
+
+class SymbolAnalyzer:
+    # Detection state for one pair, kept wherever its frames are analyzed:
+    # wall cooldowns, the recent books the cancellation detector compares and
+    # the compiled alert rules with their dedup state.
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.group_interval = None
+        self.wall_tracker = WallTracker()
+        self.cancellation_detector = CancellationDetector()
+        self.rule_engine = RuleEngine(symbol)
+
+    def analyze(self, frame):
+        """Run detection on a BookFrame and return the result as plain data.
+
+        Alerts are returned as (message, priority) pairs rather than sent, so
+        this can run in another process.
+        """
+        settings = frame.settings
+        if settings["group_interval"] != self.group_interval:
+            # Books grouped at different intervals can't be compared
+            self.group_interval = settings["group_interval"]
+            self.cancellation_detector = CancellationDetector()
+
+        # Detection runs on integer ticks/units; thresholds are converted once
+        scale = frame.scale
+        timings = {}
+        start = time.perf_counter()
+        decimal_bids = scale.to_decimal(frame.bids)
+        decimal_asks = scale.to_decimal(frame.asks)
+        if frame.microstructure is not None:
+            analysis = describe_microstructure(frame.microstructure)
+        else:
+            analysis = describe_order_book(decimal_bids, decimal_asks)
+        timings['analyze'], start = time.perf_counter() - start, time.perf_counter()
+
+        walls = find_large_walls(frame.bids, frame.asks, scale.qty_units(settings["large_wall_threshold"]),
+                                 self.wall_tracker, settings["notification_cooldown"], frame.time)
+        timings['detect_walls'], start = time.perf_counter() - start, time.perf_counter()
+
+        events = self.cancellation_detector.update({'bids': frame.bids, 'asks': frame.asks},
+                                                   scale.qty_units(settings["cancellation_threshold"]))
+        timings['detect_cancellations'], start = time.perf_counter() - start, time.perf_counter()
+
+        rule_alerts = self.rule_engine.evaluate(frame)
+        timings['alert_rules'] = time.perf_counter() - start
+
+        return {
+            'analysis': analysis,
+            'bids': decimal_bids[::-1],
+            'asks': decimal_asks,
+            'alerts': wall_alerts(walls, self.symbol, scale) +
+                      cancellation_alerts(decimal_events(events, scale), self.symbol, scale) + rule_alerts,
+            'timings': timings,
+            'memory': self.memory_usage(),
+        }
+
+    def memory_usage(self):
+        # Entries of every bounded per-price state, for the memory report
+        return {
+            'tracked_walls': sum(len(walls) for walls in self.wall_tracker.walls.values()),
+            'closed_walls': len(self.wall_tracker.closed),
+            'wall_cooldowns': sum(len(cooldowns) for cooldowns in self.wall_tracker.cooldowns.values()),
+            'rule_entries': sum(len(state.alerted) for state in self.rule_engine.states.values()),
+            'cancellation_levels': sum(len(levels) for history in self.cancellation_detector.history.values()
+                                       for levels in history),
         }
 
-        self.accept()
-
-class OrderBookGUI(QMainWindow):
-    update_signal = pyqtSignal(object)
-    log_signal = pyqtSignal(str)
-
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Cryptocurrency Order Book")
-        self.setFixedSize(300, 800)  # Set initial size to 200x800
-        self.setup_ui()
-        self.update_signal.connect(self.update_order_book)
-        self.log_signal.connect(self.update_log)
-        self.start_update_thread()
-
-    def setup_ui(self):
-        self.setStyleSheet("""
-            QWidget {
-                background-color: #161A1E;
-                color: white;
-            }
-            QPushButton {
-                background-color: #FCD535;
-                color: black;
-                border: none;
-                padding: 5px;
-                border-radius: 5px;
-                min-width: 20px;
-                min-height: 20px;
-            }
-            QPushButton:hover {
-                background-color: #FFE14D;
-            }
-            QTableWidget {
-                gridline-color: #2B2B2B;
-            }
-            QHeaderView::section {
-                background-color: #2B2B2B;
-                color: white;
-            }
-            QTableWidget QTableCornerButton::section {
-                background-color: #2B2B2B;
-            }
-        """)
-
-        central_widget = QWidget()
-        self.setCentralWidget(central_widget)
-        main_layout = QHBoxLayout(central_widget)
-
-        # Left side (Order book)
-        left_widget = QWidget()
-        self.left_widget = left_widget  # Add this line
-        left_layout = QVBoxLayout(left_widget)
-            
-        # Order book table
-        self.order_book_table = QTableWidget()
-        self.order_book_table.setColumnCount(2)
-        self.order_book_table.setHorizontalHeaderLabels(["Price", "Amount"])
-        self.order_book_table.horizontalHeader().setStretchLastSection(True)
-        left_layout.addWidget(self.order_book_table)
-
-        # Current price label
-        self.current_price_label = QLabel("Current Price: N/A")
-        self.current_price_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.current_price_label.setFont(QFont("Arial", 14, QFont.Weight.Bold))
-        left_layout.addWidget(self.current_price_label)
-
-        # Control panel
-        control_layout = QHBoxLayout()
-        left_layout.addLayout(control_layout)
-
-        # Start/Stop button
-        self.start_stop_button = QPushButton("Stop")
-        self.start_stop_button.clicked.connect(self.toggle_updates)
-        control_layout.addWidget(self.start_stop_button)
-
-        # Settings button
-        self.settings_button = QPushButton("Settings")
-        self.settings_button.clicked.connect(self.open_settings)
-        control_layout.addWidget(self.settings_button)
-
-        # Toggle log button
-        self.toggle_log_button = QPushButton("Hide Log")
-        self.toggle_log_button.clicked.connect(self.toggle_log_output)
-        control_layout.addWidget(self.toggle_log_button)
-
-        # Right side (Log output)
-        self.log_output = QTextEdit()
-        self.log_output.setReadOnly(True)
-        self.log_output.setMinimumWidth(400)  # Set a minimum width for the log output
-        self.log_output.hide()  # Hide the log output by default
-
-        # Create a splitter
-        
-        self.splitter = QSplitter(Qt.Orientation.Horizontal)
-        self.splitter.addWidget(left_widget)
-        self.splitter.addWidget(self.log_output)
-        self.splitter.setCollapsible(0, False)
-        self.splitter.setCollapsible(1, False)
-        self.splitter.setSizes([300, 0])  # Initially, only show the order book
-
-        main_layout.addWidget(self.splitter)
-
-        # Hide the log output initially
-        self.log_output.hide()
-
-        # Update the toggle log button text
-        self.toggle_log_button.setText("Show Log")
-
-
-    def set_column_widths(self):
-        self.order_book_table.setColumnWidth(0, 95)  # Price column
-        self.order_book_table.setColumnWidth(1, 95)  # Amount column
-
-    def toggle_log_output(self):
-        if self.log_output.isVisible():
-            self.log_output.hide()
-            self.toggle_log_button.setText("Show Log")
-            self.setFixedSize(300, 800)
-            self.splitter.setSizes([300, 0])
+    def export_state(self):
+        """Return wall, rule and cancellation baseline state as (meta, arrays) for the state store."""
+        meta = {'group_interval': self.group_interval, 'rules': self.rule_engine.export_state()}
+        arrays = {f'walls/{side}': table for side, table in self.wall_tracker.export_state().items()}
+        for side, history in self.cancellation_detector.history.items():
+            for index, levels in enumerate(history):
+                # Copied: reported cancellations lower the peaks in place
+                arrays[f'cancel/{side}/{index}'] = np.array(levels)
+        return meta, arrays
+
+    def restore_state(self, meta, arrays):
+        self.wall_tracker.restore_state({side: arrays[f'walls/{side}'] for side in ('bids', 'asks')
+                                         if f'walls/{side}' in arrays})
+        self.rule_engine.restore_state(meta.get('rules', {}))
+        windows = prefixed(arrays, 'cancel')
+        if windows:
+            self.group_interval = meta['group_interval']
+            for side, history in self.cancellation_detector.history.items():
+                history.extend(windows[f'{side}/{index}'] for index in range(history.maxlen)
+                               if f'{side}/{index}' in windows)
+
+# Analyzers of the pairs handled by this process, see analyze_frame
+analyzers = {}
+
+def analyze_frame(frame, restore=None, export=False):
+    # Entry point of the analysis stage, on a worker thread or in a worker
+    # process. A pair always goes to the same executor, one frame at a time,
+    # so its analyzer state stays where its frames are analyzed. `restore`
+    # is saved state to start from; with `export` the result also carries the
+    # state to save.
+    analyzer = analyzers.get(frame.symbol)
+    if analyzer is None:
+        analyzer = analyzers[frame.symbol] = SymbolAnalyzer(frame.symbol)
+    if restore is not None:
+        analyzer.restore_state(*restore)
+    result = analyzer.analyze(frame)
+    if export:
+        result['state'] = analyzer.export_state()
+    return result
+
+def export_analyzer_state(symbol):
+    # Analyzer state of a pair on its executor, None if it never analyzed a frame
+    analyzer = analyzers.get(symbol)
+    return analyzer.export_state() if analyzer is not None else None
+
+class SymbolMonitor:
+    # Main-process side of one pair: its live book, the executor its frames
+    # are analyzed on, the latest result published for the GUI and its depth
+    # history for the heatmap. Frames are
+    # taken faster while the book churns and back off exponentially while
+    # analysis fails. Published results are also passed to every
+    # `listeners(symbol, frame, result)`, e.g. a fan-out server.
+    def __init__(self, symbol, depth_stream, executor=None, listeners=()):
+        self.symbol = symbol
+        self.depth_stream = depth_stream
+        self.executor = executor
+        self.listeners = listeners
+        self.previous_order_book = None
+        self.latest = None  # (bids descending, asks ascending) ready for display
+        self.analysis = None
+        self.future = None
+        self.interval = REFRESH_INTERVAL
+        self.next_tick = 0.0
+        self.last_changes = (time.monotonic(), 0)
+        self.history = DepthHistory(HEATMAP_COLUMNS, HEATMAP_BUCKETS, HEATMAP_COLUMN_SECONDS)
+        self.microstructure = None  # latest MicrostructureTracker values
+        self.restore = None  # saved analyzer state, sent with the next frame
+        self.export_requested = False
+        self.analyzer_state = None  # (meta, arrays) last exported by the analyzer
+        self.analyzer_memory = {}  # SymbolAnalyzer.memory_usage() of the last frame
+
+    def frame(self):
+        settings = symbol_settings(self.symbol)
+        with metrics.timer('group'):
+            order_book = read_order_book(self.depth_stream, settings["group_interval"])
+        if order_book is None:
+            return None
+        rules = alert_rules.rules_for(self.symbol) if alert_rules is not None else (0, ())
+        return BookFrame(self.symbol, time.time(), order_book['scale'], order_book['bids'], order_book['asks'],
+                         settings, order_book['microstructure'], rules)
+
+    def submit(self):
+        # Hand the current frame to the analysis stage; False if the book isn't ready
+        frame = self.frame()
+        if frame is None:
+            return False
+        restore, self.restore = self.restore, None
+        export, self.export_requested = self.export_requested, False
+        self.future = self.executor.submit(analyze_frame, frame, restore, export)
+        self.future.add_done_callback(functools.partial(self.finish, frame))
+        return True
+
+    def finish(self, frame, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            logging.error(f"Error monitoring {self.symbol}: {e}")
+            metrics.inc('tick_errors')
+            self.interval = min(self.interval * 2, MAX_REFRESH_INTERVAL)
+            return
+        self.publish(frame, result)
+        self.interval = self.adaptive_interval()
+
+    def publish(self, frame, result):
+        # Alerts go to the alerting stage; the rest is cached for the GUI
+        for stage, seconds in result['timings'].items():
+            metrics.observe(stage, seconds)
+        for message, priority in result['alerts']:
+            send_telegram_notification(message, priority)
+        pushed = self.history.push(frame.time, frame.bids, frame.asks,
+                                   frame.scale.interval_ticks(frame.settings["group_interval"]), frame.scale)
+        recorder = self.depth_stream.recorder
+        if pushed and recorder is not None and frame.microstructure is not None:
+            recorder.record_metrics(self.symbol, frame.microstructure, frame.time)
+        self.microstructure = frame.microstructure
+        self.previous_order_book = {'bids': frame.bids, 'asks': frame.asks, 'scale': frame.scale}
+        self.latest = (result['bids'], result['asks'])
+        self.analysis = result['analysis']
+        if 'state' in result:
+            self.analyzer_state = result['state']
+        self.analyzer_memory = result['memory']
+        for listener in self.listeners:
+            listener(self.symbol, frame, result)
+
+    def adaptive_interval(self):
+        # REFRESH_INTERVAL up to FAST_CHANGE_RATE level updates per second,
+        # shrinking in proportion above it down to MIN_REFRESH_INTERVAL
+        now = time.monotonic()
+        changes = self.depth_stream.book.changes
+        last_time, last_changes = self.last_changes
+        self.last_changes = (now, changes)
+        rate = max(changes - last_changes, 0) / max(now - last_time, 1e-3)
+        if rate <= FAST_CHANGE_RATE:
+            return REFRESH_INTERVAL
+        return max(MIN_REFRESH_INTERVAL, REFRESH_INTERVAL * FAST_CHANGE_RATE / rate)
+
+    def memory_usage(self):
+        # Sizes of the live book, its cached views and the pair's other state
+        depth_stream = self.depth_stream
+        with depth_stream.book_lock:
+            book = depth_stream.book
+            usage = {'book_levels': book_levels(book),
+                     'view_buckets': sum(len(buckets) for view in book.views.values()
+                                         for buckets in view.sides.values()),
+                     'pending_events': len(depth_stream.pending)}
+        usage['heatmap_bytes'] = self.history.depth.nbytes + self.history.base.nbytes + self.history.times.nbytes
+        usage.update(self.analyzer_memory)
+        return usage
+
+    def display(self):
+        # Current book at the pair's group interval, read from the cached
+        # views so a changed interval shows without waiting for a tick
+        order_book = read_order_book(self.depth_stream, symbol_settings(self.symbol)["group_interval"])
+        if order_book is None:
+            return None
+        scale = order_book['scale']
+        return scale.to_decimal(order_book['bids'])[::-1], scale.to_decimal(order_book['asks'])
+
+class MultiSymbolMonitor:
+    # Watches many pairs with one combined depth stream, one keep-alive HTTP
+    # session and bounded worker pools. Snapshot fetches share
+    # REQUEST_WEIGHT_BUDGET, which follows the weight Binance reports, and ask
+    # for the cheapest depth that still covers the levels on screen.
+    #
+    # Stages: the feed thread keeps the books current, the scheduler takes
+    # immutable frames from them, analysis runs on threads or, with
+    # `processes`, on single-process executors each owning a shard of the
+    # pairs, and alerts go to the notifier's bounded queue. A pair has at most
+    # one frame in analysis; a frame due while it is busy is dropped, so a
+    # slow stage skips stale books instead of queueing them.
+    #
+    # With a `state_store`, books and analyzer state are restored from its
+    # loaded snapshot and saved every STATE_SAVE_INTERVAL and on stop.
+    #
+    # `feed`, `snapshot_fn` and `scale_fn` reach Binance; a ReplayDepthFeed
+    # stands in for all three in tests.
+    def __init__(self, symbols, feed=binance_combined_depth_feed, max_workers=MAX_WORKERS,
+                 max_fetch_workers=MAX_FETCH_WORKERS, weight_budget=REQUEST_WEIGHT_BUDGET,
+                 snapshot_limit=SNAPSHOT_LIMIT, recorder=None, interval_multiples=AGGREGATION_MULTIPLES,
+                 processes=ANALYSIS_PROCESSES, state_store=None, snapshot_fn=fetch_depth_snapshot,
+                 scale_fn=fetch_price_scale):
+        self.feed = feed
+        self.snapshot_fn = snapshot_fn
+        self.scale_fn = scale_fn
+        self.recorder = recorder
+        self.state_store = state_store
+        self.interval_multiples = interval_multiples
+        self.snapshot_limit = snapshot_limit
+        self.session = create_session(max_fetch_workers)
+        self.budget = RequestWeightBudget(weight_budget)
+        if processes:
+            # Spawned, not forked: the parent already runs network threads
+            context = multiprocessing.get_context('spawn')
+            self.executors = [ProcessPoolExecutor(1, mp_context=context) for _ in range(processes)]
         else:
-            self.log_output.show()
-            self.toggle_log_button.setText("Hide Log")
-            self.setFixedSize(600, 800)
-            self.splitter.setSizes([300, 300])
-    def open_settings(self):
-        dialog = SettingsDialog(self)
-        if dialog.exec():
-            self.update_order_book(None)  # Trigger a new update of the order book
-
-    def start_update_thread(self):
-        self.update_thread = threading.Thread(target=self.update_order_book_thread, daemon=True)
-        self.update_thread.start()
-
-    def update_order_book_thread(self):
-        previous_order_book = None
-        while True:
-            if is_running.is_set():
+            self.executors = [ThreadPoolExecutor(max_workers, thread_name_prefix="monitor")]
+        self.fetch_executor = ThreadPoolExecutor(max_fetch_workers, thread_name_prefix="snapshot")
+        self.monitors = {}
+        self.listeners = []
+        self.stop_event = threading.Event()
+        self.reconnect_event = threading.Event()
+        self.save_event = threading.Event()
+        self.threads = {}
+        for symbol in symbols:
+            self.watch(symbol)
+        if state_store is not None and state_store.restored is not None:
+            self.restore_state(*state_store.restored)
+
+    def fetch_snapshot(self, symbol, limit):
+        limit = self.depth_limit(symbol, limit)
+        if not self.budget.acquire(depth_request_weight(limit), self.stop_event):
+            raise RuntimeError("Monitor stopped")
+        return self.snapshot_fn(symbol, limit, session=self.session, budget=self.budget)
+
+    def depth_limit(self, symbol, max_limit):
+        depth_stream = self.monitors[symbol].depth_stream
+        price_range = symbol_settings(symbol)["group_interval"] * VISIBLE_LEVELS
+        with depth_stream.book_lock:
+            return covering_depth_limit(depth_stream.book, price_range, max_limit)
+
+    def fetch_scale(self, symbol):
+        if not self.budget.acquire(EXCHANGE_INFO_WEIGHT, self.stop_event):
+            raise RuntimeError("Monitor stopped")
+        return self.scale_fn(symbol, session=self.session, budget=self.budget)
+
+    def watch(self, symbol):
+        if symbol not in self.monitors:
+            if symbol not in default_settings:
+                logging.warning(f"No settings for {symbol}, using the global group interval and thresholds; "
+                                f"add it to default_settings")
+            depth_stream = DepthStream(symbol, snapshot_fn=self.fetch_snapshot, snapshot_limit=self.snapshot_limit,
+                                       executor=self.fetch_executor, recorder=self.recorder,
+                                       intervals=aggregation_intervals(symbol, self.interval_multiples),
+                                       scale_fn=self.fetch_scale, max_levels=MAX_BOOK_LEVELS,
+                                       microstructure=MicrostructureTracker(
+                                           MICROSTRUCTURE_BAND, volatility_window=VOLATILITY_WINDOW,
+                                           sample_interval=VOLATILITY_SAMPLE_SECONDS))
+            executor = self.executors[len(self.monitors) % len(self.executors)]
+            self.monitors[symbol] = SymbolMonitor(symbol, depth_stream, executor, self.listeners)
+            metrics.gauge('book_staleness_seconds', functools.partial(book_staleness, depth_stream.book), symbol=symbol)
+            metrics.gauge('book_levels', functools.partial(book_levels, depth_stream.book), symbol=symbol)
+            self.reconnect_event.set()  # resubscribe with the new symbol
+        return self.monitors[symbol]
+
+    def start(self):
+        targets = {'feed': self.run_feed, 'scheduler': self.run_scheduler}
+        if self.state_store is not None:
+            targets['state'] = self.run_state_saver
+        self.threads = {name: threading.Thread(target=target, daemon=True) for name, target in targets.items()}
+        for thread in self.threads.values():
+            thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.reconnect_event.set()
+        self.save_event.set()
+        if self.state_store is not None:
+            # No frame may be in analysis while the analyzers are exported
+            for name in ('scheduler', 'state'):
+                if name in self.threads:
+                    self.threads[name].join(5)
+            self.save_state(final=True)
+        for executor in self.executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self.fetch_executor.shutdown(wait=False, cancel_futures=True)
+
+    def run_feed(self):
+        backoff = Backoff()
+        while not self.stop_event.is_set():
+            self.reconnect_event.clear()
+            monitors = dict(self.monitors)
+            for monitor in monitors.values():
+                monitor.depth_stream.reset()
+            delay = 1
+            try:
+                for message in self.feed(list(monitors), self.reconnect_event):
+                    backoff.reset()
+                    monitor = monitors.get(message['stream'].split('@')[0].upper())
+                    if monitor is not None:
+                        monitor.depth_stream.handle(message['data'])
+            except Exception as e:
+                delay = backoff.next_delay()
+                logging.error(f"Error in combined depth stream: {e}, reconnecting in {delay:.1f}s")
+            self.stop_event.wait(delay)
+
+    def restore_state(self, meta, arrays):
+        # Cooldowns always carry over; books and cancellation baselines only
+        # while recent enough to describe the market the stream resumes on
+        fresh = time.time() - meta['saved_at'] <= STATE_MAX_AGE
+        for symbol, saved in meta.get('symbols', {}).items():
+            monitor = self.monitors.get(symbol)
+            if monitor is None:
+                continue
+            if fresh and saved.get('book') is not None:
+                monitor.depth_stream.restore_state(saved['book'], prefixed(arrays, f'{symbol}/book'))
+            if saved.get('analyzer') is not None:
+                analyzer_arrays = prefixed(arrays, f'{symbol}/analyzer')
+                if not fresh:
+                    analyzer_arrays = {name: array for name, array in analyzer_arrays.items()
+                                       if not name.startswith('cancel/')}
+                monitor.restore = monitor.analyzer_state = (saved['analyzer'], analyzer_arrays)
+        logging.info(f"Restored state saved {time.time() - meta['saved_at']:.0f}s ago"
+                     f"{'' if fresh else ', too old for books'}")
+
+    def save_state(self, final=False):
+        """Snapshot settings, books and analyzer state into the state store.
+
+        Analyzer state is the last one exported alongside a frame; with
+        ``final`` (scheduler stopped) it is exported from every executor first.
+        """
+        if final:
+            for monitor in self.monitors.values():
                 try:
-                    current_order_book = fetch_order_book(symbol=current_symbol, limit=5000, group_interval=GROUP_INTERVAL)
-                    if current_order_book is None:
-                        raise ValueError("Failed to fetch order book data")
-                    
-                    bids, asks = analyze_order_book(current_order_book, self)
-                    if bids is None or asks is None:
-                        raise ValueError("Failed to analyze order book data")
-
-                    if previous_order_book:
-                        detect_cancellations(previous_order_book, current_order_book)
-
-                    bids = sorted(bids, key=lambda x: x[0], reverse=True)
-                    asks = sorted(asks, key=lambda x: x[0])
-
-                    self.update_signal.emit((bids, asks))
-
-                    previous_order_book = current_order_book
-
+                    if monitor.future is not None:
+                        monitor.future.result(timeout=5)
+                    state = monitor.executor.submit(export_analyzer_state, monitor.symbol).result(timeout=5)
                 except Exception as e:
-                    logging.error(f"Error in update_order_book: {e}")
-                    self.log_output.append(f"Error: {e}")
-                    self.update_signal.emit(None)
-
-            time.sleep(random.uniform(2, 3))
+                    logging.error(f"Could not export the state of {monitor.symbol}: {e}")
+                    continue
+                if state is not None:
+                    monitor.analyzer_state = state
+
+        meta, arrays = {'settings': current_settings(), 'symbols': {}}, {}
+        with metrics.timer('state_capture'):
+            for symbol, monitor in self.monitors.items():
+                saved = meta['symbols'][symbol] = {'book': None, 'analyzer': None}
+                book = monitor.depth_stream.export_state()
+                if book is not None:
+                    saved['book'] = book[0]
+                    arrays.update((f'{symbol}/book/{name}', array) for name, array in book[1].items())
+                if monitor.analyzer_state is not None:
+                    saved['analyzer'] = monitor.analyzer_state[0]
+                    arrays.update((f'{symbol}/analyzer/{name}', array)
+                                  for name, array in monitor.analyzer_state[1].items())
+        try:
+            with metrics.timer('state_write'):
+                self.state_store.save(meta, arrays)
+        except OSError as e:
+            logging.error(f"Failed to save state to {self.state_store.path}: {e}")
+
+    def request_state_save(self):
+        # E.g. after a settings change, instead of waiting for the interval
+        self.save_event.set()
+
+    def settings(self):
+        return current_settings()
+
+    def memory_report(self):
+        """Process RSS in bytes and the size of every pair's bounded state."""
+        return {'rss_bytes': process_rss(), 'alert_queue': notifier.queue_depth(),
+                'symbols': {symbol: monitor.memory_usage() for symbol, monitor in self.monitors.items()}}
+
+    def log_memory_report(self):
+        report = self.memory_report()
+        rss = report['rss_bytes']
+        logging.info(f"Memory: RSS {rss / 2 ** 20:.1f}MB, {report['alert_queue']} alerts queued"
+                     if rss is not None else f"Memory: {report['alert_queue']} alerts queued")
+        for symbol, usage in report['symbols'].items():
+            logging.info(f"Memory {symbol}: " + ", ".join(f"{name} {value}" for name, value in usage.items()))
+
+    def update_settings(self, settings):
+        # From the settings dialog or a fan-out viewer; saved right away.
+        # Each book's ready views follow its pair's new group interval.
+        restore_settings(settings)
+        for symbol, monitor in list(self.monitors.items()):
+            depth_stream = monitor.depth_stream
+            with depth_stream.book_lock:
+                depth_stream.book.set_intervals(aggregation_intervals(symbol, self.interval_multiples))
+        self.request_state_save()
+
+    def run_state_saver(self):
+        while not self.stop_event.is_set():
+            # Exports ride along with each pair's next frame and are saved next round
+            for monitor in list(self.monitors.values()):
+                monitor.export_requested = True
+            self.save_event.wait(STATE_SAVE_INTERVAL)
+            self.save_event.clear()
+            if not self.stop_event.is_set():
+                self.save_state()
+
+    def run_scheduler(self):
+        while not self.stop_event.is_set():
+            if is_running.is_set():
+                now = time.monotonic()
+                for monitor in list(self.monitors.values()):
+                    if now < monitor.next_tick:
+                        continue
+                    monitor.next_tick = now + monitor.interval
+                    if monitor.future is not None and not monitor.future.done():
+                        metrics.inc('frames_dropped')
+                        continue
+                    try:
+                        monitor.submit()
+                    except RuntimeError:
+                        return  # executors shut down
+            self.stop_event.wait(MIN_REFRESH_INTERVAL)
+
+def run_daemon(stop_event=None, serve_port=None):
+    # Fetch, detection, recording and alerting without any GUI; with
+    # `serve_port` also for the viewers connected to it
+    stop_event = stop_event or threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+    monitor = MultiSymbolMonitor(WATCHED_SYMBOLS, recorder=recorder, state_store=state_store)
+    server = None
+    if serve_port is not None:
+        from fanout import FanoutServer
+        server = FanoutServer(monitor, FANOUT_HOST, serve_port, symbols=default_settings)
+        server.start()
+    monitor.start()
+    logging.info(f"Monitoring {', '.join(WATCHED_SYMBOLS)} headless")
+    next_report = time.monotonic() + MEMORY_REPORT_INTERVAL
+    try:
+        while not stop_event.wait(1):
+            if MEMORY_REPORT_INTERVAL and time.monotonic() >= next_report:
+                monitor.log_memory_report()
+                next_report += MEMORY_REPORT_INTERVAL
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.stop()
+        monitor.stop()
+    return 0
+
+def parse_address(address):
+    # "host:port", ":port" or "port" of a --serve process
+    host, _, port = address.rpartition(':')
+    return host or FANOUT_HOST, int(port)
+
+def serve_metrics(port):
+    # The endpoint is optional: when the port is taken (e.g. by a second
+    # instance) the monitor logs it and runs without one
+    try:
+        return start_metrics_server(port)
+    except OSError as e:
+        logging.error(f"Metrics server not started on port {port}, running without it: {e}")
+        return None
 
-    def update_log(self, message):
-        self.log_output.append(message)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Binance order book visualizer and wall/spoofing alerts")
+    parser.add_argument('--headless', action='store_true', help="run detection and alerts without the GUI")
+    parser.add_argument('--serve', nargs='?', type=int, const=FANOUT_PORT, metavar='PORT',
+                        help=f"run headless and serve books and alerts to --connect viewers (port {FANOUT_PORT})")
+    parser.add_argument('--connect', metavar='HOST:PORT',
+                        help="show the books, analysis and alerts of a --serve process instead of fetching them")
+    args, qt_args = parser.parse_known_args(argv)
+    headless = args.headless or args.serve is not None
 
-    def update_order_book(self, data):
-        if data is None:
-            self.show_error("Error updating order book. Retrying...")
-            return
+    logging.basicConfig(level=logging.INFO if headless else logging.ERROR)
 
-        bids, asks = data
-        self.order_book_table.setRowCount(len(bids) + len(asks) + 1)  # +1 for the separator row
-
-        current_price = (bids[0][0] + asks[0][0]) / 2
-        self.current_price_label.setText(f"Current Price: ${current_price:.2f}")
-
-        max_volume = max(max(bid[1] for bid in bids), max(ask[1] for ask in asks))
-        
-        bid_cmap = LinearSegmentedColormap.from_list("bid_cmap", ["#1a2636", "#39a789", "#2EBD85"])
-        ask_cmap = LinearSegmentedColormap.from_list("ask_cmap", ["#1a2636", "#F25C54", "#F6465D"])
-
-        for i, ask in enumerate(reversed(asks)):
-            color = self.get_color_for_volume(ask[1], max_volume, ask_cmap)
-            self.set_table_item(i, 0, f"{ask[0]:.2f}", QColor("#F6465D"), color)
-            self.set_table_item(i, 1, f"{ask[1]:.4f}", QColor("#F6465D"), color)
-
-        separator_row = len(asks)
-        self.set_table_item(separator_row, 0, "--------", QColor("white"), QColor("#161A1E"))
-        self.set_table_item(separator_row, 1, "--------", QColor("white"), QColor("#161A1E"))
-
-        for i, bid in enumerate(bids):
-            row = i + separator_row + 1
-            color = self.get_color_for_volume(bid[1], max_volume, bid_cmap)
-            self.set_table_item(row, 0, f"{bid[0]:.2f}", QColor("#2EBD85"), color)
-            self.set_table_item(row, 1, f"{bid[1]:.4f}", QColor("#2EBD85"), color)
-
-    def get_color_for_volume(self, volume, max_volume, cmap):
-        normalized_volume = volume / max_volume
-        rgba = cmap(normalized_volume)
-        return QColor.fromRgbF(rgba[0], rgba[1], rgba[2], rgba[3])
-
-    def set_table_item(self, row, col, value, text_color, bg_color):
-        item = QTableWidgetItem(value)
-        item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
-        item.setForeground(text_color)
-        item.setBackground(bg_color)
-        self.order_book_table.setItem(row, col, item)
-
-    def show_error(self, message):
-        self.order_book_table.setRowCount(1)
-        self.set_table_item(0, 0, "Error", QColor("white"), QColor("red"))
-        self.set_table_item(0, 1, message, QColor("white"), QColor("red"))
-        self.current_price_label.setText("Error: No data available")
-        self.log_output.append(message)
-
-    def toggle_updates(self):
-        if is_running.is_set():
-            is_running.clear()
-            self.start_stop_button.setText("Start")
-            send_telegram_notification("Order book updates stopped.")
-            self.log_output.append("Order book updates stopped.")
-        else:
-            is_running.set()
-            self.start_stop_button.setText("Stop")
-            send_telegram_notification("Order book updates resumed.")
-            self.log_output.append("Order book updates resumed.")
-            current_order_book = fetch_order_book()
-            send_current_state(current_order_book)
+    if args.connect:
+        # A thin client: the server fetches, records, detects and alerts
+        from orderbook_gui import run_gui
+        return run_gui([sys.argv[0]] + qt_args, server_address=parse_address(args.connect))
 
-if __name__ == "__main__":
-    logging.basicConfig(level=logging.ERROR)
-    
     # Start the Telegram bot in a separate thread
     bot_thread = threading.Thread(target=bot.polling, daemon=True)
     bot_thread.start()
-    
-    app = QApplication(sys.argv)
-    app.setWindowIcon(QIcon(r'C:\Users\danie\liquidation\icon.png'))
-    window = OrderBookGUI()
-    window.show()
-    sys.exit(app.exec())
\ No newline at end of file
+
+    if recorder is not None:
+        recorder.start()
+    try:
+        if state_store is not None and state_store.load() is not None:
+            restore_settings(state_store.restored[0].get('settings', {}))
+        if METRICS_PORT:
+            serve_metrics(METRICS_PORT)
+        if METRICS_LOG_INTERVAL:
+            start_log_summary(METRICS_LOG_INTERVAL)
+        metrics.gauge('alert_queue_depth', notifier.queue_depth)
+        metrics.gauge('process_rss_bytes', process_rss)
+
+        if headless:
+            return run_daemon(serve_port=args.serve)
+
+        # PyQt6 and matplotlib are only imported when the GUI is used
+        from orderbook_gui import run_gui
+        return run_gui([sys.argv[0]] + qt_args)
+    finally:
+        notifier.stop()  # flush queued alerts
+        if recorder is not None:
+            recorder.stop()
+
+if __name__ == "__main__":
+    # orderbook_gui imports this module by name; let it share this instance
+    sys.modules.setdefault("orderbook", sys.modules[__name__])
+    sys.exit(main())
@@ -0,0 +1,583 @@
+import threading
+import time
+
+import numpy as np
+from matplotlib.colors import LinearSegmentedColormap
+from PyQt6.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, 
+                             QWidget, QTableView, QLabel, 
+                             QPushButton, QSpinBox, QDoubleSpinBox, 
+                             QTextEdit, QSplitter, QComboBox, QDialog, QFormLayout)
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal, QAbstractTableModel, QModelIndex
+from PyQt6.QtGui import QColor, QFont, QIcon, QImage, QPainter
+
+import orderbook as core
+from heatmap import LUT_CENTER, LUT_SIZE, HeatmapRenderer
+from metrics import metrics
+from depth_stream import price_decimals
+from orderbook import (MultiSymbolMonitor, REFRESH_INTERVAL, WATCHED_SYMBOLS, default_settings, is_running,
+                       send_current_state, send_telegram_notification)
+
+class SettingsDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Settings")
+        self.setFixedSize(300, 250)  # Set a fixed size for the dialog
+
+        self.setStyleSheet("""
+            QWidget {
+                background-color: #161A1E;
+                color: white;
+            }
+            QPushButton {
+                background-color: #FCD535;
+                color: black;
+                border: none;
+                padding: 5px;
+                border-radius: 5px;
+                min-width: 20px;
+                min-height: 20px;
+            }
+            QPushButton:hover {
+                background-color: #FFE14D;
+            }
+            QSpinBox, QDoubleSpinBox, QComboBox {
+                background-color: #2B2B2B;
+                color: white;
+                border: 1px solid #3A3A3A;
+            }
+        """)
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QFormLayout(self)
+
+        layout.setContentsMargins(20, 20, 20, 20)
+        layout.setSpacing(15)
+
+        self.pair_dropdown = QComboBox()
+        self.pair_dropdown.addItems(WATCHED_SYMBOLS)
+        self.pair_dropdown.currentTextChanged.connect(self.load_pair_settings)
+        layout.addRow("Trading Pair:", self.pair_dropdown)
+
+        self.group_interval_input = QDoubleSpinBox()  # sub-cent intervals for pairs like XRP
+        self.group_interval_input.setDecimals(4)
+        self.group_interval_input.setRange(0.0001, 10000)
+        layout.addRow("Group by:", self.group_interval_input)
+
+        self.large_wall_input = QDoubleSpinBox()
+        self.large_wall_input.setRange(0, 1_000_000_000)
+        layout.addRow("Big orders alert:", self.large_wall_input)
+
+        self.cancellation_input = QDoubleSpinBox()
+        self.cancellation_input.setRange(0, 1_000_000_000)
+        layout.addRow("Spoofing detection:", self.cancellation_input)
+
+        self.cooldown_input = QSpinBox()
+        self.cooldown_input.setRange(0, 86400)
+        layout.addRow("Notification Cooldown (s):", self.cooldown_input)
+
+        save_button = QPushButton("Save")
+        save_button.clicked.connect(self.save_settings)
+        layout.addRow(save_button)
+
+        self.load_pair_settings(self.pair_dropdown.currentText())
+
+    def load_pair_settings(self, pair):
+        if pair in default_settings:
+            settings = default_settings[pair]
+            self.group_interval_input.setValue(settings["group_interval"])
+            self.large_wall_input.setValue(settings["large_wall_threshold"])
+            self.cancellation_input.setValue(settings["cancellation_threshold"])
+        self.cooldown_input.setValue(core.NOTIFICATION_COOLDOWN)
+
+    def save_settings(self):
+        core.current_symbol = self.pair_dropdown.currentText()
+        core.GROUP_INTERVAL = self.group_interval_input.value()
+        core.LARGE_WALL_THRESHOLD = self.large_wall_input.value()
+        core.CANCELLATION_THRESHOLD = self.cancellation_input.value()
+        core.NOTIFICATION_COOLDOWN = self.cooldown_input.value()
+
+        default_settings[core.current_symbol] = {
+            "group_interval": core.GROUP_INTERVAL,
+            "large_wall_threshold": core.LARGE_WALL_THRESHOLD,
+            "cancellation_threshold": core.CANCELLATION_THRESHOLD
+        }
+        if self.parent() is not None:
+            self.parent().monitor.update_settings(core.current_settings())
+
+        self.accept()
+
+COLOR_LUT_SIZE = 256
+BID_COLORS = ["#1a2636", "#39a789", "#2EBD85"]
+ASK_COLORS = ["#1a2636", "#F25C54", "#F6465D"]
+
+def grow_buffers(buffers, count):
+    # Same-length reused buffers, reallocated a tenth larger than needed once `count` rows don't fit
+    if len(buffers[0]) >= count:
+        return buffers
+    capacity = count + count // 10
+    return tuple(np.empty(capacity, dtype=buffer.dtype) for buffer in buffers)
+
+def build_color_lut(colors, size=COLOR_LUT_SIZE):
+    # Sample the heat colormap once; rows then index it by normalized volume
+    cmap = LinearSegmentedColormap.from_list("lut", colors)
+    return [QColor.fromRgbF(*cmap(i / (size - 1))) for i in range(size)]
+
+def build_heatmap_lut(size=LUT_SIZE):
+    # Packed 0xFFRRGGBB colours: asks fade from the strongest ASK_COLORS at 0
+    # to the background at LUT_CENTER, bids brighten above it. A square-root
+    # ramp keeps thin liquidity visible next to large walls.
+    colormaps = {-1: LinearSegmentedColormap.from_list("asks", ASK_COLORS),
+                 1: LinearSegmentedColormap.from_list("bids", BID_COLORS)}
+    lut = np.empty(size, dtype=np.uint32)
+    for i in range(size):
+        value = (i - LUT_CENTER) / (LUT_CENTER - 1)
+        red, green, blue, _ = colormaps[1 if value >= 0 else -1](min(abs(value), 1.0) ** 0.5)
+        lut[i] = 0xFF000000 | int(red * 255) << 16 | int(green * 255) << 8 | int(blue * 255)
+    return lut
+
+class HeatmapWidget(QWidget):
+    # Time-by-price liquidity of the displayed pair, newest on the right.
+    # Rendered on the GUI thread into the renderer's preallocated buffer,
+    # which the QImage wraps without copying; Qt scales it to the widget.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.renderer = HeatmapRenderer(core.HEATMAP_COLUMNS, core.HEATMAP_BUCKETS)
+        self.lut = build_heatmap_lut()
+        image = self.renderer.image
+        self.qimage = QImage(image.data, image.shape[1], image.shape[0], image.strides[0],
+                             QImage.Format.Format_RGB32)
+        self.history = None
+        self.price_range = None
+        self.setMinimumWidth(400)
+
+    def refresh(self, history):
+        self.history = history
+        if not self.isVisible() or not history.count:
+            return
+        with metrics.timer('heatmap_render'):
+            self.renderer.render(history, self.lut)
+        self.price_range = history.price_range()
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.drawImage(self.rect(), self.qimage)
+        if self.price_range is not None:
+            low, high = self.price_range
+            decimals = price_decimals(self.history.step * self.history.tick_size)
+            painter.setPen(QColor("white"))
+            painter.drawText(4, 14, f"{high:.{decimals}f}")
+            painter.drawText(4, self.height() - 4, f"{low:.{decimals}f}")
+        painter.end()
+
+class OrderBookTableModel(QAbstractTableModel):
+    # Rows are asks (highest first), a separator row, then bids (highest first).
+    # The book lives in NumPy arrays; an update only emits dataChanged for the
+    # rows whose price, amount or shade changed.
+    ASK, SEPARATOR, BID = 0, 1, 2
+    HEADERS = ["Price", "Amount"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.prices = np.empty(0)
+        self.amounts = np.empty(0)
+        self.sides = np.empty(0, dtype=np.int8)
+        self.shades = np.empty(0, dtype=np.uint8)
+        self.decimals = 2  # price decimals, finer for pairs grouped below a cent
+        self.error = None
+        # Rows are written into two reused buffer sets in turn, so the rows
+        # on screen stay intact to compare the next update against
+        self.row_buffers = [self.allocate_rows(), self.allocate_rows()]
+        self.scratch = (np.empty(0), np.empty(0, dtype=bool), np.empty(0, dtype=bool))
+
+        self.text_colors = {self.ASK: QColor("#F6465D"), self.SEPARATOR: QColor("white"), self.BID: QColor("#2EBD85")}
+        self.color_luts = {self.ASK: build_color_lut(ASK_COLORS), self.BID: build_color_lut(BID_COLORS)}
+        self.separator_color = QColor("#161A1E")
+        self.error_color = QColor("red")
+        self.alignment = Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return 1 if self.error is not None else len(self.prices)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 2
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row, col = index.row(), index.column()
+
+        if self.error is not None:
+            if role == Qt.ItemDataRole.DisplayRole:
+                return "Error" if col == 0 else self.error
+            if role == Qt.ItemDataRole.ForegroundRole:
+                return self.text_colors[self.SEPARATOR]
+            if role == Qt.ItemDataRole.BackgroundRole:
+                return self.error_color
+            return None
+
+        side = self.sides[row]
+        if role == Qt.ItemDataRole.DisplayRole:
+            if side == self.SEPARATOR:
+                return "--------"
+            return f"{self.prices[row]:.{self.decimals}f}" if col == 0 else f"{self.amounts[row]:.4f}"
+        if role == Qt.ItemDataRole.ForegroundRole:
+            return self.text_colors[side]
+        if role == Qt.ItemDataRole.BackgroundRole:
+            if side == self.SEPARATOR:
+                return self.separator_color
+            return self.color_luts[side][self.shades[row]]
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            return self.alignment
+        return None
+
+    def set_error(self, message):
+        self.beginResetModel()
+        self.error = message
+        self.prices = np.empty(0)
+        self.amounts = np.empty(0)
+        self.sides = np.empty(0, dtype=np.int8)
+        self.shades = np.empty(0, dtype=np.uint8)
+        self.endResetModel()
+
+    @staticmethod
+    def allocate_rows():
+        return np.empty(0), np.empty(0), np.empty(0, dtype=np.int8), np.empty(0, dtype=np.uint8)
+
+    def spare_rows(self, count):
+        # The buffer set not on screen, as `count` row views
+        self.row_buffers.reverse()
+        self.row_buffers[0] = grow_buffers(self.row_buffers[0], count)
+        return [buffer[:count] for buffer in self.row_buffers[0]]
+
+    def set_book(self, bids, asks, decimals=2):
+        # bids sorted descending, asks ascending, both (n, 2) arrays
+        bids = np.asarray(bids, dtype=float).reshape(-1, 2)
+        asks = np.asarray(asks, dtype=float).reshape(-1, 2)[::-1]
+        separator = len(asks)
+
+        prices, amounts, sides, shades = self.spare_rows(len(asks) + 1 + len(bids))
+        self.scratch = grow_buffers(self.scratch, len(prices))
+        for rows, column in ((prices, 0), (amounts, 1)):
+            rows[:separator] = asks[:, column]
+            rows[separator] = 0.0
+            rows[separator + 1:] = bids[:, column]
+        sides[:separator] = self.ASK
+        sides[separator] = self.SEPARATOR
+        sides[separator + 1:] = self.BID
+        max_volume = amounts.max()
+        if max_volume > 0:
+            scaled = self.scratch[0][:len(amounts)]
+            np.divide(amounts, max_volume, out=scaled)
+            scaled *= COLOR_LUT_SIZE - 1
+            shades[:] = scaled
+        else:
+            shades[:] = 0
+
+        if self.error is not None:
+            self.beginResetModel()
+            self.error = None
+            self.decimals = decimals
+            self.prices, self.amounts, self.sides, self.shades = prices, amounts, sides, shades
+            self.endResetModel()
+            return
+
+        old_prices, old_amounts, old_sides, old_shades = self.prices, self.amounts, self.sides, self.shades
+        old_rows, new_rows = len(old_prices), len(prices)
+
+        if new_rows > old_rows:
+            self.beginInsertRows(QModelIndex(), old_rows, new_rows - 1)
+            self.prices, self.amounts, self.sides, self.shades = prices, amounts, sides, shades
+            self.endInsertRows()
+        elif new_rows < old_rows:
+            self.beginRemoveRows(QModelIndex(), new_rows, old_rows - 1)
+            self.prices, self.amounts, self.sides, self.shades = prices, amounts, sides, shades
+            self.endRemoveRows()
+        else:
+            self.prices, self.amounts, self.sides, self.shades = prices, amounts, sides, shades
+
+        rows = min(old_rows, new_rows)
+        changed, differs = (buffer[:rows] for buffer in self.scratch[1:])
+        np.not_equal(old_prices[:rows], prices[:rows], out=changed)
+        for old, new in ((old_amounts, amounts), (old_sides, sides), (old_shades, shades)):
+            changed |= np.not_equal(old[:rows], new[:rows], out=differs)
+        if decimals != self.decimals:
+            self.decimals = decimals
+            changed[:] = True
+        self.emit_changed_rows(np.flatnonzero(changed))
+
+    def emit_changed_rows(self, rows):
+        if len(rows) == 0:
+            return
+        # One dataChanged per run of consecutive changed rows
+        breaks = np.flatnonzero(np.diff(rows) > 1)
+        starts = np.concatenate(([rows[0]], rows[breaks + 1]))
+        ends = np.concatenate((rows[breaks], [rows[-1]]))
+        for start, end in zip(starts, ends):
+            self.dataChanged.emit(self.index(int(start), 0), self.index(int(end), 1))
+
+class OrderBookGUI(QMainWindow):
+    update_signal = pyqtSignal(object)
+    log_signal = pyqtSignal(str)
+
+    def __init__(self, server_address=None):
+        super().__init__()
+        self.server_address = server_address  # (host, port) of a --serve process to view instead of fetching
+        self.setWindowTitle("Cryptocurrency Order Book")
+        self.setFixedSize(300, 800)  # Set initial size to 200x800
+        self.setup_ui()
+        self.pending_order_book = None
+        self.render_timer = QTimer(self)
+        self.render_timer.setSingleShot(True)
+        self.render_timer.timeout.connect(self.render_pending_order_book)
+        self.update_signal.connect(self.queue_order_book_update)
+        self.log_signal.connect(self.update_log)
+        self.start_update_thread()
+
+    def setup_ui(self):
+        self.setStyleSheet("""
+            QWidget {
+                background-color: #161A1E;
+                color: white;
+            }
+            QPushButton {
+                background-color: #FCD535;
+                color: black;
+                border: none;
+                padding: 5px;
+                border-radius: 5px;
+                min-width: 20px;
+                min-height: 20px;
+            }
+            QPushButton:hover {
+                background-color: #FFE14D;
+            }
+            QTableView {
+                gridline-color: #2B2B2B;
+            }
+            QHeaderView::section {
+                background-color: #2B2B2B;
+                color: white;
+            }
+            QTableView QTableCornerButton::section {
+                background-color: #2B2B2B;
+            }
+        """)
+
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        main_layout = QHBoxLayout(central_widget)
+
+        # Left side (Order book)
+        left_widget = QWidget()
+        self.left_widget = left_widget  # Add this line
+        left_layout = QVBoxLayout(left_widget)
+            
+        # Order book table
+        self.order_book_model = OrderBookTableModel(self)
+        self.order_book_table = QTableView()
+        self.order_book_table.setModel(self.order_book_model)
+        self.order_book_table.horizontalHeader().setStretchLastSection(True)
+        left_layout.addWidget(self.order_book_table)
+
+        # Current price label
+        self.current_price_label = QLabel("Current Price: N/A")
+        self.current_price_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.current_price_label.setFont(QFont("Arial", 14, QFont.Weight.Bold))
+        left_layout.addWidget(self.current_price_label)
+
+        # Control panel
+        control_layout = QHBoxLayout()
+        left_layout.addLayout(control_layout)
+
+        # Start/Stop button
+        self.start_stop_button = QPushButton("Stop")
+        self.start_stop_button.clicked.connect(self.toggle_updates)
+        control_layout.addWidget(self.start_stop_button)
+
+        # Settings button
+        self.settings_button = QPushButton("Settings")
+        self.settings_button.clicked.connect(self.open_settings)
+        control_layout.addWidget(self.settings_button)
+
+        # Toggle log button
+        self.toggle_log_button = QPushButton("Hide Log")
+        self.toggle_log_button.clicked.connect(self.toggle_log_output)
+        control_layout.addWidget(self.toggle_log_button)
+
+        # Toggle heatmap button
+        self.toggle_heatmap_button = QPushButton("Heatmap")
+        self.toggle_heatmap_button.clicked.connect(self.toggle_heatmap)
+        control_layout.addWidget(self.toggle_heatmap_button)
+
+        # Right side (Log output)
+        self.log_output = QTextEdit()
+        self.log_output.setReadOnly(True)
+        self.log_output.setMinimumWidth(400)  # Set a minimum width for the log output
+        self.log_output.document().setMaximumBlockCount(core.LOG_MAX_LINES)  # analysis is appended every tick
+        self.log_output.hide()  # Hide the log output by default
+
+        # Depth heatmap, hidden by default
+        self.heatmap = HeatmapWidget()
+        self.heatmap.hide()
+        self.heatmap_timer = QTimer(self)
+        self.heatmap_timer.timeout.connect(self.refresh_heatmap)
+        self.heatmap_timer.start(int(core.HEATMAP_COLUMN_SECONDS * 1000))
+
+        # Create a splitter
+        
+        self.splitter = QSplitter(Qt.Orientation.Horizontal)
+        self.splitter.addWidget(left_widget)
+        self.splitter.addWidget(self.log_output)
+        self.splitter.addWidget(self.heatmap)
+        self.splitter.setCollapsible(0, False)
+        self.splitter.setCollapsible(1, False)
+        self.splitter.setCollapsible(2, False)
+        self.splitter.setSizes([300, 0, 0])  # Initially, only show the order book
+
+        main_layout.addWidget(self.splitter)
+
+        # Hide the log output initially
+        self.log_output.hide()
+
+        # Update the toggle log button text
+        self.toggle_log_button.setText("Show Log")
+
+
+    def set_column_widths(self):
+        self.order_book_table.setColumnWidth(0, 95)  # Price column
+        self.order_book_table.setColumnWidth(1, 95)  # Amount column
+
+    def toggle_log_output(self):
+        if self.log_output.isVisible():
+            self.log_output.hide()
+            self.toggle_log_button.setText("Show Log")
+        else:
+            self.log_output.show()
+            self.toggle_log_button.setText("Hide Log")
+        self.resize_panels()
+
+    def toggle_heatmap(self):
+        if self.heatmap.isVisible():
+            self.heatmap.hide()
+        else:
+            self.heatmap.show()
+            self.refresh_heatmap()
+        self.resize_panels()
+
+    def resize_panels(self):
+        sizes = [300, 300 if self.log_output.isVisible() else 0, 500 if self.heatmap.isVisible() else 0]
+        self.setFixedSize(sum(sizes), 800)
+        self.splitter.setSizes(sizes)
+
+    def refresh_heatmap(self):
+        if self.heatmap.isVisible():
+            self.heatmap.refresh(self.monitor.watch(core.current_symbol).history)
+    def open_settings(self):
+        dialog = SettingsDialog(self)
+        if dialog.exec():
+            self.show_current_symbol()  # Switch straight to the pair's cached book
+
+    def start_update_thread(self):
+        if self.server_address is not None:
+            # Same watch()/display() surface, fed by the server
+            from fanout import FanoutClient
+            self.monitor = FanoutClient(self.server_address, WATCHED_SYMBOLS, apply_settings=core.restore_settings,
+                                        on_alert=self.log_signal.emit,
+                                        history_shape=(core.HEATMAP_COLUMNS, core.HEATMAP_BUCKETS,
+                                                       core.HEATMAP_COLUMN_SECONDS))
+        else:
+            self.monitor = MultiSymbolMonitor(WATCHED_SYMBOLS, recorder=core.recorder,
+                                              state_store=core.state_store)
+        self.monitor.start()
+        self.update_thread = threading.Thread(target=self.update_order_book_thread, daemon=True)
+        self.update_thread.start()
+
+    def update_order_book_thread(self):
+        while True:
+            if is_running.is_set():
+                self.show_current_symbol()
+
+            time.sleep(REFRESH_INTERVAL)
+
+    def show_current_symbol(self):
+        # Detection for every pair runs in self.monitor; this only publishes
+        # the displayed pair's cached result.
+        monitor = self.monitor.watch(core.current_symbol)
+        if monitor.analysis is not None:
+            self.log_signal.emit(monitor.analysis)
+        with metrics.timer('display_read'):
+            order_book = monitor.display()
+        self.update_signal.emit((time.perf_counter(), order_book))
+
+    def update_log(self, message):
+        self.log_output.append(message)
+
+    def queue_order_book_update(self, message):
+        # Bursts of update_signal are coalesced: only the newest book is
+        # rendered, at most once per screen refresh.
+        emitted_at, data = message
+        metrics.observe('signal_hop', time.perf_counter() - emitted_at)
+        self.pending_order_book = data
+        if not self.render_timer.isActive():
+            screen = self.screen()
+            refresh_rate = screen.refreshRate() if screen is not None else 60
+            self.render_timer.start(max(int(1000 / max(refresh_rate, 1)), 1))
+
+    def render_pending_order_book(self):
+        with metrics.timer('render'):
+            self.update_order_book(self.pending_order_book)
+
+    def update_order_book(self, data):
+        if data is None:
+            self.show_error("Error updating order book. Retrying...")
+            return
+
+        bids, asks = data
+        current_price = (bids[0][0] + asks[0][0]) / 2
+        decimals = price_decimals(core.symbol_settings(core.current_symbol)["group_interval"])
+        self.current_price_label.setText(f"Current Price: ${current_price:.{decimals}f}")
+
+        self.order_book_model.set_book(bids, asks, decimals)
+
+    def show_error(self, message):
+        self.order_book_model.set_error(message)
+        self.current_price_label.setText("Error: No data available")
+        self.log_output.append(message)
+
+    def toggle_updates(self):
+        # A viewer of a --serve process only pauses its own display; the
+        # shared chat hears from the server alone
+        viewer = self.server_address is not None
+        if is_running.is_set():
+            is_running.clear()
+            self.start_stop_button.setText("Start")
+            if not viewer:
+                send_telegram_notification("Order book updates stopped.")
+            self.log_output.append("Order book updates stopped.")
+        else:
+            is_running.set()
+            self.start_stop_button.setText("Stop")
+            self.log_output.append("Order book updates resumed.")
+            if not viewer:
+                send_telegram_notification("Order book updates resumed.")
+                send_current_state(self.monitor.watch(core.current_symbol).previous_order_book, core.current_symbol)
+
+
+def run_gui(argv, server_address=None):
+    app = QApplication(argv)
+    app.setWindowIcon(QIcon(r'C:\Users\danie\liquidation\icon.png'))
+    window = OrderBookGUI(server_address)
+    window.show()
+    try:
+        return app.exec()
+    finally:
+        window.monitor.stop()  # saves state
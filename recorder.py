@@ -0,0 +1,236 @@
+import logging
+import mmap
+import os
+import queue
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from microstructure import METRIC_FIELDS
+
+KIND_SNAPSHOT = 0
+KIND_DIFF = 1
+KIND_METRICS = 2  # one row per value of METRIC_FIELDS: side is the field index, price the value
+SIDE_BID = 0
+SIDE_ASK = 1
+
+# One row per price level of a snapshot or diff
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('update_id', '<i8'),
+    ('kind', 'u1'),
+    ('side', 'u1'),
+    ('price', '<f8'),
+    ('amount', '<f8'),
+])
+
+# One entry per compressed chunk, stored in the segment's .idx file
+INDEX_DTYPE = np.dtype([
+    ('offset', '<i8'),
+    ('length', '<i8'),
+    ('rows', '<i8'),
+    ('first_timestamp', '<f8'),
+    ('last_timestamp', '<f8'),
+])
+
+SEGMENT_SUFFIX = '.obr'
+INDEX_SUFFIX = '.idx'
+
+
+class SegmentWriter:
+    """Append-only segment file of zlib-compressed RECORD_DTYPE chunks.
+
+    Every chunk is written once and followed by one fixed-size index entry, so
+    nothing on disk is ever rewritten.
+    """
+
+    def __init__(self, path, compression_level=6):
+        self.path = path
+        self.compression_level = compression_level
+        self.data_file = open(path + SEGMENT_SUFFIX, 'ab')
+        self.index_file = open(path + INDEX_SUFFIX, 'ab')
+        self.created = time.time()
+        self.size = self.data_file.tell()
+
+    def write_chunk(self, records):
+        payload = zlib.compress(records.tobytes(), self.compression_level)
+        entry = np.array([(self.size, len(payload), len(records),
+                           records['timestamp'][0], records['timestamp'][-1])], dtype=INDEX_DTYPE)
+        self.data_file.write(payload)
+        self.data_file.flush()
+        self.index_file.write(entry.tobytes())
+        self.index_file.flush()
+        self.size += len(payload)
+
+    def close(self):
+        self.data_file.close()
+        self.index_file.close()
+
+
+class OrderBookRecorder:
+    """Writes every snapshot and diff seen to rotating per-symbol segment files.
+
+    ``record_snapshot`` and ``record_diff`` only enqueue the raw message and
+    never block: a writer thread parses, buffers and compresses rows in chunks
+    of ``chunk_rows``. Messages are dropped (and counted) when the queue is full.
+    """
+
+    def __init__(self, directory, chunk_rows=50_000, flush_interval=5.0,
+                 max_segment_bytes=64 * 1024 * 1024, max_segment_age=3600.0, max_queue=10_000):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.flush_interval = flush_interval
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self.queue = queue.Queue(max_queue)
+        self.buffers = {}
+        self.writers = {}
+        self.dropped = 0
+        self.thread = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self.run, name="recorder", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout)
+            self.thread = None
+
+    def record_snapshot(self, symbol, snapshot, timestamp=None):
+        self._enqueue((KIND_SNAPSHOT, symbol, timestamp or time.time(), snapshot))
+
+    def record_diff(self, symbol, event, timestamp=None):
+        self._enqueue((KIND_DIFF, symbol, timestamp or time.time(), event))
+
+    def record_metrics(self, symbol, values, timestamp=None):
+        self._enqueue((KIND_METRICS, symbol, timestamp or time.time(), values))
+
+    def _enqueue(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                try:
+                    self.buffer(*item)
+                except Exception as e:
+                    logging.error(f"Recorder failed to parse message: {e}")
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self.flush_all()
+                last_flush = time.monotonic()
+        self.flush_all()
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+    def buffer(self, kind, symbol, timestamp, message):
+        if kind == KIND_METRICS:
+            rows = np.zeros(len(METRIC_FIELDS), dtype=RECORD_DTYPE)
+            rows['timestamp'] = timestamp
+            rows['update_id'] = -1
+            rows['kind'] = KIND_METRICS
+            rows['side'] = np.arange(len(METRIC_FIELDS))
+            rows['price'] = [np.nan if message[field] is None else message[field] for field in METRIC_FIELDS]
+            self.buffers.setdefault(symbol, []).append(rows)
+            return
+        if kind == KIND_SNAPSHOT:
+            update_id, bids, asks = message.get('lastUpdateId', -1), message['bids'], message['asks']
+        else:
+            update_id, bids, asks = message['u'], message['b'], message['a']
+
+        rows = np.empty(len(bids) + len(asks), dtype=RECORD_DTYPE)
+        rows['timestamp'] = timestamp
+        rows['update_id'] = update_id
+        rows['kind'] = kind
+        rows['side'][:len(bids)] = SIDE_BID
+        rows['side'][len(bids):] = SIDE_ASK
+        if len(rows):
+            levels = np.array(list(bids) + list(asks), dtype=float).reshape(-1, 2)
+            rows['price'] = levels[:, 0]
+            rows['amount'] = levels[:, 1]
+
+        chunks = self.buffers.setdefault(symbol, [])
+        chunks.append(rows)
+        if sum(len(chunk) for chunk in chunks) >= self.chunk_rows:
+            self.flush(symbol)
+
+    def flush_all(self):
+        for symbol in list(self.buffers):
+            self.flush(symbol)
+
+    def flush(self, symbol):
+        chunks = self.buffers.pop(symbol, None)
+        if not chunks:
+            return
+        records = np.concatenate(chunks)
+        if len(records):
+            self.writer_for(symbol).write_chunk(records)
+
+    def writer_for(self, symbol):
+        writer = self.writers.get(symbol)
+        if writer is not None and (writer.size >= self.max_segment_bytes or
+                                   time.time() - writer.created >= self.max_segment_age):
+            writer.close()
+            writer = None
+        if writer is None:
+            symbol_dir = os.path.join(self.directory, symbol)
+            os.makedirs(symbol_dir, exist_ok=True)
+            name = time.strftime("%Y%m%d-%H%M%S", time.gmtime()) + f"-{time.time_ns() % 1_000_000_000:09d}"
+            writer = SegmentWriter(os.path.join(symbol_dir, name))
+            self.writers[symbol] = writer
+        return writer
+
+
+def read_index(path):
+    """Return the chunk index of a segment (path without suffix)."""
+    with open(path + INDEX_SUFFIX, 'rb') as f:
+        data = f.read()
+    # A crash can leave a partial trailing entry behind
+    usable = len(data) - len(data) % INDEX_DTYPE.itemsize
+    return np.frombuffer(data[:usable], dtype=INDEX_DTYPE)
+
+
+def read_segment(path, start=None, end=None):
+    """Yield RECORD_DTYPE chunks of one segment, skipping chunks outside [start, end]."""
+    index = read_index(path)
+    if len(index) == 0:
+        return
+    with open(path + SEGMENT_SUFFIX, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for entry in index:
+            if start is not None and entry['last_timestamp'] < start:
+                continue
+            if end is not None and entry['first_timestamp'] > end:
+                continue
+            offset, length = int(entry['offset']), int(entry['length'])
+            if offset + length > len(data):
+                break
+            yield np.frombuffer(zlib.decompress(data[offset:offset + length]), dtype=RECORD_DTYPE)
+
+
+def list_segments(directory, symbol):
+    symbol_dir = os.path.join(directory, symbol)
+    if not os.path.isdir(symbol_dir):
+        return []
+    names = sorted(name[:-len(SEGMENT_SUFFIX)] for name in os.listdir(symbol_dir) if name.endswith(SEGMENT_SUFFIX))
+    return [os.path.join(symbol_dir, name) for name in names]
+
+
+def read_records(directory, symbol, start=None, end=None):
+    """Yield all recorded chunks for a symbol in time order."""
+    for path in list_segments(directory, symbol):
+        yield from read_segment(path, start, end)
@@ -0,0 +1,67 @@
+import json
+import logging
+import os
+import time
+import zipfile
+
+import numpy as np
+
+STATE_VERSION = 1
+META_KEY = '__meta__'
+
+
+class StateStore:
+    """Snapshots of settings and per-pair state in one .npz file.
+
+    ``save`` takes a JSON-able ``meta`` dict and named arrays (books, wall
+    tables, cancellation windows). It writes them uncompressed to a
+    temporary file next to ``path``, fsyncs it and renames it over the
+    previous snapshot, so a crash mid-write leaves the last good snapshot in
+    place. ``load`` returns what was saved, or None when there is nothing
+    usable, and keeps it in ``restored``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.restored = None
+        self.saves = 0
+
+    def save(self, meta, arrays):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        document = dict(meta, version=STATE_VERSION, saved_at=time.time())
+        temp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp, 'wb') as f:
+                np.savez(f, **{META_KEY: np.frombuffer(json.dumps(document).encode(), dtype=np.uint8)}, **arrays)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self.path)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        self.saves += 1
+
+    def load(self):
+        """Return (meta, arrays) of the last snapshot, or None if there is none or it can't be read."""
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                meta = json.loads(data[META_KEY].tobytes())
+                arrays = {name: data[name] for name in data.files if name != META_KEY}
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            logging.error(f"Ignoring unreadable state file {self.path}: {e}")
+            return None
+        if meta.get('version') != STATE_VERSION:
+            logging.warning(f"Ignoring state file {self.path} from another version")
+            return None
+        self.restored = (meta, arrays)
+        return self.restored
+
+
+def prefixed(arrays, prefix):
+    # Arrays saved under "<prefix>/<name>", keyed by name
+    start = len(prefix) + 1
+    return {name[start:]: array for name, array in arrays.items() if name.startswith(prefix + '/')}
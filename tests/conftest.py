@@ -0,0 +1,33 @@
+import copy
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import orderbook  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def sent_alerts(monkeypatch):
+    """Alerts sent by the code under test, as (message, priority), instead of reaching Telegram.
+
+    Also gives every test fresh analyzers, no alert rules file and its own
+    copy of the settings.
+    """
+    sent = []
+    monkeypatch.setattr(orderbook, 'send_telegram_notification',
+                        lambda message, priority=None: sent.append((message, priority)))
+    monkeypatch.setattr(orderbook, 'analyzers', {})
+    monkeypatch.setattr(orderbook, 'alert_rules', None)
+    for name in ('GROUP_INTERVAL', 'LARGE_WALL_THRESHOLD', 'CANCELLATION_THRESHOLD', 'NOTIFICATION_COOLDOWN',
+                 'current_symbol', 'MAX_BOOK_LEVELS'):
+        monkeypatch.setattr(orderbook, name, getattr(orderbook, name))
+    # Restored in place, the GUI holds a reference
+    pairs = copy.deepcopy(orderbook.default_settings)
+    yield sent
+    orderbook.default_settings.clear()
+    orderbook.default_settings.update(pairs)
+    orderbook.is_running.set()
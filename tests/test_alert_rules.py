@@ -0,0 +1,105 @@
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+
+from alert_rules import AlertRuleFile, RuleEngine
+from depth_stream import PriceScale
+from orderbook import BookFrame
+
+SCALE = PriceScale('0.01', '0.001')
+
+
+def make_book(levels, seed=0):
+    # Grouped integer book around 100.00 with 1-coin levels
+    rng = np.random.default_rng(seed)
+    bids = np.column_stack((np.arange(10_000 - levels, 10_000), rng.integers(500, 1500, levels))).astype(np.int64)
+    asks = np.column_stack((np.arange(10_001, 10_001 + levels), rng.integers(500, 1500, levels))).astype(np.int64)
+    return bids, asks
+
+
+def frame(bids, asks, now, rules, microstructure=None):
+    return BookFrame('BTCUSDT', now, SCALE, bids, asks, {'group_interval': 0.01}, microstructure, rules)
+
+
+def write_rules(path, rules, mtime_offset_ns=0):
+    with open(path, 'w') as f:
+        json.dump({'rules': rules}, f)
+    if mtime_offset_ns:
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + mtime_offset_ns))
+
+
+def rule_names(alerts):
+    return sorted(message.split('[')[-1].rstrip(']') for message, _ in alerts)
+
+
+@pytest.fixture
+def rules_path(tmp_path):
+    path = str(tmp_path / 'alert_rules.json')
+    write_rules(path, [
+        {'name': 'relative', 'type': 'wall', 'multiple': 10},
+        {'name': 'near-mid', 'type': 'wall', 'min_amount': 5, 'within': 0.001},
+        {'name': 'pulled', 'type': 'cancellation', 'percent': 75, 'min_amount': 1},
+        {'name': 'bid-heavy', 'type': 'crossing', 'metric': 'imbalance', 'above': 0.5},
+        {'name': 'eth-only', 'type': 'wall', 'symbols': ['ETHUSDT'], 'min_amount': 1},
+    ])
+    return path
+
+
+@pytest.fixture
+def walls():
+    bids, asks = make_book(200)
+    bids[-5, 1] = 20_000  # 20 coins, 5 ticks below the best bid: relative and near mid
+    asks[150, 1] = 30_000  # 30 coins, far from mid: relative only
+    return bids, asks
+
+
+def test_rules_are_filtered_by_symbol(rules_path):
+    _, rules = AlertRuleFile(rules_path, default_cooldown=60, check_interval=0).rules_for('BTCUSDT')
+    assert [rule['name'] for rule in rules] == ['relative', 'near-mid', 'pulled', 'bid-heavy']
+
+
+def test_walls_crossings_and_cancellations_respect_their_cooldowns(rules_path, walls):
+    rules = AlertRuleFile(rules_path, default_cooldown=60, check_interval=0).rules_for('BTCUSDT')
+    engine = RuleEngine('BTCUSDT')
+    bids, asks = walls
+    assert rule_names(engine.evaluate(frame(bids, asks, 0.0, rules, {'imbalance': 0.1}))) == \
+        ['near-mid', 'relative', 'relative']
+
+    # The crossing fires once; the walls stay quiet in their cooldown
+    alerts = engine.evaluate(frame(bids, asks, 1.0, rules, {'imbalance': 0.7}))
+    assert len(alerts) == 1 and 'imbalance crossed above' in alerts[0][0]
+    assert not engine.evaluate(frame(bids, asks, 2.0, rules, {'imbalance': 0.8}))
+
+    pulled = bids.copy()
+    pulled[-5, 1] = 2_000  # 90% of the wall pulled
+    pulled[-10, 1] = pulled[-10, 1] // 2  # 50%, below the rule's 75%
+    alerts = engine.evaluate(frame(pulled, asks, 3.0, rules, {'imbalance': 0.8}))
+    assert rule_names(alerts) == ['pulled']
+
+    grown = bids.copy()
+    grown[-5, 1] = 24_000  # back and 20% bigger than when alerted
+    assert rule_names(engine.evaluate(frame(grown, asks, 61.5, rules, {'imbalance': 0.8}))) == \
+        ['near-mid', 'relative', 'relative']
+
+
+def test_reload_keeps_the_rules_until_the_file_is_valid(rules_path, walls):
+    rule_file = AlertRuleFile(rules_path, default_cooldown=60, check_interval=0)
+    rules = rule_file.rules_for('BTCUSDT')
+    engine = RuleEngine('BTCUSDT')
+    bids, asks = walls
+    engine.evaluate(frame(bids, asks, 0.0, rules))
+
+    with open(rules_path, 'w') as f:
+        f.write('{"rules": [')
+    os.utime(rules_path, ns=(time.time_ns(), time.time_ns() + 1_000_000))
+    version, kept = rule_file.rules_for('BTCUSDT')
+    assert version == rules[0] and len(kept) == 4
+
+    # The replacement applies, and the wall alerted under the same name stays deduplicated
+    write_rules(rules_path, [{'name': 'relative', 'type': 'wall', 'multiple': 10}], 2_000_000)
+    reloaded = rule_file.rules_for('BTCUSDT')
+    assert reloaded[0] > rules[0] and len(reloaded[1]) == 1
+    assert not engine.evaluate(frame(bids, asks, 1.0, reloaded))
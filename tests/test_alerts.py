@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import orderbook
+from alert_rules import AlertRuleFile
+from depth_stream import PriceScale, ReplayDepthFeed
+
+BTC_SCALE = PriceScale('0.01', '0.00001')
+XRP_SCALE = PriceScale('0.0001', '1')
+RULES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'alert_rules.example.json')
+
+
+def book_snapshot(last_update_id, mid, tick, levels, amount, walls=()):
+    # `levels` ticks per side around `mid`, `amount` at each and the given (price, amount) walls on top
+    walls = dict(walls)
+    bids = [round(mid - (i + 1) * tick, 8) for i in range(levels)]
+    asks = [round(mid + i * tick, 8) for i in range(levels)]
+    return {'lastUpdateId': last_update_id,
+            'bids': [[f"{price:.8f}", f"{walls.get(price, amount):.8f}"] for price in bids],
+            'asks': [[f"{price:.8f}", f"{walls.get(price, amount):.8f}"] for price in asks]}
+
+
+def idle_monitor(symbol, scale, snapshot):
+    # A monitor whose book is loaded by hand and analyzed on demand
+    monitor = orderbook.MultiSymbolMonitor([symbol], feed=lambda symbols, stop_event: iter(()), max_workers=1)
+    symbol_monitor = monitor.monitors[symbol]
+    symbol_monitor.depth_stream.scale = scale
+    symbol_monitor.depth_stream.book.load_snapshot(snapshot, scale)
+    return monitor, symbol_monitor
+
+
+def analyze(symbol_monitor, time):
+    frame = symbol_monitor.frame()._replace(time=time)
+    result = symbol_monitor.executor.submit(orderbook.analyze_frame, frame).result()
+    symbol_monitor.publish(frame, result)
+    return result
+
+
+def test_every_watched_pair_has_settings():
+    for symbol in orderbook.WATCHED_SYMBOLS:
+        assert set(orderbook.default_settings[symbol]) == {"group_interval", "large_wall_threshold",
+                                                           "cancellation_threshold"}
+
+
+def test_sub_cent_pair_is_grouped_and_alerted_at_its_own_precision(sent_alerts):
+    monitor, symbol_monitor = idle_monitor(
+        'XRPUSDT', XRP_SCALE, book_snapshot(100, 0.5, 0.0001, 500, 1000, walls={0.4873: 3_000_000}))
+    try:
+        result = analyze(symbol_monitor, 1.0)
+    finally:
+        monitor.stop()
+
+    bids, asks = result['bids'], result['asks']
+    assert len(bids) > 20 and len(asks) > 20  # 0.001 buckets, not everything in the bucket at 0
+    assert [float(price) for price, _ in bids[:3]] == [0.5, 0.499, 0.498]
+    messages = [message for message, _ in sent_alerts]
+    assert messages == ["Large XRPUSDT bids wall detected: 3008000.00 coins at $0.4870"]
+
+
+def cancellations(sent_alerts):
+    return [message for message, _ in sent_alerts if 'spoofing' in message or 'pulled' in message]
+
+
+def test_shallower_resync_is_not_reported_as_cancellations(sent_alerts):
+    # Levels $1 apart, so 5000 a side span 50 of BTC's $100 buckets, 100 coins each
+    orderbook.alert_rules = AlertRuleFile(RULES_FILE)
+    deep = book_snapshot(100, 60000, 1.0, 5000, 1, walls={59850.0: 1000})
+    monitor, symbol_monitor = idle_monitor('BTCUSDT', BTC_SCALE, deep)
+    try:
+        analyze(symbol_monitor, 1.0)
+        assert not cancellations(sent_alerts)
+
+        # A resync with a 1000 level snapshot, covering 10 buckets a side, where the wall has gone
+        shallow = book_snapshot(200, 60000, 1.0, 1000, 1)
+        symbol_monitor.depth_stream.book.load_snapshot(shallow, BTC_SCALE)
+        analyze(symbol_monitor, 2.0)
+    finally:
+        monitor.stop()
+
+    assert cancellations(sent_alerts) == [
+        "🟩 Large BTCUSDT bid spoofing detected: 999.0000 coins at $59800.00",
+        "🟩 BTCUSDT bid level at $59800.00 pulled: 999.0000 of 1100.0000 coins (91%) [pulled-levels]"]
+
+
+def test_pruned_levels_are_not_reported_as_cancellations(sent_alerts):
+    orderbook.alert_rules = AlertRuleFile(RULES_FILE)
+    orderbook.MAX_BOOK_LEVELS = 1000
+    monitor, symbol_monitor = idle_monitor(
+        'BTCUSDT', BTC_SCALE, book_snapshot(100, 60000, 1.0, 1000, 1, walls={59050.0: 1000}))
+    book = symbol_monitor.depth_stream.book
+    try:
+        analyze(symbol_monitor, 1.0)
+
+        # Bids at 150 new prices near the top: the side goes over the limit and drops
+        # its bottom 150 levels, wall included
+        added = [[f"{59999.5 - i:.2f}", "1"] for i in range(150)]
+        book.apply_diff({'U': 101, 'u': 101, 'b': added, 'a': []})
+        assert len(book.bids) == 1000 and 59050 * 100 not in book.bids
+        analyze(symbol_monitor, 2.0)
+    finally:
+        monitor.stop()
+
+    assert not cancellations(sent_alerts)
+
+
+def test_cancellation_window_reuses_its_buffers():
+    detector = orderbook.CancellationDetector(window=2)
+    book = {'bids': np.array([[100, 10], [101, 10]]), 'asks': np.array([[102, 10], [103, 10]])}
+    for _ in range(3):
+        assert not len(detector.update(book, 5))
+    first = detector.history['bids'][-1].base
+
+    pulled = {'bids': np.array([[100, 10], [101, 2]]), 'asks': book['asks']}
+    events = detector.update(pulled, 5)
+    assert events['price'].tolist() == [101] and events['cancelled'].tolist() == [8]
+    assert detector.update(book, 5).size == 0 and detector.update(book, 5).size == 0
+    assert detector.history['bids'][-1].base is first  # three updates later, the same buffer
+
+
+def test_wall_back_after_its_ttl_stays_in_cooldown():
+    tracker = orderbook.WallTracker(ttl=600)
+    wall = np.array([[100, 500]])
+    empty = np.empty((0, 2))
+    assert len(tracker.update(wall, empty, 300, now=0.0, cooldown=3600)) == 1
+    tracker.update(empty, empty, 300, now=10.0, cooldown=3600)  # pulled
+    tracker.update(empty, empty, 300, now=611.0, cooldown=3600)  # evicted
+    assert not tracker.walls['bids'] and 100 in tracker.cooldowns['bids']
+
+    assert not tracker.update(wall, empty, 300, now=612.0, cooldown=3600)
+    assert not tracker.update(wall, empty, 300, now=1200.0, cooldown=3600)
+    assert len(tracker.update(wall, empty, 300, now=3600.0, cooldown=3600)) == 1
+
+
+def test_wall_cooldowns_survive_a_restart():
+    tracker = orderbook.WallTracker(ttl=600)
+    empty = np.empty((0, 2))
+    tracker.update(np.array([[100, 500]]), empty, 300, now=0.0, cooldown=3600)
+    tracker.update(empty, empty, 300, now=700.0, cooldown=3600)
+
+    restored = orderbook.WallTracker(ttl=600)
+    restored.restore_state(tracker.export_state())
+    assert not restored.update(np.array([[100, 500]]), empty, 300, now=1300.0, cooldown=3600)
+    assert not restored.active_walls('asks') and [wall.price for wall in restored.active_walls('bids')] == [100]
+
+
+def wall_events():
+    # A bid wall placed, grown and pulled, then an ask wall, one event per second
+    steps = [([["59850.00", "1000"]], []), ([["59850.00", "1500"]], []), ([["59850.00", "0"]], []),
+             ([], [["60200.00", "800"]])]
+    return [{'e': 'depthUpdate', 's': 'BTCUSDT', 'U': update_id, 'u': update_id, 'b': bids, 'a': asks}
+            for update_id, (bids, asks) in enumerate(steps, 101)]
+
+
+def replayed_alerts(sent_alerts, processes):
+    # Every event through the monitor's book and then its analysis executors, in order
+    sent_alerts.clear()
+    orderbook.analyzers.clear()
+    feed = ReplayDepthFeed(wall_events(), {'BTCUSDT': book_snapshot(100, 60000, 1.0, 1000, 1)},
+                           {'BTCUSDT': BTC_SCALE})
+    monitor = orderbook.MultiSymbolMonitor(['BTCUSDT'], feed=feed, snapshot_fn=feed.fetch_snapshot,
+                                           scale_fn=feed.fetch_scale, max_workers=1, processes=processes)
+    symbol_monitor = monitor.monitors['BTCUSDT']
+    book = symbol_monitor.depth_stream.book
+    try:
+        assert isinstance(symbol_monitor.executor, ProcessPoolExecutor) == bool(processes)
+        for second, message in enumerate(feed(['BTCUSDT'], threading.Event()), 1):
+            symbol_monitor.depth_stream.handle(message['data'])
+            deadline = time.monotonic() + 10
+            while book.last_update_id != message['data']['u'] and time.monotonic() < deadline:
+                time.sleep(0.01)  # the first event waits for the snapshot
+            analyze(symbol_monitor, float(second))
+        frame = symbol_monitor.frame()._replace(time=5.0)
+        state = symbol_monitor.executor.submit(orderbook.analyze_frame, frame, None, True).result()['state']
+    finally:
+        monitor.stop()
+    return list(sent_alerts), state
+
+
+def test_process_analysis_matches_the_thread_path(sent_alerts):
+    orderbook.alert_rules = AlertRuleFile(RULES_FILE)
+    threaded, threaded_state = replayed_alerts(sent_alerts, 0)
+    sharded, sharded_state = replayed_alerts(sent_alerts, 1)
+
+    assert any('wall detected' in message for message, _ in threaded)
+    assert any('spoofing' in message for message, _ in threaded)
+    assert sharded == threaded
+    # Analyzer state comes back from the worker process intact
+    assert sharded_state[0] == threaded_state[0]
+    assert sharded_state[1].keys() == threaded_state[1].keys()
+    assert all(np.array_equal(sharded_state[1][name], threaded_state[1][name], equal_nan=True)
+               for name in threaded_state[1])
+
+
+def test_current_state_uses_the_pairs_precision_and_asset(sent_alerts):
+    monitor, symbol_monitor = idle_monitor('XRPUSDT', XRP_SCALE, book_snapshot(100, 0.5, 0.0001, 500, 1000))
+    try:
+        analyze(symbol_monitor, 1.0)
+        orderbook.send_current_state(symbol_monitor.previous_order_book, 'XRPUSDT')
+    finally:
+        monitor.stop()
+
+    message, _ = sent_alerts[-1]
+    assert message.startswith("XRPUSDT Current Price: $0.5000\n\nTop 5 Bids:\n$0.5000: 5000.0000 XRP\n")
+    assert "Top 5 Asks:\n$0.5000: 6000.0000 XRP\n$0.5010: 9000.0000 XRP\n" in message and "BTC" not in message
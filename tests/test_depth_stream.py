@@ -0,0 +1,168 @@
+import json
+import threading
+import time
+
+import pytest
+
+import orderbook
+from depth_stream import BookGapError, DepthStream, LocalOrderBook, PriceScale, ReplayDepthFeed
+
+SCALE = PriceScale('0.01', '0.001')
+
+
+def snapshot(last_update_id, levels=50, top=1.0):
+    # Bids 100.00 down, asks 100.01 up, `top` coins at the best levels and 1 coin behind them
+    return {'lastUpdateId': last_update_id,
+            'bids': [[f"{100 - i * 0.01:.2f}", f"{top if i == 0 else 1:.3f}"] for i in range(levels)],
+            'asks': [[f"{100.01 + i * 0.01:.2f}", f"{top if i == 0 else 1:.3f}"] for i in range(levels)]}
+
+
+def event(first, final, bids=(), asks=(), symbol='BTCUSDT'):
+    return {'e': 'depthUpdate', 's': symbol, 'U': first, 'u': final,
+            'b': [[f"{price:.2f}", f"{amount:.3f}"] for price, amount in bids],
+            'a': [[f"{price:.2f}", f"{amount:.3f}"] for price, amount in asks]}
+
+
+def replay(feed, stream, symbols=('BTCUSDT',)):
+    for message in feed(list(symbols), threading.Event()):
+        stream.handle(message['data'])
+
+
+def amount(book, side, price):
+    return getattr(book, side).get(SCALE.price_ticks(price), 0) * SCALE.step_size
+
+
+class ManualExecutor:
+    # Holds submitted calls until run(), so events arrive while a snapshot is "in flight"
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, function, *args):
+        self.calls.append((function, args))
+
+    def run(self):
+        calls, self.calls = self.calls, []
+        for function, args in calls:
+            function(*args)
+
+
+def test_diffs_follow_the_snapshot_in_sequence():
+    feed = ReplayDepthFeed([
+        event(101, 103, bids=[(99.99, 5)]),  # straddles lastUpdateId + 1
+        json.dumps(event(104, 104, asks=[(100.01, 0)])),  # recorded messages are JSON text
+        {'stream': 'btcusdt@depth@100ms', 'data': event(105, 107, bids=[(100.00, 2.5)])},
+        event(108, 108, asks=[(100.01, 3)], symbol='ETHUSDT'),  # another pair's stream
+    ], {'BTCUSDT': snapshot(102)})
+    stream = DepthStream('BTCUSDT', snapshot_fn=feed.fetch_snapshot)
+    stream.scale = SCALE
+    replay(feed, stream)
+
+    book = stream.book
+    assert book.is_synced and book.last_update_id == 107
+    assert stream.resyncs == 1 and feed.requests == [('BTCUSDT', 5000)]
+    assert amount(book, 'bids', 99.99) == pytest.approx(5)
+    assert amount(book, 'bids', 100.00) == pytest.approx(2.5)
+    assert amount(book, 'asks', 100.01) == 0 and amount(book, 'asks', 100.02) == pytest.approx(1)
+
+
+def test_event_before_the_snapshot_is_ignored_and_one_after_a_gap_raises():
+    book = LocalOrderBook(scale=SCALE)
+    book.load_snapshot(snapshot(100))
+    assert book.apply_diff(event(90, 100, bids=[(100.00, 9)])) is False
+    assert amount(book, 'bids', 100.00) == pytest.approx(1)
+    with pytest.raises(BookGapError):
+        book.apply_diff(event(102, 103))  # the first event must cover update 101
+    assert book.apply_diff(event(101, 101))
+    with pytest.raises(BookGapError):
+        book.apply_diff(event(103, 103))  # later events must follow on exactly
+
+
+def test_gap_resyncs_from_a_new_snapshot():
+    fresh = snapshot(110)
+    fresh['bids'][0][1] = "7.000"
+    feed = ReplayDepthFeed([
+        event(101, 101),
+        event(102, 102, bids=[(99.98, 4)]),
+        event(105, 105, bids=[(99.97, 6)]),  # 103-104 lost: resync, covered by the new snapshot
+        event(111, 111, asks=[(100.02, 2)]),
+    ], {'BTCUSDT': [snapshot(100), fresh]})
+    stream = DepthStream('BTCUSDT', snapshot_fn=feed.fetch_snapshot)
+    stream.scale = SCALE
+    replay(feed, stream)
+
+    book = stream.book
+    assert stream.resyncs == 2 and book.is_synced and book.last_update_id == 111
+    assert amount(book, 'bids', 100.00) == pytest.approx(7)
+    assert amount(book, 'bids', 99.98) == pytest.approx(1)  # from the new snapshot, not the lost diffs
+    assert amount(book, 'asks', 100.02) == pytest.approx(2)
+
+
+def test_snapshot_older_than_the_buffered_events_is_fetched_again():
+    feed = ReplayDepthFeed([
+        event(100, 110, bids=[(99.99, 3)]),
+        event(111, 121, bids=[(99.98, 4)]),
+        event(122, 122, asks=[(100.01, 5)]),
+    ], {'BTCUSDT': [snapshot(90), snapshot(120)]})
+    stream = DepthStream('BTCUSDT', snapshot_fn=feed.fetch_snapshot)
+    stream.scale = SCALE
+    replay(feed, stream)
+
+    book = stream.book
+    assert len(feed.requests) == 2 and stream.resyncs == 2
+    assert book.is_synced and book.last_update_id == 122
+    assert amount(book, 'bids', 99.99) == pytest.approx(1)  # folded into the fresh snapshot
+    assert amount(book, 'bids', 99.98) == pytest.approx(4)
+    assert amount(book, 'asks', 100.01) == pytest.approx(5)
+
+
+def test_events_buffered_during_the_fetch_are_replayed_on_the_snapshot():
+    executor = ManualExecutor()
+    feed = ReplayDepthFeed([event(update_id, update_id, bids=[(90 + (update_id - 100) / 100, update_id)])
+                            for update_id in range(101, 111)], {'BTCUSDT': snapshot(105)})
+    stream = DepthStream('BTCUSDT', snapshot_fn=feed.fetch_snapshot, executor=executor)
+    stream.scale = SCALE
+    replay(feed, stream)
+    assert stream.book.last_update_id is None and len(stream.pending) == 10 and len(executor.calls) == 1
+
+    executor.run()
+    book = stream.book
+    assert book.is_synced and book.last_update_id == 110 and not stream.pending
+    # Events up to the snapshot's lastUpdateId are dropped, the rest applied
+    assert amount(book, 'bids', 90.05) == 0
+    assert [amount(book, 'bids', 90 + (update_id - 100) / 100) for update_id in range(106, 111)] == \
+        pytest.approx(list(range(106, 111)))
+
+
+def test_pending_buffer_keeps_the_newest_events():
+    executor = ManualExecutor()
+    feed = ReplayDepthFeed([event(update_id, update_id) for update_id in range(101, 111)],
+                           {'BTCUSDT': snapshot(107)})
+    stream = DepthStream('BTCUSDT', snapshot_fn=feed.fetch_snapshot, executor=executor, max_pending=3)
+    stream.scale = SCALE
+    replay(feed, stream)
+    assert [pending['U'] for pending in stream.pending] == [108, 109, 110]
+    executor.run()
+    assert stream.book.is_synced and stream.book.last_update_id == 110
+
+
+def test_monitor_keeps_every_pair_in_sync_from_one_combined_feed():
+    messages = []
+    for update_id in range(101, 121):
+        messages.append(event(update_id, update_id, bids=[(99.99, update_id)]))
+        messages.append(event(update_id + 1000, update_id + 1000, asks=[(100.02, update_id)], symbol='ETHUSDT'))
+    feed = ReplayDepthFeed(messages, {'BTCUSDT': snapshot(100), 'ETHUSDT': snapshot(1100)},
+                           {'BTCUSDT': SCALE, 'ETHUSDT': SCALE}, hold_open=True)
+    monitor = orderbook.MultiSymbolMonitor(['BTCUSDT', 'ETHUSDT'], feed=feed, snapshot_fn=feed.fetch_snapshot,
+                                           scale_fn=feed.fetch_scale, max_workers=1)
+    monitor.start()
+    try:
+        deadline = time.monotonic() + 10
+        books = [monitor.monitors[symbol].depth_stream.book for symbol in ('BTCUSDT', 'ETHUSDT')]
+        while time.monotonic() < deadline and [book.last_update_id for book in books] != [120, 1120]:
+            time.sleep(0.01)
+        assert [book.last_update_id for book in books] == [120, 1120]
+        assert amount(books[0], 'bids', 99.99) == pytest.approx(120)
+        assert amount(books[1], 'asks', 100.02) == pytest.approx(120)
+        assert sorted(symbol for symbol, _ in feed.requests) == ['BTCUSDT', 'ETHUSDT']
+    finally:
+        monitor.stop()
@@ -0,0 +1,177 @@
+import asyncio
+import socket
+import time
+
+import numpy as np
+import pytest
+
+import orderbook
+from depth_stream import PriceScale
+from fanout import (BOOK, SUBSCRIBE, WRITE_BUFFER, BookView, FanoutClient, FanoutServer, apply_levels, decode_book,
+                    diff_levels, encode_json, receive_message)
+from metrics import metrics
+
+SYMBOLS = ['BTCUSDT', 'ETHUSDT']
+SCALE = PriceScale('0.01', '0.00001')
+CLIENTS = 5
+STALLED_SYMBOL = 'XRPUSDT'
+
+
+def books(count, levels, seed=0):
+    # Successive books differing in a few dozen levels, with levels appearing and vanishing
+    rng = np.random.default_rng(seed)
+    bids = np.column_stack((np.arange(100_000 - levels, 100_000), rng.integers(1, 10_000, levels))).astype(np.int64)
+    asks = np.column_stack((np.arange(100_001, 100_001 + levels), rng.integers(1, 10_000, levels))).astype(np.int64)
+    result = [(bids, asks)]
+    for _ in range(count - 1):
+        bids, asks = (side.copy() for side in result[-1])
+        for side in (bids, asks):
+            changed = rng.integers(0, len(side), 50)
+            side[changed, 1] = rng.integers(0, 10_000, len(changed))
+        result.append(tuple(side[side[:, 1] > 0] for side in (bids, asks)))
+    return result
+
+
+def frame(symbol, bids, asks, now):
+    return orderbook.BookFrame(symbol, now, SCALE, bids, asks, orderbook.symbol_settings(symbol),
+                               {'mid': 1000.0}, (0, ()))
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def on_loop(server, function):
+    # Run `function` on the server's event loop thread and return its result
+    async def call():
+        return function()
+    return asyncio.run_coroutine_threadsafe(call(), server.loop).result(5)
+
+
+@pytest.fixture
+def fanout():
+    # A server on a monitor without a feed, with CLIENTS viewers connected
+    monitor = orderbook.MultiSymbolMonitor(SYMBOLS, feed=lambda symbols, stop_event: iter(()), max_workers=2)
+    server = FanoutServer(monitor, port=0, symbols=orderbook.default_settings)
+    server.start()
+    settings_seen, alerts_seen = [], []
+    clients = [FanoutClient(('127.0.0.1', server.port), SYMBOLS, apply_settings=settings_seen.append,
+                            on_alert=alerts_seen.append, history_shape=(60, 50, 1.0)) for _ in range(CLIENTS)]
+    for client in clients:
+        client.start()
+    assert wait_for(lambda: len(server.clients) == CLIENTS and len(settings_seen) == CLIENTS)
+    yield monitor, server, clients, settings_seen, alerts_seen
+    for client in clients:
+        client.stop()
+    server.stop()
+    monitor.stop()
+
+
+def test_deltas_rebuild_the_next_book():
+    sequence = books(20, 300)
+    for (old_bids, old_asks), (bids, asks) in zip(sequence, sequence[1:] + sequence[:1]):
+        assert np.array_equal(apply_levels(old_bids, diff_levels(old_bids, bids)), bids)
+        assert np.array_equal(apply_levels(old_asks, diff_levels(old_asks, asks)), asks)
+
+
+def test_analyzed_frame_is_shown_by_every_viewer(fanout):
+    monitor, server, clients, _, _ = fanout
+    symbol_monitor = monitor.monitors['BTCUSDT']
+    symbol_monitor.depth_stream.scale = SCALE
+    symbol_monitor.depth_stream.book.load_snapshot(
+        {'lastUpdateId': 1, 'bids': [[f"{600 - i * 0.5:.2f}", "1.00000"] for i in range(200)],
+         'asks': [[f"{600.5 + i * 0.5:.2f}", "1.00000"] for i in range(200)]}, SCALE)
+    symbol_monitor.submit()
+    symbol_monitor.future.result(timeout=10)
+    assert wait_for(lambda: all(client.views['BTCUSDT'].display() is not None for client in clients))
+    assert np.allclose(clients[0].views['BTCUSDT'].display()[0], symbol_monitor.display()[0])
+
+
+def test_viewers_end_on_the_newest_book_and_get_alerts(fanout):
+    _, server, clients, _, alerts_seen = fanout
+    sequence = books(50, 1000, seed=1)
+    for index, (bids, asks) in enumerate(sequence):
+        alerts = [("Large bid wall detected [check]", orderbook.PRIORITY_HIGH)] if index == len(sequence) - 1 else []
+        on_loop(server, lambda: server.push('ETHUSDT', frame('ETHUSDT', bids, asks, float(index)), 'analysis', alerts))
+        time.sleep(0.002)
+    bids, asks = sequence[-1]
+    channel = server.channels['ETHUSDT']
+    assert wait_for(lambda: all(client.views['ETHUSDT'].seq == channel.seq for client in clients))
+    for client in clients:
+        assert np.array_equal(client.views['ETHUSDT'].book[0], bids)
+        assert np.array_equal(client.views['ETHUSDT'].book[1], asks)
+    assert wait_for(lambda: len(alerts_seen) == CLIENTS)
+    assert len(channel.message(channel.seq - 1)) * 10 < len(channel.message(None))  # deltas are small
+
+
+def test_settings_from_one_viewer_reach_the_server_and_every_viewer(fanout):
+    _, _, clients, settings_seen, _ = fanout
+    settings_seen.clear()
+    clients[0].update_settings(dict(orderbook.current_settings(), notification_cooldown=77, current_symbol='ETHUSDT'))
+    assert wait_for(lambda: len(settings_seen) == CLIENTS)
+    assert orderbook.NOTIFICATION_COOLDOWN == 77
+    # The displayed pair stays each viewer's own
+    assert orderbook.current_symbol == 'BTCUSDT' and 'current_symbol' not in settings_seen[0]
+
+
+def test_stalled_viewer_is_skipped_with_bounded_buffering_and_catches_up(fanout):
+    # Every level changes each frame, so each is a full snapshot and the
+    # kernel's socket buffers fill quickly. A pair only it watches keeps the
+    # other viewers out of the way.
+    _, server, _, _, _ = fanout
+    stalled = socket.create_connection(('127.0.0.1', server.port))
+    stalled.sendall(encode_json(SUBSCRIBE, {'symbols': [STALLED_SYMBOL]}))
+    assert wait_for(lambda: len(server.clients) == CLIENTS + 1)
+    skipped = metrics.counters.get('fanout_frames_skipped', 0)
+    base_bids, base_asks = books(1, 5000, seed=1)[0]
+    rng = np.random.default_rng(2)
+    largest = snapshot_bytes = 0
+    for index in range(200):
+        bids, asks = (np.column_stack((side[:, 0], rng.integers(1, 10_000, len(side))))
+                      for side in (base_bids, base_asks))
+        on_loop(server, lambda: server.push(STALLED_SYMBOL, frame(STALLED_SYMBOL, bids, asks, float(index)),
+                                            'analysis', []))
+        snapshot_bytes = len(server.channels[STALLED_SYMBOL].message(None))
+        largest = max(largest, on_loop(server, lambda: max(client.writer.transport.get_write_buffer_size()
+                                                           for client in server.clients)))
+    assert largest <= WRITE_BUFFER + snapshot_bytes
+
+    # Reading again it converges on the newest book, the frames in between skipped
+    stream = stalled.makefile('rb')
+    view = BookView(STALLED_SYMBOL, (60, 50, 1.0))
+    stalled.settimeout(10)
+    try:
+        while view.seq != server.channels[STALLED_SYMBOL].seq:
+            kind, payload = receive_message(stream)
+            if kind == BOOK:
+                view.apply(*decode_book(payload))
+    finally:
+        stalled.close()
+    assert np.array_equal(view.book[0], bids)
+    assert metrics.counters.get('fanout_frames_skipped', 0) > skipped
+
+
+def test_only_known_pairs_can_be_subscribed(fanout):
+    monitor, server, _, _, _ = fanout
+    bogus = socket.create_connection(('127.0.0.1', server.port))
+    bogus.sendall(encode_json(SUBSCRIBE, {'symbols': ['BTCUSDT', 'NOTAPAIR']}))
+    bogus.settimeout(10)
+    stream = bogus.makefile('rb')
+    try:
+        receive_message(stream)  # HELLO
+        assert stream.read() == b''  # then dropped
+    finally:
+        bogus.close()
+    assert 'NOTAPAIR' not in monitor.monitors
+
+    viewer = socket.create_connection(('127.0.0.1', server.port))
+    try:
+        viewer.sendall(encode_json(SUBSCRIBE, {'symbols': [STALLED_SYMBOL.lower()]}))
+        assert wait_for(lambda: STALLED_SYMBOL in monitor.monitors)
+        assert wait_for(lambda: {STALLED_SYMBOL} in on_loop(server, lambda: [client.symbols
+                                                                            for client in server.clients]))
+    finally:
+        viewer.close()
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import orderbook
+from depth_stream import AggregatedView, LocalOrderBook, PriceScale
+from orderbook import group_orders, group_orders_array
+
+SCALE = PriceScale('0.01', '0.001')
+# 0.0001 apart around 0.5, as XRP trades
+SNAPSHOT = {'lastUpdateId': 1, 'bids': [[f"{0.5 - i * 0.0001:.4f}", "100"] for i in range(50)],
+            'asks': [[f"{0.5001 + i * 0.0001:.4f}", "100"] for i in range(50)]}
+
+
+@pytest.mark.parametrize('interval', [100, 0.5, 0.07])
+def test_every_grouping_puts_halves_in_the_even_bucket(interval):
+    step = SCALE.interval_ticks(interval)
+    # Halfway between buckets after even and odd ones, and a tick either side (7 ticks has no halves)
+    ticks = [bucket * step + offset for bucket in range(1000, 1004)
+             for offset in (step // 2 - 1, step // 2, step // 2 + 1)]
+    levels = {price: index + 1 for index, price in enumerate(ticks)}
+
+    view = AggregatedView(interval, levels, {}, SCALE).arrays()['bids']
+    decimal = [[price * SCALE.tick_size, amount * SCALE.step_size] for price, amount in levels.items()]
+    assert np.allclose(SCALE.to_decimal(view), group_orders(decimal, interval))
+    assert np.allclose(SCALE.to_decimal(view), group_orders_array(decimal, interval))
+
+
+def test_half_boundaries_round_to_even():
+    levels = {SCALE.price_ticks(price): 1000 for price in (100050, 100150, 100250)}
+    view = AggregatedView(100, levels, {}, SCALE).arrays()['bids']
+    assert (SCALE.to_decimal(view)[:, 0] == [100000, 100200]).all()
+    assert [price for price, _ in group_orders([[100050, 1], [100150, 1], [100250, 1]], 100)] == [100000, 100200]
+
+
+def test_every_pair_keeps_views_at_its_own_group_interval():
+    monitor = orderbook.MultiSymbolMonitor(['BTCUSDT', 'XRPUSDT'], feed=lambda symbols, stop_event: iter(()),
+                                           max_workers=1)
+    try:
+        xrp = monitor.monitors['XRPUSDT'].depth_stream
+        xrp.book.load_snapshot(SNAPSHOT, PriceScale('0.0001', '1'))
+        assert list(xrp.book.views) == [0.001, 0.002, 0.005, 0.01]
+        assert monitor.monitors['BTCUSDT'].depth_stream.book.intervals == (100, 200, 500, 1000)
+
+        # A new group interval is ready as soon as it is set
+        monitor.update_settings({'pairs': {'XRPUSDT': dict(orderbook.default_settings['XRPUSDT'],
+                                                           group_interval=0.0005)}})
+        assert {0.0005, 0.001, 0.0025, 0.005} <= set(xrp.book.views)
+        assert len(xrp.book.aggregated(0.0005)['bids']) == 11  # 0.4950 to 0.5000, halves to even
+    finally:
+        monitor.stop()
+
+
+def test_views_kept_ready_outlive_the_ttl():
+    book = LocalOrderBook(intervals=(0.01,), view_ttl=0, max_views=2, scale=SCALE)
+    book.load_snapshot(SNAPSHOT, SCALE)
+    for interval in (0.05, 0.1, 0.5):
+        book.aggregated(interval)
+    assert list(book.views) == [0.01, 0.5]
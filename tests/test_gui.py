@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('PyQt6')
+
+from PyQt6.QtWidgets import QApplication  # noqa: E402
+
+import orderbook  # noqa: E402
+import orderbook_gui  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QApplication.instance() or QApplication(['test'])
+
+
+def window(monkeypatch, server_address=None):
+    # The real window without its polling thread; its Telegram messages are collected
+    sent = []
+    monkeypatch.setattr(orderbook_gui, 'send_telegram_notification',
+                        lambda message, priority=None: sent.append(message))
+
+    class QuietGUI(orderbook_gui.OrderBookGUI):
+        def start_update_thread(self):
+            self.monitor = orderbook.MultiSymbolMonitor([orderbook.current_symbol],
+                                                        feed=lambda symbols, stop_event: iter(()))
+
+    gui = QuietGUI(server_address)
+    return gui, sent
+
+
+def test_start_stop_reports_to_telegram(app, monkeypatch, sent_alerts):
+    gui, sent = window(monkeypatch)
+    gui.toggle_updates()
+    gui.toggle_updates()
+    assert sent == ["Order book updates stopped.", "Order book updates resumed."]
+    assert [message for message, _ in sent_alerts] == ["No order book data available."]  # the current state
+    gui.monitor.stop()
+
+
+def test_viewer_start_stop_stays_local(app, monkeypatch, sent_alerts):
+    gui, sent = window(monkeypatch, server_address=('127.0.0.1', 9109))
+    gui.toggle_updates()
+    gui.toggle_updates()
+    assert not sent and not sent_alerts
+    log = gui.log_output.toPlainText()
+    assert "Order book updates stopped." in log and "Order book updates resumed." in log
+    gui.monitor.stop()
+
+
+def test_table_rows_are_reused_and_only_changes_are_emitted(app):
+    model = orderbook_gui.OrderBookTableModel()
+    changed = []
+    model.dataChanged.connect(lambda top, bottom: changed.append((top.row(), bottom.row())))
+    bids = np.array([[99.0, 1.0], [98.0, 2.0], [97.0, 4.0]])
+    asks = np.array([[100.0, 1.0], [101.0, 2.0], [102.0, 4.0]])
+    model.set_book(bids, asks)
+    first = model.prices.base
+
+    moved = bids.copy()
+    moved[1, 1] = 3.0
+    model.set_book(moved, asks)
+    model.set_book(moved, asks)
+    assert changed == [(5, 5)] and model.prices.base is first  # the third update reuses the first's rows
+    assert model.data(model.index(5, 1)) == "3.0000" and model.data(model.index(2, 0)) == "100.00"
+
+    model.set_book(moved[:2], asks)
+    assert model.rowCount() == 6 and list(model.prices) == [102.0, 101.0, 100.0, 0.0, 99.0, 98.0]
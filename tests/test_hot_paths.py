@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import regression  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def session(tmp_path_factory):
+    # Seeded synthetic books written through the recorder, as the regression suite uses
+    return regression.synthetic_session(1000, str(tmp_path_factory.mktemp('session')))
+
+
+@pytest.mark.parametrize('stage', list(regression.STAGES))
+def test_stage_result_is_correct(stage, session):
+    # The correctness half of benchmarks/regression.py; timing stays there
+    try:
+        setup, run, verify = regression.STAGES[stage](session)
+    except ImportError as e:
+        pytest.skip(str(e))
+    state = setup()
+    assert verify(state, run(state)) is None
@@ -0,0 +1,21 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import bench_import  # noqa: E402
+
+# Shared CI machines are slower and noisier than the one the budget was set on
+CI_SLACK = 3
+
+
+def test_headless_import_stays_within_budget():
+    # A fresh interpreter per run; the first warms the file cache and .pyc files
+    results = [bench_import.measure() for _ in range(3)][1:]
+    assert min(result['seconds'] for result in results) <= bench_import.IMPORT_BUDGET_SECONDS * CI_SLACK
+    assert max(result['rss_mb'] for result in results) <= bench_import.RSS_BUDGET_MB * CI_SLACK
+
+
+def test_headless_import_leaves_gui_modules_out():
+    # PyQt6, matplotlib, winsound and orderbook_gui
+    assert bench_import.measure()['gui_modules'] == []
@@ -0,0 +1,29 @@
+import logging
+import socket
+import urllib.request
+
+import orderbook
+from metrics import metrics
+
+
+def test_metrics_are_served_on_a_free_port():
+    metrics.inc('alerts_sent', 0)
+    server = orderbook.serve_metrics(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert response.status == 200
+            assert b'alerts_sent' in response.read()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_port_in_use_is_logged_and_skipped(caplog):
+    with socket.socket() as taken:
+        taken.bind(('127.0.0.1', 0))
+        taken.listen()
+        port = taken.getsockname()[1]
+        with caplog.at_level(logging.ERROR):
+            assert orderbook.serve_metrics(port) is None
+    assert f"Metrics server not started on port {port}" in caplog.text
@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import telebot
+
+from notifications import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, AlertDispatcher
+
+
+DESCRIPTIONS = {400: "Bad Request: chat not found", 401: "Unauthorized", 502: "Bad Gateway"}
+
+
+class FakeBot(ThreadingHTTPServer):
+    # Bot API stand-in: records (time, text) per sendMessage and answers the
+    # first `failures` of them with the error `status`, by default Telegram's 429
+    def __init__(self, failures=0, status=429, retry_after=1):
+        super().__init__(('127.0.0.1', 0), FakeBotHandler)
+        self.failures = failures
+        self.status = status
+        self.retry_after = retry_after
+        self.requests = []
+
+    @property
+    def api_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/bot{{0}}/{{1}}"
+
+
+class FakeBotHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        length = int(self.headers.get('Content-Length') or 0)
+        params.update(parse_qs(self.rfile.read(length).decode()))
+        self.server.requests.append((time.monotonic(), params['text'][0]))
+        if len(self.server.requests) <= self.server.failures and self.server.status == 429:
+            self.reply(429, {'ok': False, 'error_code': 429,
+                             'description': f"Too Many Requests: retry after {self.server.retry_after}",
+                             'parameters': {'retry_after': self.server.retry_after}})
+        elif len(self.server.requests) <= self.server.failures:
+            self.reply(self.server.status, {'ok': False, 'error_code': self.server.status,
+                                            'description': DESCRIPTIONS[self.server.status]})
+        else:
+            self.reply(200, {'ok': True, 'result': {'message_id': len(self.server.requests), 'date': 0,
+                                                    'chat': {'id': 42, 'type': 'private'},
+                                                    'text': params['text'][0]}})
+
+    do_GET = do_POST
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fake_bot(request, monkeypatch):
+    server = FakeBot(**getattr(request, 'param', {}))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(telebot.apihelper, 'API_URL', server.api_url)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def bot_dispatcher(**kwargs):
+    bot = telebot.TeleBot('123:TEST')
+    return AlertDispatcher(lambda text: bot.send_message(42, text), **kwargs)
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.mark.parametrize('fake_bot', [{'failures': 1, 'retry_after': 1}], indirect=True)
+def test_burst_is_coalesced_and_retried_after_the_servers_delay(fake_bot):
+    dispatcher = bot_dispatcher(coalesce_window=0.2, min_interval=0)
+    dispatcher.submit("status", PRIORITY_LOW)
+    dispatcher.submit("wall", PRIORITY_NORMAL)
+    dispatcher.submit("spoofing", PRIORITY_HIGH)
+    try:
+        assert wait_for(lambda: dispatcher.stats()['sent'] == 3)
+    finally:
+        dispatcher.stop()
+
+    # One message, highest priority first, sent again once retry_after passed
+    (rejected_at, rejected), (sent_at, sent) = fake_bot.requests
+    assert rejected == sent == "spoofing\nwall\nstatus"
+    assert sent_at - rejected_at >= 1
+    stats = dispatcher.stats()
+    assert {key: stats[key] for key in ('queue_depth', 'sent', 'batches', 'dropped', 'failed', 'rejected')} == \
+        {'queue_depth': 0, 'sent': 3, 'batches': 1, 'dropped': 0, 'failed': 0, 'rejected': 0}
+    assert stats['latency_max'] >= 1
+
+
+def test_full_queue_drops_the_oldest_lowest_priority_alert(fake_bot):
+    dispatcher = bot_dispatcher(max_queue=3, coalesce_window=30, min_interval=0)
+    for message, priority in (("low 1", PRIORITY_LOW), ("low 2", PRIORITY_LOW), ("wall 1", PRIORITY_NORMAL)):
+        assert dispatcher.submit(message, priority)
+    assert dispatcher.submit("spoofing", PRIORITY_HIGH)  # evicts "low 1"
+    assert dispatcher.submit("wall 2", PRIORITY_NORMAL)  # evicts "low 2"
+    assert not dispatcher.submit("low 3", PRIORITY_LOW)  # nothing queued ranks lower
+    assert dispatcher.stats()['dropped'] == 3 and dispatcher.queue_depth() == 3
+
+    dispatcher.stop()  # cuts the coalescing wait short and flushes the queue
+    assert [text for _, text in fake_bot.requests] == ["spoofing\nwall 1\nwall 2"]
+    stats = dispatcher.stats()
+    assert (stats['sent'], stats['batches'], stats['dropped'], stats['failed']) == (3, 1, 3, 0)
+
+
+def test_gives_up_after_the_last_retry(fake_bot):
+    fake_bot.failures = 10
+    fake_bot.retry_after = 0
+    dispatcher = bot_dispatcher(coalesce_window=0, min_interval=0, max_retries=2)
+    dispatcher.submit("wall", PRIORITY_NORMAL)
+    try:
+        assert wait_for(lambda: dispatcher.stats()['failed'] == 1)
+    finally:
+        dispatcher.stop()
+    assert len(fake_bot.requests) == 3
+    assert dispatcher.stats()['sent'] == 0
+
+
+@pytest.mark.parametrize('fake_bot', [{'failures': 1, 'status': 400}, {'failures': 1, 'status': 401}], indirect=True)
+def test_rejected_batch_is_dropped_without_retrying(fake_bot):
+    dispatcher = bot_dispatcher(coalesce_window=0, min_interval=0)
+    dispatcher.submit("wall 1", PRIORITY_NORMAL)
+    try:
+        assert wait_for(lambda: dispatcher.stats()['rejected'] == 1, timeout=1)
+        dispatcher.submit("wall 2", PRIORITY_NORMAL)  # the next batch still goes out
+        assert wait_for(lambda: dispatcher.stats()['sent'] == 1, timeout=1)
+    finally:
+        dispatcher.stop()
+    assert [text for _, text in fake_bot.requests] == ["wall 1", "wall 2"]
+    assert dispatcher.stats()['failed'] == 0
+
+
+@pytest.mark.parametrize('fake_bot', [{'failures': 2, 'status': 502}], indirect=True)
+def test_server_errors_are_retried(fake_bot):
+    dispatcher = bot_dispatcher(coalesce_window=0, min_interval=0.05)
+    dispatcher.submit("wall", PRIORITY_NORMAL)
+    try:
+        assert wait_for(lambda: dispatcher.stats()['sent'] == 1)
+    finally:
+        dispatcher.stop()
+    assert len(fake_bot.requests) == 3 and dispatcher.stats()['rejected'] == 0
@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import depth_stream
+import orderbook
+from depth_stream import (DepthStream, LocalOrderBook, PriceScale, RequestWeightBudget, covering_depth_limit,
+                          create_session, depth_request_weight, fetch_depth_snapshot)
+
+OTHER_CLIENT_WEIGHT = 1000
+
+
+class MockBinance(ThreadingHTTPServer):
+    # The depth endpoint: counts weight like Binance, and fails the next
+    # `fail` requests with a 500 and the next `ban` with a 429
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), MockBinanceHandler)
+        self.lock = threading.Lock()
+        self.used = 0
+        self.fail = 0
+        self.ban = 0
+        self.requests = []
+        self.ports = set()
+
+
+class MockBinanceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(time.monotonic())
+            server.ports.add(self.client_address[1])
+            limit = int(self.path.split('limit=')[1].split('&')[0]) if 'limit=' in self.path else 100
+            server.used += depth_request_weight(limit)
+            headers = {'X-MBX-USED-WEIGHT-1M': str(server.used + OTHER_CLIENT_WEIGHT)}
+            if server.ban:
+                server.ban -= 1
+                status, body = 429, {'code': -1003, 'msg': 'Too many requests'}
+                headers['Retry-After'] = '1'
+            elif server.fail:
+                server.fail -= 1
+                status, body = 500, {'code': -1000, 'msg': 'Internal error'}
+            else:
+                status = 200
+                body = {'lastUpdateId': 100,
+                        'bids': [[f"{100 - i * 0.01:.8f}", "1.00000000"] for i in range(limit)],
+                        'asks': [[f"{100.01 + i * 0.01:.8f}", "1.00000000"] for i in range(limit)]}
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def binance(monkeypatch):
+    server = MockBinance()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(depth_stream, 'DEPTH_URL', f"http://127.0.0.1:{server.server_address[1]}/api/v3/depth")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_snapshots_share_one_connection_and_follow_the_used_weight(binance):
+    session = create_session()
+    budget = RequestWeightBudget(6000)
+    for _ in range(10):
+        budget.acquire(depth_request_weight(100))
+        fetch_depth_snapshot('BTCUSDT', 100, session=session, budget=budget)
+    assert len(binance.ports) == 1
+    assert budget.used() >= binance.used + OTHER_CLIENT_WEIGHT
+
+
+def test_429_pauses_every_caller_for_retry_after(binance):
+    session = create_session()
+    budget = RequestWeightBudget(6000)
+    binance.ban = 1
+    with pytest.raises(Exception):
+        fetch_depth_snapshot('BTCUSDT', 100, session=session, budget=budget)
+    start = time.monotonic()
+    budget.acquire(depth_request_weight(100))
+    assert 0.8 <= time.monotonic() - start <= 1.5
+
+
+def test_failed_resyncs_are_retried_with_growing_delays(binance):
+    session = create_session()
+    binance.fail = 3
+    stream = DepthStream('BTCUSDT', snapshot_fn=lambda symbol, limit: fetch_depth_snapshot(
+        symbol, limit, session=session), snapshot_limit=100, retry_delay=0.2)
+    update_id = 101
+    deadline = time.monotonic() + 5
+    while not stream.book.is_synced and time.monotonic() < deadline:
+        stream.handle({'e': 'depthUpdate', 'U': update_id, 'u': update_id, 'b': [], 'a': []})
+        update_id += 1
+        time.sleep(0.01)
+    assert stream.book.is_synced and len(binance.requests) == 4
+    gaps = [later - earlier for earlier, later in zip(binance.requests, binance.requests[1:])]
+    assert gaps[0] >= 0.09 and gaps[0] < gaps[2]
+
+
+def depth_snapshot(levels):
+    return {'lastUpdateId': 1,
+            'bids': [[f"{100 - i * 0.01:.2f}", "1"] for i in range(levels)],
+            'asks': [[f"{100.01 + i * 0.01:.2f}", "1"] for i in range(levels)]}
+
+
+@pytest.mark.parametrize('price_range, limit', [(0.5, 100), (3, 500), (8, 1000), (30, 5000)])
+def test_resyncs_ask_for_the_cheapest_limit_covering_the_range(price_range, limit):
+    book = LocalOrderBook(scale=PriceScale('0.01', '0.00001'))
+    book.load_snapshot(depth_snapshot(5000))
+    assert covering_depth_limit(book, price_range) == limit
+
+
+def test_truncated_book_asks_for_more_depth():
+    book = LocalOrderBook(scale=PriceScale('0.01', '0.00001'))
+    book.load_snapshot(depth_snapshot(100))
+    assert covering_depth_limit(book, 3) == 500
+
+
+def test_ticks_speed_up_with_the_rate_of_level_updates():
+    stream = DepthStream('BTCUSDT')
+    monitor = orderbook.SymbolMonitor('BTCUSDT', stream)
+    monitor.last_changes = (time.monotonic() - 1, 0)
+    stream.book.changes = 10
+    assert monitor.adaptive_interval() == orderbook.REFRESH_INTERVAL
+    monitor.last_changes = (time.monotonic() - 1, 0)
+    stream.book.changes = orderbook.FAST_CHANGE_RATE * 10
+    assert monitor.adaptive_interval() == orderbook.MIN_REFRESH_INTERVAL
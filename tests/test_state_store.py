@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import orderbook
+from depth_stream import PriceScale, ReplayDepthFeed
+from state_store import StateStore
+
+SYMBOLS = ['BTCUSDT', 'ETHUSDT', 'XRPUSDT']
+LEVELS = 5000
+SCALE = PriceScale('0.01', '0.00001')
+
+
+def snapshot(seed=0):
+    # $1 levels, so the pair's group interval leaves a few dozen buckets, with two walls
+    rng = np.random.default_rng(seed)
+    bids = [[f"{60000 - i:.2f}", f"{amount:.5f}"] for i, amount in enumerate(rng.exponential(0.5, LEVELS))]
+    asks = [[f"{60001 + i:.2f}", f"{amount:.5f}"] for i, amount in enumerate(rng.exponential(0.5, LEVELS))]
+    bids[20][1] = asks[30][1] = "900.00000"
+    return {'lastUpdateId': 1000, 'bids': bids, 'asks': asks}
+
+
+def no_feed(symbols, stop_event):
+    return iter(())
+
+
+def new_monitor(store):
+    return orderbook.MultiSymbolMonitor(SYMBOLS, feed=no_feed, max_workers=2, state_store=store)
+
+
+def load_books(monitor):
+    for symbol in SYMBOLS:
+        depth_stream = monitor.monitors[symbol].depth_stream
+        depth_stream.scale = SCALE
+        depth_stream.book.load_snapshot(snapshot(), SCALE)
+
+
+def analyze(monitor, symbol, export=False):
+    # One frame through the analysis stage, waiting for its result
+    symbol_monitor = monitor.monitors[symbol]
+    symbol_monitor.export_requested = export
+    published = []
+    publish = symbol_monitor.publish
+    symbol_monitor.publish = lambda frame, result: (published.append(result), publish(frame, result))
+    symbol_monitor.submit()
+    symbol_monitor.future.result(timeout=10)
+    deadline = time.monotonic() + 5
+    while not published and time.monotonic() < deadline:
+        time.sleep(0.01)
+    symbol_monitor.publish = publish
+    return published[0]
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def messages(result, kind):
+    return [message for message, _ in result['alerts'] if kind in message]
+
+
+@pytest.fixture
+def saved_state(tmp_path):
+    # A first run that changed settings, alerted both walls and saved on stop
+    path = str(tmp_path / 'state.npz')
+    monitor = new_monitor(StateStore(path))
+    load_books(monitor)
+    orderbook.default_settings['BTCUSDT'] = dict(orderbook.default_settings['BTCUSDT'], large_wall_threshold=400)
+    orderbook.NOTIFICATION_COOLDOWN = 1234
+    assert len(messages(analyze(monitor, 'BTCUSDT', export=True), 'wall')) == 2
+    monitor.stop()
+    return path
+
+
+def test_state_is_saved_on_stop_without_temporary_files(saved_state):
+    directory = os.path.dirname(saved_state)
+    assert os.path.exists(saved_state)
+    assert not [name for name in os.listdir(directory) if name.endswith('.tmp')]
+
+
+def test_restart_restores_settings_books_cooldowns_and_the_cancellation_baseline(saved_state):
+    orderbook.default_settings['BTCUSDT']['large_wall_threshold'] = 150
+    orderbook.NOTIFICATION_COOLDOWN = 3600
+    store = StateStore(saved_state)
+    orderbook.restore_settings(store.load()[0]['settings'])
+    assert orderbook.default_settings['BTCUSDT']['large_wall_threshold'] == 400
+    assert orderbook.NOTIFICATION_COOLDOWN == 1234
+
+    monitor = new_monitor(store)
+    try:
+        depth_stream = monitor.monitors['BTCUSDT'].depth_stream
+        # No exchangeInfo call needed
+        assert depth_stream.scale is not None and depth_stream.scale.tick_size == SCALE.tick_size
+        assert len(depth_stream.book.bids) == LEVELS
+        assert not messages(analyze(monitor, 'BTCUSDT'), 'wall')
+
+        pulled = snapshot()
+        pulled['bids'][20][1] = "0.00100"
+        depth_stream.book.load_snapshot(pulled, SCALE)
+        assert len(messages(analyze(monitor, 'BTCUSDT'), 'spoofing')) == 1
+    finally:
+        monitor.stop()
+
+
+def test_old_snapshot_restores_cooldowns_but_not_books(saved_state):
+    store = StateStore(saved_state)
+    meta, _ = store.load()
+    meta['saved_at'] -= orderbook.STATE_MAX_AGE + 1
+    monitor = new_monitor(store)
+    try:
+        restore = monitor.monitors['BTCUSDT'].restore
+        assert not monitor.monitors['BTCUSDT'].depth_stream.book.bids
+        assert restore is not None and 'walls/bids' in restore[1]
+        assert not any(name.startswith('cancel/') for name in restore[1])
+    finally:
+        monitor.stop()
+
+
+def test_failed_write_keeps_the_previous_snapshot(saved_state, monkeypatch):
+    before = os.path.getsize(saved_state)
+
+    def crash(src, dst):
+        raise OSError("simulated crash")
+    monkeypatch.setattr(os, 'replace', crash)
+    with pytest.raises(OSError):
+        StateStore(saved_state).save({'settings': {}}, {'big': np.zeros(1_000_000)})
+    monkeypatch.undo()
+
+    assert os.path.getsize(saved_state) == before and StateStore(saved_state).load() is not None
+    assert not [name for name in os.listdir(os.path.dirname(saved_state)) if name.endswith('.tmp')]
+
+
+def test_corrupt_snapshot_is_ignored(saved_state):
+    with open(saved_state, 'r+b') as f:
+        f.write(b'garbage')
+    assert StateStore(saved_state).load() is None
+
+
+def test_restored_books_are_shown_from_start_until_the_first_resync(saved_state):
+    # The feed connects at once but its first event waits for `release`
+    release = threading.Event()
+    replay = ReplayDepthFeed([{'e': 'depthUpdate', 's': 'BTCUSDT', 'U': 1001, 'u': 1001,
+                               'b': [["59990.00", "5.00000"]], 'a': []}],
+                             {'BTCUSDT': snapshot()}, hold_open=True)
+
+    def feed(symbols, stop_event):
+        release.wait(10)
+        yield from replay(symbols, stop_event)
+
+    store = StateStore(saved_state)
+    store.load()
+    monitor = orderbook.MultiSymbolMonitor(SYMBOLS, feed=feed, snapshot_fn=replay.fetch_snapshot,
+                                           scale_fn=replay.fetch_scale, max_workers=2, state_store=store)
+    depth_stream = monitor.monitors['BTCUSDT'].depth_stream
+    monitor.start()
+    try:
+        time.sleep(0.5)
+        assert all(monitor.monitors[symbol].display() is not None for symbol in SYMBOLS)
+        assert depth_stream.warm and depth_stream.resyncs == 0
+
+        release.set()
+        assert wait_for(lambda: depth_stream.book.last_update_id == 1001)
+        assert depth_stream.resyncs == 1 and not depth_stream.warm
+        assert replay.requests and replay.requests[0][0] == 'BTCUSDT'
+        assert monitor.monitors['BTCUSDT'].display() is not None
+    finally:
+        monitor.stop()